@@ -5,7 +5,12 @@
 import asyncio
 import os
 import sys
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from time import monotonic, perf_counter, time
+
+STARTUP_START = perf_counter()
 
 # Check Python version (minimum 3.10)
 print("Python version:", sys.version)
@@ -19,29 +24,36 @@ try:
     from discord.ext import commands
     from dotenv import load_dotenv
 
-    # Custom API libraries
-    from bbaeAPI import *
-    from chaseAPI import *
-    from dspacAPI import *
-    from fennelAPI import *
-    from fidelityAPI import *
-    from firstradeAPI import *
+    # Custom API libraries, brokers are loaded on first use
     from helperAPI import (
+        BROKERS,
+        HOLDINGS_EXPORT,
+        OTP_BATCH,
+        PROGRESS_MESSAGE,
+        BrokerCancelled,
+        BrokerTimeout,
+        Deadline,
+        JobManager,
+        OutputEvent,
+        ProcessHandler,
+        ProgressMessage,
+        SessionPool,
         ThreadHandler,
         check_package_versions,
+        close_discord_queue,
+        close_discord_session,
+        emit_event,
+        export_holdings,
+        finish_schedule,
+        flush_events,
+        get_broker,
         printAndDiscord,
+        printHoldings,
+        run_broker_process,
         stockOrder,
         updater,
+        wait_for_schedule,
     )
-    from publicAPI import *
-    from robinhoodAPI import *
-    from schwabAPI import *
-    from tastyAPI import *
-    from tornadoAPI import *
-    from tradierAPI import *
-    from vanguardAPI import *
-    from webullAPI import *
-    from wellsfargoAPI import *
 except Exception as e:
     print(f"Error importing libraries: {e}")
     print(traceback.format_exc())
@@ -50,26 +62,11 @@ except Exception as e:
 
 # Initialize .env file
 load_dotenv()
+print(f"Libraries loaded in {perf_counter() - STARTUP_START:.2f}s")
 
 
 # Global variables
-SUPPORTED_BROKERS = [
-    "bbae",
-    "chase",
-    "dspac",
-    "fennel",
-    "fidelity",
-    "firstrade",
-    "public",
-    "robinhood",
-    "schwab",
-    "tastytrade",
-    "tornado",
-    "tradier",
-    "vanguard",
-    "webull",
-    "wellsfargo",
-]
+SUPPORTED_BROKERS = list(BROKERS)
 DAY1_BROKERS = [
     "bbae",
     "chase",
@@ -85,6 +82,36 @@ DAY1_BROKERS = [
 DISCORD_BOT = False
 DOCKER_MODE = False
 DANGER_MODE = False
+# Number of browser brokers to run in their own processes at the same time
+# (0 runs them in this process)
+BROWSER_PROCESSES = max(int(os.getenv("BROWSER_PROCESSES", "0")), 0)
+BROWSER_PROCESS_SEMAPHORE = threading.BoundedSemaphore(max(BROWSER_PROCESSES, 1))
+# Number of brokers to log in to at the same time
+BROKER_WORKERS = max(int(os.getenv("BROKER_WORKERS", "1")), 1)
+# Number of logged in brokers to run commands on at the same time
+EXECUTION_WORKERS = max(int(os.getenv("EXECUTION_WORKERS") or BROKER_WORKERS), 1)
+# Max jobs per broker at the same time (BROKER:LIMIT,BROKER:LIMIT)
+BROKER_LIMITS = {
+    broker.split(":")[0].strip().lower(): max(int(broker.split(":")[1]), 1)
+    for broker in os.getenv("BROKER_LIMITS", "").split(",")
+    if ":" in broker
+}
+BROKER_SEMAPHORES = {}
+BROKER_SEMAPHORES_LOCK = threading.Lock()
+# Seconds each broker (BROKER_TIMEOUT) and each command (COMMAND_TIMEOUT) can run
+# 0 is no limit, override a single broker with ex: SCHWAB_TIMEOUT=120
+BROKER_TIMEOUT = max(float(os.getenv("BROKER_TIMEOUT") or 0), 0)
+COMMAND_TIMEOUT = max(float(os.getenv("COMMAND_TIMEOUT") or 0), 0)
+# Seconds to wait for a timed out broker to stop after closing its browsers
+TIMEOUT_GRACE = 10
+# Seconds before a scheduled order to start logging in (0 logs in right away)
+SCHEDULE_LOGIN_LEAD = max(float(os.getenv("SCHEDULE_LOGIN_LEAD", "0")), 0)
+# Seconds to keep broker sessions alive between Discord commands
+SESSION_TTL = max(float(os.getenv("SESSION_TTL", "0")), 0)
+SESSION_POOL = None
+# Discord bot only: Number of commands that can run at the same time
+BOT_WORKERS = max(int(os.getenv("BOT_WORKERS", "4")), 1)
+JOB_MANAGER = None
 
 
 # Account nicknames
@@ -110,95 +137,444 @@ def nicknames(broker):
     return broker
 
 
+# Get the concurrency limit for a broker
+def broker_semaphore(broker):
+    with BROKER_SEMAPHORES_LOCK:
+        if broker not in BROKER_SEMAPHORES:
+            BROKER_SEMAPHORES[broker] = threading.BoundedSemaphore(
+                BROKER_LIMITS.get(broker, 1)
+            )
+        return BROKER_SEMAPHORES[broker]
+
+
+# Let the next command use a broker once it's no longer running in the background
+def release_broker(broker, deadline=None):
+    semaphore = broker_semaphore(broker)
+    thread = None if deadline is None else deadline.abandoned
+    if thread is None or not thread.is_alive():
+        semaphore.release()
+        return
+
+    def release_when_done():
+        thread.join()
+        print(f"{deadline.name}: Background thread finished")
+        semaphore.release()
+
+    threading.Thread(target=release_when_done, daemon=True).start()
+
+
+# Wait for a broker to be free, returns False if the command is cancelled first
+def acquire_broker(orderObj: stockOrder, broker, loop=None):
+    semaphore = broker_semaphore(broker)
+    if semaphore.acquire(blocking=False):
+        return True
+    printAndDiscord(f"{broker}: Waiting for another command to finish", loop)
+    while not orderObj.is_cancelled():
+        if semaphore.acquire(timeout=1):
+            return True
+    return False
+
+
+# Run all commands of a browser broker in its own process
+def broker_process(orderObj: stockOrder, broker, command, botObj=None, loop=None):
+    with BROWSER_PROCESS_SEMAPHORE:
+        ph = ProcessHandler(
+            run_broker_process, get_broker(broker), orderObj, command, DOCKER_MODE
+        )
+        ph.start()
+        ph.join(botObj, loop)
+        result, err = ph.get_result()
+    if err is not None:
+        raise Exception(f"Error in {broker} process: {err}")
+    # Sessions stay in the process, so only the account data comes back
+    brokerObj, schedule_timing = result
+    orderObj.set_logged_in(brokerObj, broker)
+    for name, (started, finished) in schedule_timing.items():
+        orderObj.set_schedule_timing(name, started, finished)
+
+
+# Update the broker's row in the command's progress message, if there is one
+def set_status(orderObj: stockOrder, broker, status=None, note=None, total=None):
+    progress = orderObj.get_progress()
+    if progress is not None:
+        progress.update(broker.capitalize(), status, note, total)
+
+
+# Log in to a single broker
+# Returns whether the broker is ready for the second command
+def broker_login(orderObj: stockOrder, broker, command, botObj=None, loop=None):
+    fun_name = f"{broker} login"
+    set_status(orderObj, broker, "logging in")
+    try:
+        adapter = get_broker(broker)
+        if BROWSER_PROCESSES > 0 and adapter.browser:
+            fun_name = f"{broker} process"
+            broker_process(orderObj, broker, command, botObj, loop)
+            set_status(orderObj, broker, "done")
+            return False
+        if adapter.run_all:
+            fun_name = f"{broker} run"
+            # PLAYWRIGHT_BROKERS have to run all transactions with one function
+            th = ThreadHandler(
+                adapter.run,
+                orderObj=orderObj,
+                command=command,
+                botObj=botObj,
+                loop=loop,
+            )
+            th.start()
+            th.join()
+            _, err = th.get_result()
+            if isinstance(err, BrokerCancelled):
+                raise err
+            if err is not None:
+                raise Exception(
+                    f"Error in {fun_name}: Function did not complete successfully."
+                )
+            set_status(orderObj, broker, "done")
+            return False
+        # Initialize broker, reusing kept sessions if possible
+        brokerObj = SESSION_POOL.get(broker) if SESSION_POOL is not None else None
+        if brokerObj is None:
+            brokerObj = adapter.login(botObj, loop, DOCKER_MODE)
+            if SESSION_POOL is not None and adapter.poolable():
+                SESSION_POOL.put(broker, brokerObj)
+        orderObj.set_logged_in(brokerObj, broker)
+        print()
+        # Verify broker is logged in
+        # (order_validate() re-sorts the shared lists, so it
+        # can't be called while other brokers are running)
+        if orderObj.get_logged_in(broker) is None:
+            print(f"Error: {broker} not logged in, skipping...")
+            set_status(orderObj, broker, "failed")
+            return False
+        return True
+    except Exception as ex:
+        print(traceback.format_exc())
+        print(f"Error in {fun_name} with {broker}: {ex}")
+        print(orderObj)
+        print()
+        set_status(orderObj, broker, "failed", str(ex))
+        emit_event(OutputEvent("error", str(ex), broker, stage="login"), loop)
+        return False
+
+
+# Get holdings or complete transaction on a logged in broker
+def broker_execute(orderObj: stockOrder, broker, command, loop=None):
+    adapter = get_broker(broker)
+    _, second_command = command
+    try:
+        logged_in_broker = orderObj.get_logged_in(broker)
+        # Brokers checkpoint once per account for every order
+        accounts = sum(
+            len(numbers) for numbers in logged_in_broker.get_account_numbers().values()
+        )
+        if second_command == "_holdings":
+            set_status(orderObj, broker, "getting holdings", total=accounts)
+            adapter.holdings(logged_in_broker, loop)
+        elif second_command == "_transaction" and wait_for_schedule(
+            orderObj, broker.capitalize(), loop
+        ):
+            orders = accounts * len(orderObj.get_stocks())
+            set_status(orderObj, broker, "placing orders", total=orders)
+            adapter.place_orders(logged_in_broker, orderObj, loop)
+            finish_schedule(orderObj, broker.capitalize())
+            printAndDiscord(
+                f"All {broker.capitalize()} transactions complete",
+                loop,
+            )
+        set_status(orderObj, broker, "cancelled" if orderObj.is_cancelled() else "done")
+    except Exception as ex:
+        print(traceback.format_exc())
+        print(f"Error in {broker}{second_command} with {broker}: {ex}")
+        print(orderObj)
+        set_status(orderObj, broker, "failed", str(ex))
+        emit_event(
+            OutputEvent("error", str(ex), broker, stage=second_command[1:]), loop
+        )
+    if SESSION_POOL is not None:
+        SESSION_POOL.release(broker)
+    print()
+
+
+# Time budget for a broker, ex: SCHWAB_TIMEOUT=120 or BROKER_TIMEOUT=300
+def broker_deadline(orderObj: stockOrder, broker, command_deadline=None):
+    seconds = float(os.getenv(f"{broker.upper()}_TIMEOUT") or BROKER_TIMEOUT)
+    return Deadline(broker.capitalize(), seconds, command_deadline, orderObj)
+
+
+# Run func for a broker in its own thread, giving up on it once its deadline passes
+# Returns the result and whether the broker ran out of time
+def run_with_deadline(deadline: Deadline, func, *args):
+    th = ThreadHandler(func, *args)
+    th.deadline = deadline
+    # Brokers stuck past their deadline shouldn't keep the program open
+    th.thread.daemon = True
+    th.start()
+    while th.thread.is_alive() and not deadline.is_expired():
+        th.thread.join(1)
+    if th.thread.is_alive():
+        # Closing the broker's browsers makes any blocked calls fail
+        deadline.expire()
+        th.thread.join(TIMEOUT_GRACE)
+    if th.thread.is_alive():
+        print(f"{deadline.name}: Still running, leaving it in the background")
+        deadline.abandoned = th.thread
+        return None, True
+    result, err = th.get_result()
+    if err is not None and not isinstance(err, BrokerCancelled):
+        raise err
+    return result, isinstance(err, BrokerTimeout) or deadline.expired.is_set()
+
+
+# Report a broker that ran out of time and what it finished before then
+def broker_timed_out(orderObj: stockOrder, broker, stage, deadline, loop=None):
+    elapsed = deadline.elapsed()
+    orderObj.set_timeout(broker, stage, elapsed, deadline.seconds)
+    set_status(orderObj, broker, "timed out")
+    emit_event(
+        OutputEvent(
+            "error",
+            "timed out",
+            broker,
+            stage=stage,
+            elapsed=elapsed,
+            limit=deadline.seconds,
+        ),
+        loop,
+    )
+    printAndDiscord(
+        f"{broker.capitalize()}: Timed out during {stage} after {elapsed:.1f}s, "
+        "moving on to the next broker",
+        loop,
+    )
+    if SESSION_POOL is not None:
+        # Sessions might be in a bad state
+        SESSION_POOL.evict(broker)
+    brokerObj = orderObj.get_logged_in().get(broker)
+    if stage == "holdings" and brokerObj and brokerObj.get_holdings():
+        printAndDiscord(f"{broker.capitalize()}: Partial holdings", loop)
+        printHoldings(brokerObj, loop)
+
+
+# Runs the specified function for a single broker
+def run_broker(
+    orderObj: stockOrder,
+    broker,
+    command,
+    botObj=None,
+    loop=None,
+    command_deadline=None,
+):
+    if command_deadline is not None and command_deadline.is_expired():
+        orderObj.set_timeout(broker, "waiting", 0, command_deadline.seconds)
+        set_status(orderObj, broker, "timed out")
+        return
+    if not acquire_broker(orderObj, broker, loop):
+        return
+    deadline = None
+    try:
+        deadline = broker_deadline(orderObj, broker, command_deadline)
+        ready, timed_out = run_with_deadline(
+            deadline, broker_login, orderObj, broker, command, botObj, loop
+        )
+        if timed_out:
+            broker_timed_out(orderObj, broker, "login", deadline, loop)
+        elif ready and not orderObj.is_cancelled():
+            _, timed_out = run_with_deadline(
+                deadline, broker_execute, orderObj, broker, command, loop
+            )
+            if timed_out:
+                broker_timed_out(orderObj, broker, command[1][1:], deadline, loop)
+        elif ready and SESSION_POOL is not None:
+            SESSION_POOL.release(broker)
+    finally:
+        release_broker(broker, deadline)
+
+
+# Log in to brokers while the brokers that are ready run their second command
+def pipeline_run(
+    orderObj: stockOrder,
+    brokers,
+    command,
+    botObj=None,
+    loop=None,
+    command_deadline=None,
+):
+    # Fast API brokers log in first so they aren't stuck behind browsers
+    brokers = sorted(brokers, key=lambda broker: not get_broker(broker).fast_login)
+    deadlines = {}
+
+    def login_job(broker):
+        # Broker stays locked from login until its second command is done
+        if command_deadline is not None and command_deadline.is_expired():
+            orderObj.set_timeout(broker, "waiting", 0, command_deadline.seconds)
+            set_status(orderObj, broker, "timed out")
+            return False
+        if orderObj.is_cancelled() or not acquire_broker(orderObj, broker, loop):
+            return False
+        deadlines[broker] = broker_deadline(orderObj, broker, command_deadline)
+        try:
+            ready, timed_out = run_with_deadline(
+                deadlines[broker], broker_login, orderObj, broker, command, botObj, loop
+            )
+        except BaseException:
+            release_broker(broker, deadlines[broker])
+            raise
+        if timed_out:
+            broker_timed_out(orderObj, broker, "login", deadlines[broker], loop)
+            ready = False
+        if not ready:
+            release_broker(broker, deadlines[broker])
+        return ready
+
+    def execute_job(broker):
+        try:
+            if not orderObj.is_cancelled():
+                _, timed_out = run_with_deadline(
+                    deadlines[broker], broker_execute, orderObj, broker, command, loop
+                )
+                if timed_out:
+                    broker_timed_out(
+                        orderObj, broker, command[1][1:], deadlines[broker], loop
+                    )
+            elif SESSION_POOL is not None:
+                SESSION_POOL.release(broker)
+        finally:
+            release_broker(broker, deadlines[broker])
+
+    login_workers = BROKER_WORKERS
+    execute_workers = EXECUTION_WORKERS
+    if orderObj.get_schedule() is not None:
+        # Every broker waits for the scheduled time in its own worker,
+        # including the ones that log in and place orders in one function
+        login_workers += sum(
+            get_broker(broker).run_all
+            or (BROWSER_PROCESSES > 0 and get_broker(broker).browser)
+            for broker in brokers
+        )
+        execute_workers = max(execute_workers, len(brokers))
+    if OTP_BATCH:
+        # Every broker has to get to its OTP prompt before the codes are asked for
+        login_workers = max(login_workers, len(brokers))
+    print(
+        f"Running {len(brokers)} brokers with {login_workers} login workers "
+        f"and {execute_workers} execution workers"
+    )
+    with ThreadPoolExecutor(
+        max_workers=login_workers, thread_name_prefix="login"
+    ) as login_pool, ThreadPoolExecutor(
+        max_workers=execute_workers, thread_name_prefix="execute"
+    ) as execute_pool:
+        logins = {login_pool.submit(login_job, broker): broker for broker in brokers}
+        executions = []
+        for future in as_completed(logins):
+            if future.result():
+                executions.append(execute_pool.submit(execute_job, logins[future]))
+        wait(executions)
+
+
+# Wait until it's time to log in for a scheduled order
+def wait_for_login(orderObj: stockOrder, loop=None):
+    schedule = orderObj.get_schedule()
+    login_time = schedule.timestamp() - SCHEDULE_LOGIN_LEAD
+    if SCHEDULE_LOGIN_LEAD > 0 and login_time > time():
+        printAndDiscord(
+            f"Orders scheduled for {schedule:%H:%M:%S}, logging in "
+            f"{SCHEDULE_LOGIN_LEAD:.0f}s before",
+            loop,
+        )
+        orderObj.wait_cancelled(login_time - time())
+    else:
+        printAndDiscord(
+            f"Orders scheduled for {schedule:%H:%M:%S}, logging in now", loop
+        )
+
+
+# Print how close to the scheduled time each broker placed its orders
+def print_schedule_timing(orderObj: stockOrder, loop=None):
+    schedule_timing = orderObj.get_schedule_timing()
+    if len(schedule_timing) == 0:
+        return
+    message = f"Scheduled order timing ({orderObj.get_schedule():%H:%M:%S}):"
+    for name, (started, finished) in sorted(schedule_timing.items()):
+        message += f"\n{name}: started +{started:.3f}s"
+        if finished is not None:
+            message += f", finished +{finished:.3f}s"
+    printAndDiscord(message, loop)
+
+
+# Print the brokers that ran out of time so their timeouts can be tuned
+def print_timeouts(orderObj: stockOrder, loop=None):
+    timeouts = orderObj.get_timeouts()
+    if len(timeouts) == 0:
+        return
+    message = "Timed out brokers:"
+    for broker, (stage, elapsed, limit) in sorted(timeouts.items()):
+        if stage == "waiting":
+            message += f"\n{broker.capitalize()}: not started, command out of time"
+        else:
+            message += (
+                f"\n{broker.capitalize()}: {stage} after {elapsed:.1f}s "
+                f"(limit {limit:.0f}s)"
+            )
+    printAndDiscord(message, loop)
+
+
 # Runs the specified function for each broker in the list
 # broker name + type of function
 def fun_run(orderObj: stockOrder, command, botObj=None, loop=None):
     if command in [("_init", "_holdings"), ("_init", "_transaction")]:
+        brokers = []
         for broker in orderObj.get_brokers():
             if broker in orderObj.get_notbrokers():
                 continue
             broker = nicknames(broker)
-            first_command, second_command = command
-            try:
-                # Initialize broker
-                fun_name = broker + first_command
-                if broker.lower() == "wellsfargo":
-                    # Fidelity requires docker mode argument
-                    orderObj.set_logged_in(
-                        globals()[fun_name](
-                            DOCKER=DOCKER_MODE, botObj=botObj, loop=loop
-                        ),
-                        broker,
-                    )
-                elif broker.lower() == "tornado":
-                    # Requires docker mode argument and loop
-                    orderObj.set_logged_in(
-                        globals()[fun_name](DOCKER=DOCKER_MODE, loop=loop),
-                        broker,
-                    )
-
-                elif broker.lower() in [
-                    "bbae",
-                    "dspac",
-                    "fennel",
-                    "firstrade",
-                    "public",
-                ]:
-                    # Requires bot object and loop
-                    orderObj.set_logged_in(
-                        globals()[fun_name](botObj=botObj, loop=loop), broker
-                    )
-                elif broker.lower() in ["chase", "fidelity", "vanguard"]:
-                    fun_name = broker + "_run"
-                    # PLAYWRIGHT_BROKERS have to run all transactions with one function
-                    th = ThreadHandler(
-                        globals()[fun_name],
-                        orderObj=orderObj,
-                        command=command,
-                        botObj=botObj,
-                        loop=loop,
-                    )
-                    th.start()
-                    th.join()
-                    _, err = th.get_result()
-                    if err is not None:
-                        raise Exception(
-                            "Error in "
-                            + fun_name
-                            + ": Function did not complete successfully."
-                        )
-                else:
-                    orderObj.set_logged_in(globals()[fun_name](), broker)
-
-                print()
-                if broker.lower() not in ["chase", "fidelity", "vanguard"]:
-                    # Verify broker is logged in
-                    orderObj.order_validate(preLogin=False)
-                    logged_in_broker = orderObj.get_logged_in(broker)
-                    if logged_in_broker is None:
-                        print(f"Error: {broker} not logged in, skipping...")
-                        continue
-                    # Get holdings or complete transaction
-                    if second_command == "_holdings":
-                        fun_name = broker + second_command
-                        globals()[fun_name](logged_in_broker, loop)
-                    elif second_command == "_transaction":
-                        fun_name = broker + second_command
-                        globals()[fun_name](
-                            logged_in_broker,
-                            orderObj,
-                            loop,
-                        )
-                        printAndDiscord(
-                            f"All {broker.capitalize()} transactions complete",
-                            loop,
-                        )
-            except Exception as ex:
-                print(traceback.format_exc())
-                print(f"Error in {fun_name} with {broker}: {ex}")
-                print(orderObj)
-            print()
-        printAndDiscord("All commands complete in all brokers", loop)
+            if broker not in BROKERS:
+                printAndDiscord(f"Error: Unknown broker {broker}, skipping...", loop)
+                continue
+            brokers.append(broker)
+        command_deadline = Deadline("Command", COMMAND_TIMEOUT, orderObj=orderObj)
+        if loop is not None and PROGRESS_MESSAGE:
+            title = "Holdings" if command[1] == "_holdings" else "Orders"
+            progress = ProgressMessage(title, brokers, loop)
+            orderObj.set_progress(progress)
+            progress.schedule_edit()
+        schedule = orderObj.get_schedule()
+        if schedule is not None:
+            # Command budget starts at the scheduled time
+            command_deadline.restart(
+                monotonic() + max(schedule.timestamp() - time(), 0)
+            )
+            wait_for_login(orderObj, loop)
+        if (
+            schedule is not None
+            or OTP_BATCH
+            or (BROKER_WORKERS > 1 and len(brokers) > 1)
+        ):
+            pipeline_run(orderObj, brokers, command, botObj, loop, command_deadline)
+        else:
+            for broker in brokers:
+                if orderObj.is_cancelled():
+                    break
+                run_broker(orderObj, broker, command, botObj, loop, command_deadline)
+        if orderObj.get_progress() is not None:
+            orderObj.get_progress().finish(orderObj.is_cancelled())
+        if loop is not None and HOLDINGS_EXPORT and command[1] == "_holdings":
+            brokerObjs = [
+                orderObj.get_logged_in()[broker]
+                for broker in brokers
+                if orderObj.get_logged_in().get(broker)
+            ]
+            if brokerObjs:
+                export_holdings(brokerObjs, loop)
+        if schedule is not None:
+            print_schedule_timing(orderObj, loop)
+        print_timeouts(orderObj, loop)
+        if orderObj.is_cancelled():
+            printAndDiscord("Command cancelled, remaining brokers skipped", loop)
+        else:
+            printAndDiscord("All commands complete in all brokers", loop)
     else:
         print(f"Error: {command} is not a valid command")
 
@@ -208,6 +584,10 @@ def argParser(args: list) -> stockOrder:
     args = [x.lower() for x in args]
     # Initialize order object
     orderObj = stockOrder()
+    # If first argument is schedule, next argument is the time to place orders
+    if args[0] == "schedule":
+        orderObj.set_schedule(args[1])
+        args = args[2:]
     # If first argument is holdings, set holdings to true
     if args[0] == "holdings":
         orderObj.set_holdings(True)
@@ -297,6 +677,8 @@ if __name__ == "__main__":
             print(f"Broker: {cliOrderObj.get_brokers()}")
             print(f"Not Broker: {cliOrderObj.get_notbrokers()}")
             print(f"DRY: {cliOrderObj.get_dry()}")
+            if cliOrderObj.get_schedule() is not None:
+                print(f"Schedule: {cliOrderObj.get_schedule():%H:%M:%S}")
             print()
             print("If correct, press enter to continue...")
             try:
@@ -314,6 +696,7 @@ if __name__ == "__main__":
             fun_run(cliOrderObj, ("_init", "_holdings"))
         else:
             fun_run(cliOrderObj, ("_init", "_transaction"))
+        flush_events()
         sys.exit(0)
 
     # If discord bot, run discord bot
@@ -331,6 +714,9 @@ if __name__ == "__main__":
         # Discord bot command prefix
         bot = commands.Bot(command_prefix="!", intents=intents)
         bot.remove_command("help")
+        if SESSION_TTL > 0:
+            SESSION_POOL = SessionPool(SESSION_TTL)
+        JOB_MANAGER = JobManager(BOT_WORKERS)
         print()
         print("Discord bot is started...")
         print()
@@ -368,6 +754,9 @@ if __name__ == "__main__":
                 "!help\n"
                 "!rsa holdings [all|<broker1>,<broker2>,...] [not broker1,broker2,...]\n"
                 "!rsa [buy|sell] [amount] [stock1|stock1,stock2] [all|<broker1>,<broker2>,...] [not broker1,broker2,...] [DRY: true|false]\n"
+                "!schedule [HH:MM|HH:MM:SS] [buy|sell] [amount] [stock1|stock1,stock2] [all|<broker1>,<broker2>,...] [not broker1,broker2,...] [DRY: true|false]\n"
+                "!jobs\n"
+                "!cancel [job id]\n"
                 "!restart"
             )
 
@@ -381,37 +770,65 @@ if __name__ == "__main__":
                 discOrdObj.order_validate(preLogin=True)
                 # Get holdings or complete transaction
                 if discOrdObj.get_holdings():
-                    # Run Holdings
-                    await bot.loop.run_in_executor(
-                        None,
-                        fun_run,
-                        discOrdObj,
-                        ("_init", "_holdings"),
-                        bot,
-                        event_loop,
-                    )
+                    command = ("_init", "_holdings")
                 else:
-                    # Run Transaction
-                    await bot.loop.run_in_executor(
-                        None,
-                        fun_run,
-                        discOrdObj,
-                        ("_init", "_transaction"),
-                        bot,
-                        event_loop,
+                    command = ("_init", "_transaction")
+                running = len(JOB_MANAGER.get_jobs())
+                job = JOB_MANAGER.submit(
+                    " ".join(args),
+                    discOrdObj,
+                    fun_run,
+                    discOrdObj,
+                    command,
+                    bot,
+                    event_loop,
+                )
+                if running > 0:
+                    await ctx.send(
+                        f"Started job {job.id} with {running} other jobs running"
                     )
+                await asyncio.wrap_future(job.future)
             except Exception as err:
                 print(traceback.format_exc())
                 print(f"Error placing order: {err}")
                 if ctx:
                     await ctx.send(f"Error placing order: {err}")
 
+        # List running commands
+        @bot.command(name="jobs")
+        async def jobs(ctx):
+            running = JOB_MANAGER.get_jobs()
+            if len(running) == 0:
+                await ctx.send("No jobs running")
+                return
+            await ctx.send("Jobs:\n" + "\n".join(str(job) for job in running))
+
+        # Cancel a running command before its next broker or order
+        @bot.command(name="cancel")
+        async def cancel(ctx, job_id: int):
+            job = JOB_MANAGER.cancel(job_id)
+            if job is None:
+                await ctx.send(f"Job {job_id} not found, see !jobs")
+                return
+            await ctx.send(f"Job {job_id} {job.status}")
+
+        # Schedule command, same as !rsa schedule
+        @bot.command(name="schedule")
+        async def schedule(ctx, *args):
+            await rsa(ctx, "schedule", *args)
+
         # Restart command
         @bot.command(name="restart")
         async def restart(ctx):
             print("Restarting...")
             print()
             await ctx.send("Restarting...")
+            JOB_MANAGER.shutdown()
+            await bot.loop.run_in_executor(None, flush_events)
+            await close_discord_queue()
+            await close_discord_session()
+            if SESSION_POOL is not None:
+                await bot.loop.run_in_executor(None, SESSION_POOL.close_all)
             await bot.close()
             if DOCKER_MODE:
                 os._exit(0)  # Special exit code to restart docker container
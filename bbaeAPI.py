@@ -8,9 +8,12 @@ from dotenv import load_dotenv
 
 from helperAPI import (
     Brokerage,
-    getOTPCodeDiscord,
-    getUserInputDiscord,
+    checkpoint,
+    emit_order,
+    emit_order_error,
+    getOTPCode,
     maskString,
+    parallel_login,
     printAndDiscord,
     printHoldings,
     send_captcha_to_discord,
@@ -22,16 +25,18 @@ def bbae_init(BBAE_EXTERNAL=None, botObj=None, loop=None):
     load_dotenv()
     bbae_obj = Brokerage("BBAE")
     if not os.getenv("BBAE") and BBAE_EXTERNAL is None:
-        print("BBAE not found, skipping...")
+        printAndDiscord("BBAE not found, skipping...")
         return None
     BBAE = (
         os.environ["BBAE"].strip().split(",")
         if BBAE_EXTERNAL is None
         else BBAE_EXTERNAL.strip().split(",")
     )
-    print("Logging in to BBAE...")
-    for index, account in enumerate(BBAE):
+    printAndDiscord("Logging in to BBAE...")
+
+    def login_account(index, account):
         name = f"BBAE {index + 1}"
+        login_obj = Brokerage("BBAE")
         try:
             user, password = account.split(":")[:2]
             use_email = "@" in user
@@ -47,18 +52,22 @@ def bbae_init(BBAE_EXTERNAL=None, botObj=None, loop=None):
             account_number = str(account_info["Data"]["accountNumber"])
             # Set account values
             masked_account_number = maskString(account_number)
-            bbae_obj.set_account_number(name, masked_account_number)
-            bbae_obj.set_account_totals(
+            login_obj.set_account_number(name, masked_account_number)
+            login_obj.set_account_totals(
                 name,
                 masked_account_number,
                 float(account_assets["Data"]["totalAssets"]),
             )
-            bbae_obj.set_logged_in_object(name, bb, "bb")
+            login_obj.set_logged_in_object(name, bb, "bb")
         except Exception as e:
-            print(f"Error logging into BBAE: {e}")
-            print(traceback.format_exc())
-            continue
-    print("Logged into BBAE!")
+            printAndDiscord(f"Error logging into BBAE: {e}")
+            printAndDiscord(traceback.format_exc())
+            return None
+        return login_obj
+
+    for login_obj in parallel_login(login_account, BBAE, "BBAE"):
+        bbae_obj.merge(login_obj)
+    printAndDiscord("Logged into BBAE!")
     return bbae_obj
 
 
@@ -81,13 +90,9 @@ def login(bb: BBAEAPI, botObj, name, loop, use_email):
             if not sms_and_captcha_response:
                 raise Exception("Error solving SMS or Captcha")
             # Get the OTP code from the user
-            if botObj is not None and loop is not None:
-                otp_code = asyncio.run_coroutine_threadsafe(
-                    getOTPCodeDiscord(botObj, name, timeout=300, loop=loop),
-                    loop,
-                ).result()
-            else:
-                otp_code = input("Enter security code: ")
+            otp_code = getOTPCode(
+                botObj, name, timeout=300, loop=loop, prompt="Enter security code: "
+            )
             if otp_code is None:
                 raise Exception("No SMS code received")
             # Login with the OTP code
@@ -104,7 +109,7 @@ def login(bb: BBAEAPI, botObj, name, loop, use_email):
         ):
             ticket = ticket_response["Data"]["ticket"]
         else:
-            print(f"{name}: Raw response object: {ticket_response}")
+            printAndDiscord(f"{name}: Raw response object: {ticket_response}")
             raise Exception(
                 f"Login failed. No ticket generated. Response: {ticket_response}"
             )
@@ -114,8 +119,8 @@ def login(bb: BBAEAPI, botObj, name, loop, use_email):
             raise Exception(f"Login failed. Response: {login_response}")
         return True
     except Exception as e:
-        print(f"Error in SMS login: {e}")
-        print(traceback.format_exc())
+        printAndDiscord(f"Error in SMS login: {e}")
+        printAndDiscord(traceback.format_exc())
         return False
 
 
@@ -123,19 +128,19 @@ def handle_captcha_and_sms(bb: BBAEAPI, botObj, data, loop, name, use_email):
     try:
         # If CAPTCHA is needed it will generate an SMS code as well
         if data.get("needCaptchaCode", False):
-            print(f"{name}: CAPTCHA required. Requesting CAPTCHA image...")
+            printAndDiscord(f"{name}: CAPTCHA required. Requesting CAPTCHA image...")
             sms_response = solve_captcha(bb, botObj, name, loop, use_email)
             if not sms_response:
                 raise Exception("Failure solving CAPTCHA!")
         else:
-            print(f"{name}: Requesting code...")
+            printAndDiscord(f"{name}: Requesting code...")
             sms_response = send_sms_code(bb, name, use_email)
             if not sms_response:
                 raise Exception("Unable to retrieve sms code!")
         return True
     except Exception as e:
-        print(f"Error in CAPTCHA or SMS: {e}")
-        print(traceback.format_exc())
+        printAndDiscord(f"Error in CAPTCHA or SMS: {e}")
+        printAndDiscord(traceback.format_exc())
         return False
 
 
@@ -145,7 +150,7 @@ def solve_captcha(bb: BBAEAPI, botObj, name, loop, use_email):
         if not captcha_image:
             raise Exception("Unable to request CAPTCHA image, aborting...")
         # Send the CAPTCHA image to Discord for manual input
-        print("Sending CAPTCHA to Discord for user input...")
+        printAndDiscord("Sending CAPTCHA to Discord for user input...")
         file = BytesIO()
         captcha_image.save(file, format="PNG")
         file.seek(0)
@@ -155,17 +160,19 @@ def solve_captcha(bb: BBAEAPI, botObj, name, loop, use_email):
                 send_captcha_to_discord(file),
                 loop,
             ).result()
-            captcha_input = asyncio.run_coroutine_threadsafe(
-                getUserInputDiscord(
-                    botObj, f"{name} requires CAPTCHA input", timeout=300, loop=loop
-                ),
-                loop,
-            ).result()
         else:
-            captcha_image.save("./captcha.png", format="PNG")
-            captcha_input = input(
-                "CAPTCHA image saved to ./captcha.png. Please open it and type in the code: "
-            )
+            # Each login saves its own image, since they can run at the same time
+            captcha_path = f"./captcha_{name.replace(' ', '_').lower()}.png"
+            captcha_image.save(captcha_path, format="PNG")
+            printAndDiscord(f"{name}: CAPTCHA image saved to {captcha_path}")
+        captcha_input = getOTPCode(
+            botObj,
+            f"{name} CAPTCHA",
+            code_len=None,
+            timeout=300,
+            loop=loop,
+            prompt="Please open it and type in the code: ",
+        )
         if captcha_input is None:
             raise Exception("No CAPTCHA code found")
         # Send the CAPTCHA to the appropriate API based on login type
@@ -177,8 +184,8 @@ def solve_captcha(bb: BBAEAPI, botObj, name, loop, use_email):
             raise Exception("Incorrect CAPTCHA code!")
         return sms_request_response
     except Exception as e:
-        print(f"{name}: Error solving CAPTCHA code: {e}")
-        print(traceback.format_exc())
+        printAndDiscord(f"{name}: Error solving CAPTCHA code: {e}")
+        printAndDiscord(traceback.format_exc())
         return None
 
 
@@ -188,14 +195,31 @@ def send_sms_code(bb: BBAEAPI, name, use_email, captcha_input=None):
     else:
         sms_code_response = bb.request_sms_code(captcha_input=captcha_input)
     if sms_code_response.get("Message") == "Incorrect verification code.":
-        print(f"{name}: Incorrect CAPTCHA code, retrying...")
+        printAndDiscord(f"{name}: Incorrect CAPTCHA code, retrying...")
         return False
     return sms_code_response
 
 
+def bbae_check(bbo: Brokerage, key: str) -> bool:
+    # Check if a kept session still works
+    obj: BBAEAPI = bbo.get_logged_in_objects(key, "bb")
+    return obj.get_account_info().get("Data") is not None
+
+
+def bbae_refresh(bbo: Brokerage, key: str):
+    # Update account totals of a kept session
+    obj: BBAEAPI = bbo.get_logged_in_objects(key, "bb")
+    account_assets = obj.get_account_assets()
+    for account in bbo.get_account_numbers(key):
+        bbo.set_account_totals(
+            key, account, float(account_assets["Data"]["totalAssets"])
+        )
+
+
 def bbae_holdings(bbo: Brokerage, loop=None):
     for key in bbo.get_account_numbers():
         for account in bbo.get_account_numbers(key):
+            checkpoint()
             obj: BBAEAPI = bbo.get_logged_in_objects(key, "bb")
             try:
                 positions = obj.get_account_holdings()
@@ -209,17 +233,17 @@ def bbae_holdings(bbo: Brokerage, loop=None):
                         bbo.set_holdings(key, account, sym, qty, cp)
             except Exception as e:
                 printAndDiscord(f"Error getting BBAE holdings: {e}")
-                print(traceback.format_exc())
+                printAndDiscord(traceback.format_exc())
                 continue
     printHoldings(bbo, loop, False)
 
 
 def bbae_transaction(bbo: Brokerage, orderObj: stockOrder, loop=None):
-    print()
-    print("==============================")
-    print("BBAE")
-    print("==============================")
-    print()
+    printAndDiscord("")
+    printAndDiscord("==============================")
+    printAndDiscord("BBAE")
+    printAndDiscord("==============================")
+    printAndDiscord("")
     for s in orderObj.get_stocks():
         for key in bbo.get_account_numbers():
             action = orderObj.get_action().lower()
@@ -228,6 +252,7 @@ def bbae_transaction(bbo: Brokerage, orderObj: stockOrder, loop=None):
                 loop,
             )
             for account in bbo.get_account_numbers(key):
+                checkpoint()
                 obj: BBAEAPI = bbo.get_logged_in_objects(key, "bb")
                 try:
                     quantity = orderObj.get_amount()
@@ -242,6 +267,15 @@ def bbae_transaction(bbo: Brokerage, orderObj: stockOrder, loop=None):
                             account_number=account,
                         )
                         if validation_response["Outcome"] != "Success":
+                            emit_order_error(
+                                bbo,
+                                key,
+                                account,
+                                orderObj,
+                                s,
+                                validation_response["Message"],
+                                loop,
+                            )
                             printAndDiscord(
                                 f"{key} {account}: Validation failed for buying {quantity} of {s}: {validation_response['Message']}",
                                 loop,
@@ -265,6 +299,15 @@ def bbae_transaction(bbo: Brokerage, orderObj: stockOrder, loop=None):
                             symbol=s, account_number=account
                         )
                         if holdings_response["Outcome"] != "Success":
+                            emit_order_error(
+                                bbo,
+                                key,
+                                account,
+                                orderObj,
+                                s,
+                                holdings_response["Message"],
+                                loop,
+                            )
                             printAndDiscord(
                                 f"{key} {account}: Error checking holdings: {holdings_response['Message']}",
                                 loop,
@@ -275,6 +318,15 @@ def bbae_transaction(bbo: Brokerage, orderObj: stockOrder, loop=None):
                         )
                         # If trying to sell more than available, skip to the next
                         if quantity > available_amount:
+                            emit_order_error(
+                                bbo,
+                                key,
+                                account,
+                                orderObj,
+                                s,
+                                "Not enough shares",
+                                loop,
+                            )
                             printAndDiscord(
                                 f"{key} {account}: Not enough shares to sell {quantity} of {s}. Available: {available_amount}",
                                 loop,
@@ -285,6 +337,15 @@ def bbae_transaction(bbo: Brokerage, orderObj: stockOrder, loop=None):
                             symbol=s, amount=quantity, account_number=account
                         )
                         if validation_response["Outcome"] != "Success":
+                            emit_order_error(
+                                bbo,
+                                key,
+                                account,
+                                orderObj,
+                                s,
+                                validation_response["Message"],
+                                loop,
+                            )
                             printAndDiscord(
                                 f"{key} {account}: Validation failed for selling {quantity} of {s}: {validation_response['Message']}",
                                 loop,
@@ -303,11 +364,13 @@ def bbae_transaction(bbo: Brokerage, orderObj: stockOrder, loop=None):
                             message = sell_response["Message"]
                         else:
                             message = "Dry Run Success"
+                    emit_order(bbo, key, account, orderObj, s, message, loop)
                     printAndDiscord(
                         f"{key}: {orderObj.get_action().capitalize()} {quantity} of {s} in {account}: {message}",
                         loop,
                     )
                 except Exception as e:
+                    emit_order_error(bbo, key, account, orderObj, s, e, loop)
                     printAndDiscord(f"{key} {account}: Error placing order: {e}", loop)
-                    print(traceback.format_exc())
+                    printAndDiscord(traceback.format_exc())
                     continue
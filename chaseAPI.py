@@ -1,7 +1,6 @@
 # Donald Ryan Gullett(MaxxRK)
 # Chase API
 
-import asyncio
 import os
 import pprint
 import traceback
@@ -12,10 +11,18 @@ from dotenv import load_dotenv
 
 from helperAPI import (
     Brokerage,
-    getOTPCodeDiscord,
+    cached_quote,
+    checkpoint,
+    emit_order,
+    emit_order_error,
+    finish_schedule,
+    getOTPCode,
+    parallel_login,
     printAndDiscord,
     printHoldings,
+    register_cleanup,
     stockOrder,
+    wait_for_schedule,
 )
 
 
@@ -26,7 +33,7 @@ def chase_run(
     load_dotenv()
     # Import Chase account
     if not os.getenv("CHASE") and CHASE_EXTERNAL is None:
-        print("Chase not found, skipping...")
+        printAndDiscord("Chase not found, skipping...")
         return None
     accounts = (
         os.environ["CHASE"].strip().split(",")
@@ -39,9 +46,9 @@ def chase_run(
     _, second_command = command
 
     # For each set of login info, i.e. seperate chase accounts
-    for account in accounts:
+    def run_account(index, account):
         # Start at index 1 and go to how many logins we have
-        index = accounts.index(account) + 1
+        index = index + 1
         # Receive the chase broker class object and the AllAccount object related to it
         chase_details = chase_init(
             account=account,
@@ -50,15 +57,20 @@ def chase_run(
             botObj=botObj,
             loop=loop,
         )
-        if chase_details is not None:
-            orderObj.set_logged_in(chase_details[0], "chase")
-            if second_command == "_holdings":
-                chase_holdings(chase_details[0], chase_details[1], loop=loop)
-            # Only other option is _transaction
-            else:
-                chase_transaction(
-                    chase_details[0], chase_details[1], orderObj, loop=loop
-                )
+        if chase_details is None:
+            return None
+        if second_command == "_holdings":
+            chase_holdings(chase_details[0], chase_details[1], loop=loop)
+        # Only other option is _transaction
+        elif wait_for_schedule(orderObj, f"Chase {index}", loop):
+            chase_transaction(chase_details[0], chase_details[1], orderObj, loop=loop)
+            finish_schedule(orderObj, f"Chase {index}")
+        return chase_details[0]
+
+    chase_obj = Brokerage("Chase")
+    for login_obj in parallel_login(run_account, accounts, "Chase"):
+        chase_obj.merge(login_obj)
+    orderObj.set_logged_in(chase_obj, "chase")
     return None
 
 
@@ -86,7 +98,7 @@ def chase_init(account: str, index: int, headless=True, botObj=None, loop=None):
         AllAccounts object which holds account information.
     """
     # Log in to Chase account
-    print("Logging in to Chase...")
+    printAndDiscord("Logging in to Chase...")
     # Create brokerage class object and call it chase
     chase_obj = Brokerage("Chase")
     name = f"Chase {index}"
@@ -102,24 +114,20 @@ def chase_init(account: str, index: int, headless=True, botObj=None, loop=None):
             profile_path="./creds",
             debug=debug,
         )
+        register_cleanup(ch_session.close_browser, same_thread=True)
         # Login to chase
         need_second = ch_session.login(account[0], account[1], account[2])
         # If 2FA is present, ask for code
         if need_second:
-            if botObj is None and loop is None:
-                ch_session.login_two(input("Enter code: "))
-            else:
-                sms_code = asyncio.run_coroutine_threadsafe(
-                    getOTPCodeDiscord(botObj, name, code_len=8, loop=loop), loop
-                ).result()
-                if sms_code is None:
-                    raise Exception(f"Chase {index} code not received in time...", loop)
-                ch_session.login_two(sms_code)
+            sms_code = getOTPCode(botObj, name, code_len=8, loop=loop)
+            if sms_code is None:
+                raise Exception(f"Chase {index} code not received in time...", loop)
+            ch_session.login_two(sms_code)
         # Create an AllAccounts class object using the current browser session. Holds information about all accounts
         all_accounts = ch_account.AllAccount(ch_session)
         # Get the account IDs and store in a list. The IDs are different than account numbers.
         account_ids = list(all_accounts.account_connectors.keys())
-        print("Logged in to Chase!")
+        printAndDiscord("Logged in to Chase!")
         # In the Chase Brokerage object, set the index of "Chase 1" to be its own empty array and append the chase session to the end of this array
         chase_obj.set_logged_in_object(name, ch_session)
         # Create empty array to store account number masks (last 4 digits of each account number)
@@ -131,11 +139,11 @@ def chase_init(account: str, index: int, headless=True, botObj=None, loop=None):
             chase_obj.set_account_number(name, account.mask)
             chase_obj.set_account_totals(name, account.mask, account.account_value)
             print_accounts.append(account.mask)
-        print(f"The following Chase accounts were found: {print_accounts}")
+        printAndDiscord(f"The following Chase accounts were found: {print_accounts}")
     except Exception as e:
         ch_session.close_browser()
-        print(f"Error logging in to Chase: {e}")
-        print(traceback.format_exc())
+        printAndDiscord(f"Error logging in to Chase: {e}")
+        printAndDiscord(traceback.format_exc())
         return None
     return [chase_obj, all_accounts]
 
@@ -154,6 +162,7 @@ def chase_holdings(chase_o: Brokerage, all_accounts: ch_account.AllAccount, loop
         try:
             # Retrieve account masks and iterate through them
             for _, account in enumerate(chase_o.get_account_numbers(key)):
+                checkpoint()
                 # Retrieve the chase session
                 ch_session: session.ChaseSession = chase_o.get_logged_in_objects(key)
                 # Get the account ID accociated with mask
@@ -193,7 +202,7 @@ def chase_holdings(chase_o: Brokerage, all_accounts: ch_account.AllAccount, loop
         except Exception as e:
             ch_session.close_browser()
             printAndDiscord(f"{key} {account}: Error getting holdings: {e}", loop)
-            print(traceback.format_exc())
+            printAndDiscord(traceback.format_exc())
             continue
         printHoldings(chase_o, loop)
     ch_session.close_browser()
@@ -216,11 +225,11 @@ def chase_transaction(
     Returns:
         None
     """
-    print()
-    print("==============================")
-    print("Chase")
-    print("==============================")
-    print()
+    printAndDiscord("")
+    printAndDiscord("==============================")
+    printAndDiscord("Chase")
+    printAndDiscord("==============================")
+    printAndDiscord("")
 
     # Buy on each account
     for ticker in orderObj.get_stocks():
@@ -241,20 +250,24 @@ def chase_transaction(
                 account_ids = list(all_accounts.account_connectors.keys())
 
                 # Get the ask price and determine whether to use MARKET or LIMIT order
-                symbol_quote = symbols.SymbolQuote(
-                    account_id=account_ids[0], session=ch_session, symbol=ticker
+                ask_price = cached_quote(
+                    ticker,
+                    "ask",
+                    lambda: symbols.SymbolQuote(
+                        account_id=account_ids[0], session=ch_session, symbol=ticker
+                    ).ask_price,
                 )
 
                 # If it should be limit
-                if symbol_quote.ask_price < 1:
+                if ask_price < 1:
                     price_type = order.PriceType.LIMIT
-                    if symbol_quote.ask_price > 0.10:
+                    if ask_price > 0.10:
                         # Set limit price
-                        limit_price = round(symbol_quote.ask_price + 0.01, 2)
+                        limit_price = round(ask_price + 0.01, 2)
                     else:
                         # Set limit price always round up
                         factor = 10**2
-                        value = symbol_quote.ask_price * factor
+                        value = ask_price * factor
                         if value % 1 != 0:
                             value = int(value) + 1
                         limit_price = value / factor
@@ -264,9 +277,10 @@ def chase_transaction(
                 loop,
             )
             try:
-                print(chase_obj.get_account_numbers())
+                printAndDiscord(chase_obj.get_account_numbers())
                 # For each account number "mask" attached to "Chase_#" complete the order
                 for account in chase_obj.get_account_numbers(key):
+                    checkpoint()
                     target_account_id = get_account_id(
                         all_accounts.account_connectors, account
                     )
@@ -293,19 +307,19 @@ def chase_transaction(
                         dry_run=orderObj.get_dry(),
                         limit_price=limit_price,
                     )
-                    print("The order verification produced the following messages: ")
+                    printAndDiscord(
+                        "The order verification produced the following messages: "
+                    )
                     if orderObj.get_dry():
-                        pprint.pprint(messages["ORDER PREVIEW"])
+                        printAndDiscord(pprint.pformat(messages["ORDER PREVIEW"]))
+                        verified = messages["ORDER PREVIEW"] not in [
+                            "",
+                            "No order preview page found.",
+                        ]
+                        status = "Dry Run"
                         printAndDiscord(
-                            (
-                                f"{key} account {account}: The order verification was "
-                                + (
-                                    "successful"
-                                    if messages["ORDER PREVIEW"]
-                                    not in ["", "No order preview page found."]
-                                    else "unsuccessful"
-                                )
-                            ),
+                            f"{key} account {account}: The order verification was "
+                            + ("successful" if verified else "unsuccessful"),
                             loop,
                         )
                         if (
@@ -317,20 +331,15 @@ def chase_transaction(
                                 loop,
                             )
                     else:
-                        pprint.pprint(messages["ORDER CONFIRMATION"])
+                        printAndDiscord(pprint.pformat(messages["ORDER CONFIRMATION"]))
+                        verified = messages["ORDER CONFIRMATION"] not in [
+                            "",
+                            "No order confirmation page found. Order Failed.",
+                        ]
+                        status = "Success"
                         printAndDiscord(
-                            (
-                                f"{key} account {account}: The order verification was "
-                                + (
-                                    "successful"
-                                    if messages["ORDER CONFIRMATION"]
-                                    not in [
-                                        "",
-                                        "No order confirmation page found. Order Failed.",
-                                    ]
-                                    else "unsuccessful"
-                                )
-                            ),
+                            f"{key} account {account}: The order verification was "
+                            + ("successful" if verified else "unsuccessful"),
                             loop,
                         )
                         if (
@@ -341,9 +350,24 @@ def chase_transaction(
                                 f"{key} account {account}: The order verification produced the following messages: {messages['ORDER INVALID']}",
                                 loop,
                             )
+                    if verified:
+                        emit_order(
+                            chase_obj, key, account, orderObj, ticker, status, loop
+                        )
+                    else:
+                        emit_order_error(
+                            chase_obj,
+                            key,
+                            account,
+                            orderObj,
+                            ticker,
+                            messages["ORDER INVALID"],
+                            loop,
+                        )
             except Exception as e:
+                emit_order_error(chase_obj, key, account, orderObj, ticker, e, loop)
                 printAndDiscord(f"{key} {account}: Error submitting order: {e}", loop)
-                print(traceback.format_exc())
+                printAndDiscord(traceback.format_exc())
                 continue
     ch_session.close_browser()
     printAndDiscord(
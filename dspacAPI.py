@@ -8,9 +8,12 @@ from dspac_invest_api import DSPACAPI
 
 from helperAPI import (
     Brokerage,
-    getOTPCodeDiscord,
-    getUserInputDiscord,
+    checkpoint,
+    emit_order,
+    emit_order_error,
+    getOTPCode,
     maskString,
+    parallel_login,
     printAndDiscord,
     printHoldings,
     send_captcha_to_discord,
@@ -22,16 +25,18 @@ def dspac_init(DSPAC_EXTERNAL=None, botObj=None, loop=None):
     load_dotenv()
     dspac_obj = Brokerage("DSPAC")
     if not os.getenv("DSPAC") and DSPAC_EXTERNAL is None:
-        print("DSPAC not found, skipping...")
+        printAndDiscord("DSPAC not found, skipping...")
         return None
     DSPAC = (
         os.environ["DSPAC"].strip().split(",")
         if DSPAC_EXTERNAL is None
         else DSPAC_EXTERNAL.strip().split(",")
     )
-    print("Logging in to DSPAC...")
-    for index, account in enumerate(DSPAC):
+    printAndDiscord("Logging in to DSPAC...")
+
+    def login_account(index, account):
         name = f"DSPAC {index + 1}"
+        login_obj = Brokerage("DSPAC")
         try:
             user, password = account.split(":")[:2]
             use_email = "@" in user
@@ -47,18 +52,22 @@ def dspac_init(DSPAC_EXTERNAL=None, botObj=None, loop=None):
             account_number = str(account_info["Data"]["accountNumber"])
             # Set account values
             masked_account_number = maskString(account_number)
-            dspac_obj.set_account_number(name, masked_account_number)
-            dspac_obj.set_account_totals(
+            login_obj.set_account_number(name, masked_account_number)
+            login_obj.set_account_totals(
                 name,
                 masked_account_number,
                 float(account_assets["Data"]["totalAssets"]),
             )
-            dspac_obj.set_logged_in_object(name, ds, "ds")
+            login_obj.set_logged_in_object(name, ds, "ds")
         except Exception as e:
-            print(f"Error logging into DSPAC: {e}")
-            print(traceback.format_exc())
-            continue
-    print("Logged into DSPAC!")
+            printAndDiscord(f"Error logging into DSPAC: {e}")
+            printAndDiscord(traceback.format_exc())
+            return None
+        return login_obj
+
+    for login_obj in parallel_login(login_account, DSPAC, "DSPAC"):
+        dspac_obj.merge(login_obj)
+    printAndDiscord("Logged into DSPAC!")
     return dspac_obj
 
 
@@ -81,13 +90,9 @@ def login(ds: DSPACAPI, botObj, name, loop, use_email):
             if not sms_and_captcha_response:
                 raise Exception("Error solving SMS or Captcha")
             # Get the OTP code from the user
-            if botObj is not None and loop is not None:
-                otp_code = asyncio.run_coroutine_threadsafe(
-                    getOTPCodeDiscord(botObj, name, timeout=300, loop=loop),
-                    loop,
-                ).result()
-            else:
-                otp_code = input("Enter security code: ")
+            otp_code = getOTPCode(
+                botObj, name, timeout=300, loop=loop, prompt="Enter security code: "
+            )
             if otp_code is None:
                 raise Exception("No OTP code received")
             # Login with the OTP code
@@ -113,8 +118,8 @@ def login(ds: DSPACAPI, botObj, name, loop, use_email):
             raise Exception(f"Login failed. Response: {login_response}")
         return True
     except Exception as e:
-        print(f"Error in OTP login: {e}")
-        print(traceback.format_exc())
+        printAndDiscord(f"Error in OTP login: {e}")
+        printAndDiscord(traceback.format_exc())
         return False
 
 
@@ -122,21 +127,21 @@ def handle_captcha_and_sms(ds: DSPACAPI, botObj, data, loop, name, use_email):
     try:
         # If CAPTCHA is needed it will generate an SMS code as well
         if data.get("needCaptchaCode", False):
-            print(f"{name}: CAPTCHA required. Requesting CAPTCHA image...")
+            printAndDiscord(f"{name}: CAPTCHA required. Requesting CAPTCHA image...")
             sms_response = solve_captcha(ds, botObj, name, loop, use_email)
             if not sms_response:
                 raise Exception("Failure solving CAPTCHA!")
-            print(f"{name}: CAPTCHA solved. SMS response is: {sms_response}")
+            printAndDiscord(f"{name}: CAPTCHA solved. SMS response is: {sms_response}")
         else:
-            print(f"{name}: Requesting code...")
+            printAndDiscord(f"{name}: Requesting code...")
             sms_response = send_sms_code(ds, name, use_email)
             if not sms_response:
                 raise Exception("Unable to retrieve sms code!")
-            print(f"{name}: SMS response is: {sms_response}")
+            printAndDiscord(f"{name}: SMS response is: {sms_response}")
         return True
     except Exception as e:
-        print(f"Error in CAPTCHA or SMS: {e}")
-        print(traceback.format_exc())
+        printAndDiscord(f"Error in CAPTCHA or SMS: {e}")
+        printAndDiscord(traceback.format_exc())
         return False
 
 
@@ -146,7 +151,7 @@ def solve_captcha(ds: DSPACAPI, botObj, name, loop, use_email):
         if not captcha_image:
             raise Exception("Unable to request CAPTCHA image, aborting...")
         # Send the CAPTCHA image to Discord for manual input
-        print("Sending CAPTCHA to Discord for user input...")
+        printAndDiscord("Sending CAPTCHA to Discord for user input...")
         file = BytesIO()
         captcha_image.save(file, format="PNG")
         file.seek(0)
@@ -156,17 +161,19 @@ def solve_captcha(ds: DSPACAPI, botObj, name, loop, use_email):
                 send_captcha_to_discord(file),
                 loop,
             ).result()
-            captcha_input = asyncio.run_coroutine_threadsafe(
-                getUserInputDiscord(
-                    botObj, f"{name} requires CAPTCHA input", timeout=300, loop=loop
-                ),
-                loop,
-            ).result()
         else:
-            captcha_image.save("./captcha.png", format="PNG")
-            captcha_input = input(
-                "CAPTCHA image saved to ./captcha.png. Please open it and type in the code: "
-            )
+            # Each login saves its own image, since they can run at the same time
+            captcha_path = f"./captcha_{name.replace(' ', '_').lower()}.png"
+            captcha_image.save(captcha_path, format="PNG")
+            printAndDiscord(f"{name}: CAPTCHA image saved to {captcha_path}")
+        captcha_input = getOTPCode(
+            botObj,
+            f"{name} CAPTCHA",
+            code_len=None,
+            timeout=300,
+            loop=loop,
+            prompt="Please open it and type in the code: ",
+        )
         if captcha_input is None:
             raise Exception("No CAPTCHA code found")
         # Send the CAPTCHA to the appropriate API based on login type
@@ -178,8 +185,8 @@ def solve_captcha(ds: DSPACAPI, botObj, name, loop, use_email):
             raise Exception("Incorrect CAPTCHA code!")
         return sms_request_response
     except Exception as e:
-        print(f"{name}: Error solving CAPTCHA code: {e}")
-        print(traceback.format_exc())
+        printAndDiscord(f"{name}: Error solving CAPTCHA code: {e}")
+        printAndDiscord(traceback.format_exc())
         return None
 
 
@@ -189,14 +196,31 @@ def send_sms_code(ds: DSPACAPI, name, use_email, captcha_input=None):
     else:
         sms_code_response = ds.request_sms_code(captcha_input=captcha_input)
     if sms_code_response.get("Message") == "Incorrect verification code.":
-        print(f"{name}: Incorrect CAPTCHA code, retrying...")
+        printAndDiscord(f"{name}: Incorrect CAPTCHA code, retrying...")
         return False
     return sms_code_response
 
 
+def dspac_check(ds: Brokerage, key: str) -> bool:
+    # Check if a kept session still works
+    obj: DSPACAPI = ds.get_logged_in_objects(key, "ds")
+    return obj.get_account_info().get("Data") is not None
+
+
+def dspac_refresh(ds: Brokerage, key: str):
+    # Update account totals of a kept session
+    obj: DSPACAPI = ds.get_logged_in_objects(key, "ds")
+    account_assets = obj.get_account_assets()
+    for account in ds.get_account_numbers(key):
+        ds.set_account_totals(
+            key, account, float(account_assets["Data"]["totalAssets"])
+        )
+
+
 def dspac_holdings(ds: Brokerage, loop=None):
     for key in ds.get_account_numbers():
         for account in ds.get_account_numbers(key):
+            checkpoint()
             obj: DSPACAPI = ds.get_logged_in_objects(key, "ds")
             try:
                 positions = obj.get_account_holdings()
@@ -210,17 +234,17 @@ def dspac_holdings(ds: Brokerage, loop=None):
                         ds.set_holdings(key, account, sym, qty, cp)
             except Exception as e:
                 printAndDiscord(f"Error getting DSPAC holdings: {e}")
-                print(traceback.format_exc())
+                printAndDiscord(traceback.format_exc())
                 continue
     printHoldings(ds, loop, False)
 
 
 def dspac_transaction(ds: Brokerage, orderObj: stockOrder, loop=None):
-    print()
-    print("==============================")
-    print("DSPAC")
-    print("==============================")
-    print()
+    printAndDiscord("")
+    printAndDiscord("==============================")
+    printAndDiscord("DSPAC")
+    printAndDiscord("==============================")
+    printAndDiscord("")
     for s in orderObj.get_stocks():
         for key in ds.get_account_numbers():
             action = orderObj.get_action().lower()
@@ -229,6 +253,7 @@ def dspac_transaction(ds: Brokerage, orderObj: stockOrder, loop=None):
                 loop,
             )
             for account in ds.get_account_numbers(key):
+                checkpoint()
                 obj: DSPACAPI = ds.get_logged_in_objects(key, "ds")
                 try:
                     quantity = orderObj.get_amount()
@@ -243,6 +268,15 @@ def dspac_transaction(ds: Brokerage, orderObj: stockOrder, loop=None):
                             account_number=account,
                         )
                         if validation_response["Outcome"] != "Success":
+                            emit_order_error(
+                                ds,
+                                key,
+                                account,
+                                orderObj,
+                                s,
+                                validation_response["Message"],
+                                loop,
+                            )
                             printAndDiscord(
                                 f"{key} {account}: Validation failed for buying {quantity} of {s}: {validation_response['Message']}",
                                 loop,
@@ -266,6 +300,15 @@ def dspac_transaction(ds: Brokerage, orderObj: stockOrder, loop=None):
                             symbol=s, account_number=account
                         )
                         if holdings_response["Outcome"] != "Success":
+                            emit_order_error(
+                                ds,
+                                key,
+                                account,
+                                orderObj,
+                                s,
+                                holdings_response["Message"],
+                                loop,
+                            )
                             printAndDiscord(
                                 f"{key} {account}: Error checking holdings: {holdings_response['Message']}",
                                 loop,
@@ -276,6 +319,9 @@ def dspac_transaction(ds: Brokerage, orderObj: stockOrder, loop=None):
                         )
                         # If trying to sell more than available, skip to the next
                         if quantity > available_amount:
+                            emit_order_error(
+                                ds, key, account, orderObj, s, "Not enough shares", loop
+                            )
                             printAndDiscord(
                                 f"{key} {account}: Not enough shares to sell {quantity} of {s}. Available: {available_amount}",
                                 loop,
@@ -286,6 +332,15 @@ def dspac_transaction(ds: Brokerage, orderObj: stockOrder, loop=None):
                             symbol=s, amount=quantity, account_number=account
                         )
                         if validation_response["Outcome"] != "Success":
+                            emit_order_error(
+                                ds,
+                                key,
+                                account,
+                                orderObj,
+                                s,
+                                validation_response["Message"],
+                                loop,
+                            )
                             printAndDiscord(
                                 f"{key} {account}: Validation failed for selling {quantity} of {s}: {validation_response['Message']}",
                                 loop,
@@ -304,11 +359,13 @@ def dspac_transaction(ds: Brokerage, orderObj: stockOrder, loop=None):
                             message = sell_response["Message"]
                         else:
                             message = "Dry Run Success"
+                    emit_order(ds, key, account, orderObj, s, message, loop)
                     printAndDiscord(
                         f"{key}: {orderObj.get_action().capitalize()} {quantity} of {s} in {account}: {message}",
                         loop,
                     )
                 except Exception as e:
+                    emit_order_error(ds, key, account, orderObj, s, e, loop)
                     printAndDiscord(f"{key} {account}: Error placing order: {e}", loop)
-                    print(traceback.format_exc())
+                    printAndDiscord(traceback.format_exc())
                     continue
@@ -1,4 +1,3 @@
-import asyncio
 import os
 import traceback
 
@@ -7,7 +6,11 @@ from fennel_invest_api import Fennel
 
 from helperAPI import (
     Brokerage,
-    getOTPCodeDiscord,
+    checkpoint,
+    emit_order,
+    emit_order_error,
+    getOTPCode,
+    parallel_login,
     printAndDiscord,
     printHoldings,
     stockOrder,
@@ -20,7 +23,7 @@ def fennel_init(FENNEL_EXTERNAL=None, botObj=None, loop=None):
     # Import Fennel account
     fennel_obj = Brokerage("Fennel")
     if not os.getenv("FENNEL") and FENNEL_EXTERNAL is None:
-        print("Fennel not found, skipping...")
+        printAndDiscord("Fennel not found, skipping...")
         return None
     FENNEL = (
         os.environ["FENNEL"].strip().split(",")
@@ -28,32 +31,30 @@ def fennel_init(FENNEL_EXTERNAL=None, botObj=None, loop=None):
         else FENNEL_EXTERNAL.strip().split(",")
     )
     # Log in to Fennel account
-    print("Logging in to Fennel...")
-    for index, account in enumerate(FENNEL):
+    printAndDiscord("Logging in to Fennel...")
+
+    def login_account(index, account):
         name = f"Fennel {index + 1}"
+        login_obj = Brokerage("Fennel")
         try:
             fb = Fennel(filename=f"fennel{index + 1}.pkl", path="./creds/")
             try:
-                if botObj is None and loop is None:
-                    # Login from CLI
-                    fb.login(
-                        email=account,
-                        wait_for_code=True,
-                    )
-                else:
-                    # Login from Discord and check for 2fa required message
-                    fb.login(
-                        email=account,
-                        wait_for_code=False,
-                    )
+                # Login and check for 2fa required message
+                fb.login(
+                    email=account,
+                    wait_for_code=False,
+                )
             except Exception as e:
-                if "2FA" in str(e) and botObj is not None and loop is not None:
+                if "2FA" in str(e):
                     # Sometimes codes take a long time to arrive
                     timeout = 300  # 5 minutes
-                    otp_code = asyncio.run_coroutine_threadsafe(
-                        getOTPCodeDiscord(botObj, name, timeout=timeout, loop=loop),
-                        loop,
-                    ).result()
+                    otp_code = getOTPCode(
+                        botObj,
+                        name,
+                        timeout=timeout,
+                        loop=loop,
+                        prompt="Enter 2FA code: ",
+                    )
                     if otp_code is None:
                         raise Exception("No 2FA code found")
                     fb.login(
@@ -63,31 +64,51 @@ def fennel_init(FENNEL_EXTERNAL=None, botObj=None, loop=None):
                     )
                 else:
                     raise e
-            fennel_obj.set_logged_in_object(name, fb, "fb")
+            login_obj.set_logged_in_object(name, fb, "fb")
             account_ids = fb.get_account_ids()
             for i, an in enumerate(account_ids):
                 account_name = f"Account {i + 1}"
                 b = fb.get_portfolio_summary(an)
-                fennel_obj.set_account_number(name, account_name)
-                fennel_obj.set_account_totals(
+                login_obj.set_account_number(name, account_name)
+                login_obj.set_account_totals(
                     name,
                     account_name,
                     b["cash"]["balance"]["canTrade"],
                 )
-                fennel_obj.set_logged_in_object(name, an, account_name)
-                print(f"Found {account_name}")
-            print(f"{name}: Logged in")
+                login_obj.set_logged_in_object(name, an, account_name)
+                printAndDiscord(f"Found {account_name}")
+            printAndDiscord(f"{name}: Logged in")
         except Exception as e:
-            print(f"Error logging into Fennel: {e}")
-            print(traceback.format_exc())
-            continue
-    print("Logged into Fennel!")
+            printAndDiscord(f"Error logging into Fennel: {e}")
+            printAndDiscord(traceback.format_exc())
+            return None
+        return login_obj
+
+    for login_obj in parallel_login(login_account, FENNEL, "Fennel"):
+        fennel_obj.merge(login_obj)
+    printAndDiscord("Logged into Fennel!")
     return fennel_obj
 
 
+def fennel_check(fbo: Brokerage, key: str) -> bool:
+    # Check if a kept session still works
+    obj: Fennel = fbo.get_logged_in_objects(key, "fb")
+    return len(obj.get_account_ids()) > 0
+
+
+def fennel_refresh(fbo: Brokerage, key: str):
+    # Update account totals of a kept session
+    obj: Fennel = fbo.get_logged_in_objects(key, "fb")
+    for account in fbo.get_account_numbers(key):
+        account_id = fbo.get_logged_in_objects(key, account)
+        b = obj.get_portfolio_summary(account_id)
+        fbo.set_account_totals(key, account, b["cash"]["balance"]["canTrade"])
+
+
 def fennel_holdings(fbo: Brokerage, loop=None):
     for key in fbo.get_account_numbers():
         for account in fbo.get_account_numbers(key):
+            checkpoint()
             obj: Fennel = fbo.get_logged_in_objects(key, "fb")
             account_id = fbo.get_logged_in_objects(key, account)
             try:
@@ -105,17 +126,17 @@ def fennel_holdings(fbo: Brokerage, loop=None):
                         fbo.set_holdings(key, account, sym, qty, cp)
             except Exception as e:
                 printAndDiscord(f"Error getting Fennel holdings: {e}")
-                print(traceback.format_exc())
+                printAndDiscord(traceback.format_exc())
                 continue
     printHoldings(fbo, loop, False)
 
 
 def fennel_transaction(fbo: Brokerage, orderObj: stockOrder, loop=None):
-    print()
-    print("==============================")
-    print("Fennel")
-    print("==============================")
-    print()
+    printAndDiscord("")
+    printAndDiscord("==============================")
+    printAndDiscord("Fennel")
+    printAndDiscord("==============================")
+    printAndDiscord("")
     for s in orderObj.get_stocks():
         for key in fbo.get_account_numbers():
             printAndDiscord(
@@ -123,6 +144,7 @@ def fennel_transaction(fbo: Brokerage, orderObj: stockOrder, loop=None):
                 loop,
             )
             for account in fbo.get_account_numbers(key):
+                checkpoint()
                 obj: Fennel = fbo.get_logged_in_objects(key, "fb")
                 account_id = fbo.get_logged_in_objects(key, account)
                 try:
@@ -141,11 +163,13 @@ def fennel_transaction(fbo: Brokerage, orderObj: stockOrder, loop=None):
                         message = "Success"
                         if order.get("data", {}).get("createOrder") != "pending":
                             message = order.get("data", {}).get("createOrder")
+                    emit_order(fbo, key, account, orderObj, s, message, loop)
                     printAndDiscord(
                         f"{key}: {orderObj.get_action()} {orderObj.get_amount()} of {s} in {account}: {message}",
                         loop,
                     )
                 except Exception as e:
+                    emit_order_error(fbo, key, account, orderObj, s, e, loop)
                     printAndDiscord(f"{key} {account}: Error placing order: {e}", loop)
-                    print(traceback.format_exc())
+                    printAndDiscord(traceback.format_exc())
                     continue
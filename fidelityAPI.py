@@ -4,7 +4,6 @@
 # 2024/09/19
 # Adapted from Nelson Dane's Selenium based code and created with the help of playwright codegen
 
-import asyncio
 import csv
 import json
 import os
@@ -18,10 +17,17 @@ from playwright_stealth import StealthConfig, stealth_sync
 
 from helperAPI import (
     Brokerage,
-    getOTPCodeDiscord,
+    checkpoint,
+    emit_order,
+    emit_order_error,
+    finish_schedule,
+    getOTPCode,
+    parallel_login,
     printAndDiscord,
     printHoldings,
+    register_cleanup,
     stockOrder,
+    wait_for_schedule,
 )
 
 
@@ -74,6 +80,8 @@ class FidelityAutomation:
             storage_state=self.profile_path if self.title is not None else None
         )
         self.page = self.context.new_page()
+        # Close the browser if Fidelity runs out of time
+        register_cleanup(self.close_browser, same_thread=True)
         # Apply stealth settings
         stealth_sync(self.page, self.stealth_config)
 
@@ -216,11 +224,11 @@ class FidelityAutomation:
             raise Exception("Cannot get to login page. Maybe other 2FA method present")
 
         except PlaywrightTimeoutError:
-            print("Timeout waiting for login page to load or navigate.")
+            printAndDiscord("Timeout waiting for login page to load or navigate.")
             return (False, False)
         except Exception as e:
-            print(f"An error occurred: {str(e)}")
-            traceback.print_exc()
+            printAndDiscord(f"An error occurred: {str(e)}")
+            printAndDiscord(traceback.format_exc())
             return (False, False)
 
     def login_2FA(self, code):
@@ -253,11 +261,11 @@ class FidelityAutomation:
             return True
 
         except PlaywrightTimeoutError:
-            print("Timeout waiting for login page to load or navigate.")
+            printAndDiscord("Timeout waiting for login page to load or navigate.")
             return False
         except Exception as e:
-            print(f"An error occurred: {str(e)}")
-            traceback.print_exc()
+            printAndDiscord(f"An error occurred: {str(e)}")
+            printAndDiscord(traceback.format_exc())
             return False
 
     def getAccountInfo(self):
@@ -451,7 +459,7 @@ class FidelityAutomation:
             ):
                 # Reload the page and hit the drop down again
                 # This is to prevent a rare case where the drop down is empty
-                print("Reloading...")
+                printAndDiscord("Reloading...")
                 self.page.reload()
                 # Click on the drop down
                 self.page.query_selector("#dest-acct-dropdown").click()
@@ -640,7 +648,7 @@ def fidelity_run(
     load_dotenv()
     # Import Chase account
     if not os.getenv("FIDELITY") and FIDELITY_EXTERNAL is None:
-        print("Fidelity not found, skipping...")
+        printAndDiscord("Fidelity not found, skipping...")
         return None
     accounts = (
         os.environ["FIDELITY"].strip().split(",")
@@ -652,12 +660,11 @@ def fidelity_run(
     # Set the functions to be run
     _, second_command = command
 
-    # For each set of login info, i.e. separate chase accounts
-    for account in accounts:
+    # For each set of login info, i.e. separate fidelity accounts
+    def run_account(index, account):
         # Start at index 1 and go to how many logins we have
-        index = accounts.index(account) + 1
-        name = f"Fidelity {index}"
-        # Receive the chase broker class object and the AllAccount object related to it
+        name = f"Fidelity {index + 1}"
+        # Receive the fidelity broker class object
         fidelityobj = fidelity_init(
             account=account,
             name=name,
@@ -666,13 +673,19 @@ def fidelity_run(
             loop=loop,
         )
         if fidelityobj is not None:
-            # Store the Brokerage object for fidelity under 'fidelity' in the orderObj
-            orderObj.set_logged_in(fidelityobj, "fidelity")
             if second_command == "_holdings":
                 fidelity_holdings(fidelityobj, name, loop=loop)
             # Only other option is _transaction
-            else:
+            elif wait_for_schedule(orderObj, name, loop):
                 fidelity_transaction(fidelityobj, name, orderObj, loop=loop)
+                finish_schedule(orderObj, name)
+        return fidelityobj
+
+    # Store the merged Brokerage object for fidelity under 'fidelity' in the orderObj
+    fidelity_obj = Brokerage("Fidelity")
+    for fidelityobj in parallel_login(run_account, accounts, "Fidelity"):
+        fidelity_obj.merge(fidelityobj)
+    orderObj.set_logged_in(fidelity_obj, "fidelity")
     return None
 
 
@@ -690,7 +703,7 @@ def fidelity_init(account: str, name: str, headless=True, botObj=None, loop=None
     """
 
     # Log into Fidelity account
-    print("Logging into Fidelity...")
+    printAndDiscord("Logging into Fidelity...")
 
     # Create brokerage class object and call it Fidelity
     fidelity_obj = Brokerage("Fidelity")
@@ -709,16 +722,11 @@ def fidelity_init(account: str, name: str, headless=True, botObj=None, loop=None
         )
         # If 2FA is present, ask for code
         if step_1 and not step_2:
-            if botObj is None and loop is None:
-                fidelity_browser.login_2FA(input("Enter code: "))
-            else:
-                # Should wait for 60 seconds before timeout
-                sms_code = asyncio.run_coroutine_threadsafe(
-                    getOTPCodeDiscord(botObj, name, code_len=6, loop=loop), loop
-                ).result()
-                if sms_code is None:
-                    raise Exception(f"{name} No SMS code found", loop)
-                fidelity_browser.login_2FA(sms_code)
+            # Should wait for 60 seconds before timeout
+            sms_code = getOTPCode(botObj, name, code_len=6, loop=loop)
+            if sms_code is None:
+                raise Exception(f"{name} No SMS code found", loop)
+            fidelity_browser.login_2FA(sms_code)
         elif not step_1:
             raise Exception(
                 f"{name}: Login Failed. Got Error Page: Current URL: {fidelity_browser.page.url}"
@@ -737,12 +745,12 @@ def fidelity_init(account: str, name: str, headless=True, botObj=None, loop=None
             fidelity_obj.set_account_number(name, acct)
             fidelity_obj.set_account_type(name, acct, account_dict[acct]["type"])
             fidelity_obj.set_account_totals(name, acct, account_dict[acct]["balance"])
-        print(f"Logged in to {name}!")
+        printAndDiscord(f"Logged in to {name}!")
         return fidelity_obj
 
     except Exception as e:
-        print(f"Error logging in to Fidelity: {e}")
-        print(traceback.format_exc())
+        printAndDiscord(f"Error logging in to Fidelity: {e}")
+        printAndDiscord(traceback.format_exc())
         return None
 
 
@@ -765,6 +773,7 @@ def fidelity_holdings(fidelity_o: Brokerage, name: str, loop=None):
     fidelity_browser: FidelityAutomation = fidelity_o.get_logged_in_objects(name)
     account_dict = fidelity_browser.account_dict
     for account_number in account_dict:
+        checkpoint()
 
         for d in account_dict[account_number]["stocks"]:
             # Append the ticker to the appropriate account
@@ -812,6 +821,7 @@ def fidelity_transaction(
         # Reload the page incase we were trading before
         fidelity_browser.page.reload()
         for account_number in fidelity_o.get_account_numbers(name):
+            checkpoint()
             # Go trade for all accounts for that stock
             success, error_message = fidelity_browser.transaction(
                 stock,
@@ -820,24 +830,40 @@ def fidelity_transaction(
                 account_number,
                 orderObj.get_dry(),
             )
+            print_account = f"xxxxx{account_number[-4:]}"
             # Report error if occurred
             if not success:
                 printAndDiscord(
-                    f"{name} account xxxxx{account_number[-4:]}: {orderObj.get_action()} {orderObj.get_amount()} {error_message}",
+                    f"{name} account {print_account}: {orderObj.get_action()} {orderObj.get_amount()} {error_message}",
+                    loop,
+                )
+                emit_order_error(
+                    fidelity_o,
+                    name,
+                    print_account,
+                    orderObj,
+                    stock,
+                    error_message,
                     loop,
                 )
             # Print test run confirmation if test run
             elif success and orderObj.get_dry():
                 printAndDiscord(
-                    f"DRY: {name} account xxxxx{account_number[-4:]}: {orderObj.get_action()} {orderObj.get_amount()} shares of {stock}",
+                    f"DRY: {name} account {print_account}: {orderObj.get_action()} {orderObj.get_amount()} shares of {stock}",
                     loop,
                 )
+                emit_order(
+                    fidelity_o, name, print_account, orderObj, stock, "Dry Run", loop
+                )
             # Print real run confirmation if real run
             elif success and not orderObj.get_dry():
                 printAndDiscord(
-                    f"{name} account xxxxx{account_number[-4:]}: {orderObj.get_action()} {orderObj.get_amount()} shares of {stock}",
+                    f"{name} account {print_account}: {orderObj.get_action()} {orderObj.get_amount()} shares of {stock}",
                     loop,
                 )
+                emit_order(
+                    fidelity_o, name, print_account, orderObj, stock, "Success", loop
+                )
 
     # Close browser
     fidelity_browser.close_browser()
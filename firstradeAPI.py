@@ -1,7 +1,6 @@
 # Donald Ryan Gullett(MaxxRK)
 # Firstrade API
 
-import asyncio
 import os
 import pprint
 import traceback
@@ -13,8 +12,13 @@ from firstrade import order, symbols
 
 from helperAPI import (
     Brokerage,
-    getOTPCodeDiscord,
+    cached_quote,
+    checkpoint,
+    emit_order,
+    emit_order_error,
+    getOTPCode,
     maskString,
+    parallel_login,
     printAndDiscord,
     printHoldings,
     stockOrder,
@@ -25,15 +29,17 @@ def firstrade_init(botObj=None, loop=None):
     # Initialize .env file
     load_dotenv()
     if not os.getenv("FIRSTRADE"):
-        print("Firstrade not found, skipping...")
+        printAndDiscord("Firstrade not found, skipping...")
         return None
     accounts = os.environ["FIRSTRADE"].strip().split(",")
     # Log in to Firstrade account
-    print("Logging in to Firstrade...")
+    printAndDiscord("Logging in to Firstrade...")
     firstrade_obj = Brokerage("Firstrade")
-    for account in accounts:
-        index = accounts.index(account) + 1
+
+    def login_account(index, account):
+        index = index + 1
         name = f"Firstrade {index}"
+        login_obj = Brokerage("Firstrade")
         try:
             account = account.split(":")
             firstrade = ft_account.FTSession(
@@ -59,38 +65,56 @@ def firstrade_init(botObj=None, loop=None):
             )
             need_code = firstrade.login()
             if need_code:
-                if botObj is None and loop is None:
-                    firstrade.login_two(input("Enter code: "))
-                else:
-                    sms_code = asyncio.run_coroutine_threadsafe(
-                        getOTPCodeDiscord(botObj, name, timeout=300, loop=loop), loop
-                    ).result()
-                    if sms_code is None:
-                        raise Exception(
-                            f"Firstrade {index} code not received in time...", loop
-                        )
-                    firstrade.login_two(sms_code)
-            print("Logged in to Firstrade!")
+                sms_code = getOTPCode(botObj, name, timeout=300, loop=loop)
+                if sms_code is None:
+                    raise Exception(f"Firstrade {index} code not received in time...")
+                firstrade.login_two(sms_code)
+            printAndDiscord("Logged in to Firstrade!")
             account_info = ft_account.FTAccountData(firstrade)
-            firstrade_obj.set_logged_in_object(name, firstrade)
+            login_obj.set_logged_in_object(name, firstrade)
             for account in account_info.account_numbers:
-                firstrade_obj.set_account_number(name, account)
-                firstrade_obj.set_account_totals(
+                login_obj.set_account_number(name, account)
+                login_obj.set_account_totals(
                     name, account, account_info.account_balances[account]
                 )
             print_accounts = [maskString(a) for a in account_info.account_numbers]
-            print(f"The following Firstrade accounts were found: {print_accounts}")
+            printAndDiscord(
+                f"The following Firstrade accounts were found: {print_accounts}"
+            )
         except Exception as e:
-            print(f"Error logging in to Firstrade: {e}")
-            print(traceback.format_exc())
+            printAndDiscord(f"Error logging in to Firstrade: {e}")
+            printAndDiscord(traceback.format_exc())
+            return None
+        return login_obj
+
+    for login_obj in parallel_login(login_account, accounts, "Firstrade"):
+        if login_obj is None:
             return None
+        firstrade_obj.merge(login_obj)
     return firstrade_obj
 
 
+def firstrade_check(firstrade_o: Brokerage, key: str) -> bool:
+    # Check if a kept session still works
+    obj: ft_account.FTSession = firstrade_o.get_logged_in_objects(key)
+    return len(ft_account.FTAccountData(obj).account_numbers) > 0
+
+
+def firstrade_refresh(firstrade_o: Brokerage, key: str):
+    # Update account totals of a kept session
+    obj: ft_account.FTSession = firstrade_o.get_logged_in_objects(key)
+    account_info = ft_account.FTAccountData(obj)
+    for account in firstrade_o.get_account_numbers(key):
+        firstrade_o.set_account_totals(
+            key, account, account_info.account_balances[account]
+        )
+
+
 def firstrade_holdings(firstrade_o: Brokerage, loop=None):
     # Get holdings on each account
     for key in firstrade_o.get_account_numbers():
         for account in firstrade_o.get_account_numbers(key):
+            checkpoint()
             obj: ft_account.FTSession = firstrade_o.get_logged_in_objects(key)
             try:
                 data = ft_account.FTAccountData(obj).get_positions(account=account)
@@ -104,17 +128,17 @@ def firstrade_holdings(firstrade_o: Brokerage, loop=None):
                     )
             except Exception as e:
                 printAndDiscord(f"{key} {account}: Error getting holdings: {e}", loop)
-                print(traceback.format_exc())
+                printAndDiscord(traceback.format_exc())
                 continue
     printHoldings(firstrade_o, loop)
 
 
 def firstrade_transaction(firstrade_o: Brokerage, orderObj: stockOrder, loop=None):
-    print()
-    print("==============================")
-    print("Firstrade")
-    print("==============================")
-    print()
+    printAndDiscord("")
+    printAndDiscord("==============================")
+    printAndDiscord("Firstrade")
+    printAndDiscord("==============================")
+    printAndDiscord("")
     # Buy on each account
     for s in orderObj.get_stocks():
         for key in firstrade_o.get_account_numbers():
@@ -123,6 +147,7 @@ def firstrade_transaction(firstrade_o: Brokerage, orderObj: stockOrder, loop=Non
                 loop,
             )
             for account in firstrade_o.get_account_numbers(key):
+                checkpoint()
                 obj: ft_account.FTSession = firstrade_o.get_logged_in_objects(key)
                 print_account = maskString(account)
                 # If DRY is True, don't actually make the transaction
@@ -131,13 +156,15 @@ def firstrade_transaction(firstrade_o: Brokerage, orderObj: stockOrder, loop=Non
                         "Running in DRY mode. No transactions will be made.", loop
                     )
                 try:
-                    symbol_data = symbols.SymbolQuote(obj, account, s)
-                    if symbol_data.last < 1.00:
+                    last = cached_quote(
+                        s, "last", lambda: symbols.SymbolQuote(obj, account, s).last
+                    )
+                    if last < 1.00:
                         price_type = order.PriceType.LIMIT
                         if orderObj.get_action().capitalize() == "Buy":
-                            price = symbol_data.last + 0.01
+                            price = last + 0.01
                         else:
-                            price = symbol_data.last - 0.01
+                            price = last - 0.01
                     else:
                         price_type = order.PriceType.MARKET
                         price = 0.00
@@ -157,8 +184,10 @@ def firstrade_transaction(firstrade_o: Brokerage, orderObj: stockOrder, loop=Non
                         dry_run=orderObj.get_dry(),
                     )
 
-                    print("The order verification produced the following messages: ")
-                    pprint.pprint(order_conf)
+                    printAndDiscord(
+                        "The order verification produced the following messages: "
+                    )
+                    printAndDiscord(pprint.pformat(order_conf))
                     printAndDiscord(
                         (
                             f"{key} account {print_account}: The order verification was "
@@ -173,11 +202,33 @@ def firstrade_transaction(firstrade_o: Brokerage, orderObj: stockOrder, loop=Non
                             f"{key} account {print_account}: The order verification produced the following messages: {order_conf}",
                             loop,
                         )
+                        emit_order_error(
+                            firstrade_o,
+                            key,
+                            print_account,
+                            orderObj,
+                            s,
+                            order_conf["error"],
+                            loop,
+                        )
+                    else:
+                        emit_order(
+                            firstrade_o,
+                            key,
+                            print_account,
+                            orderObj,
+                            s,
+                            "Success",
+                            loop,
+                        )
                 except Exception as e:
+                    emit_order_error(
+                        firstrade_o, key, print_account, orderObj, s, e, loop
+                    )
                     printAndDiscord(
                         f"{key} {print_account}: Error submitting order: {e}", loop
                     )
-                    print(traceback.format_exc())
+                    printAndDiscord(traceback.format_exc())
                     continue
                 sleep(1)
-                print()
+                printAndDiscord("")
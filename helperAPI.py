@@ -3,33 +3,82 @@
 # to share between scripts
 
 import asyncio
+import csv
+import importlib
+import io
+import json
+import multiprocessing
 import os
 import pickle
 import subprocess
 import sys
 import textwrap
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from queue import Queue
-from threading import Thread
-from time import sleep
+from queue import Empty, Queue
+from threading import Event, Lock, Thread, get_ident, local
+from time import monotonic, perf_counter, sleep, time
 
-import pkg_resources
+import aiohttp
 import requests
 from discord.ext import commands
 from dotenv import load_dotenv
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromiumService
-from selenium_stealth import stealth
 
 load_dotenv()
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 DISCORD_CHANNEL = os.getenv("DISCORD_CHANNEL")
 HEADLESS = os.getenv("HEADLESS", "true").lower() != "false"
 SORT_BROKERS = os.getenv("SORT_BROKERS", "true").lower() != "false"
-
-# Create task queue
-task_queue = Queue()
+LOGIN_WORKERS = max(int(os.getenv("LOGIN_WORKERS", "1")), 1)
+# Log in to everything at once and ask for all OTP codes together
+OTP_BATCH = os.getenv("OTP_BATCH", "false").lower() == "true"
+# Seconds without a new OTP prompt before asking for the batch
+OTP_BATCH_WINDOW = max(float(os.getenv("OTP_BATCH_WINDOW") or 15), 0)
+# Seconds a quote is shared between brokers and accounts, 0 is off
+QUOTE_TTL = max(float(os.getenv("QUOTE_TTL") or 0), 0)
+# Seconds to wait for more lines to send in the same Discord message
+DISCORD_FLUSH_WINDOW = max(float(os.getenv("DISCORD_FLUSH_WINDOW") or 0.5), 0)
+DISCORD_MESSAGE_LIMIT = 2000
+# Pack holdings into as few Discord messages as possible
+PACK_HOLDINGS = os.getenv("PACK_HOLDINGS", "false").lower() == "true"
+# Discord limits for embeds, per message and per embed
+EMBED_MESSAGE_LIMIT = 6000
+EMBEDS_PER_MESSAGE = 10
+FIELDS_PER_EMBED = 25
+FIELD_VALUE_LIMIT = 1024
+
+DISCORD_URL = f"https://discord.com/api/v10/channels/{DISCORD_CHANNEL}/messages"
+
+# Send holdings as one csv or json file instead of embeds, blank is off
+HOLDINGS_EXPORT = os.getenv("HOLDINGS_EXPORT", "").strip().lower()
+if HOLDINGS_EXPORT not in ["", "csv", "json"]:
+    print(f"Error: HOLDINGS_EXPORT must be csv or json, not {HOLDINGS_EXPORT}")
+    HOLDINGS_EXPORT = ""
+# Edit one progress message per command instead of sending every line
+PROGRESS_MESSAGE = os.getenv("PROGRESS_MESSAGE", "false").lower() == "true"
+PROGRESS_INTERVAL = max(float(os.getenv("PROGRESS_INTERVAL") or 2), 1)
+# Messages waiting for Discord, 0 is no limit
+# Broker threads wait when the queue is full
+DISCORD_QUEUE_SIZE = max(int(os.getenv("DISCORD_QUEUE_SIZE") or 0), 0)
+discord_queue = None
+discord_queue_lock = Lock()
+# Keep-alive HTTP session for sending to Discord, created on the bot's event loop
+discord_session = None
+# Where output goes, blank prints and sends to Discord directly
+# ex: console,discord,jsonl:events.jsonl,webhook:http://localhost:8080/rsa
+EVENT_SINKS = [
+    sink.strip() for sink in os.getenv("EVENT_SINKS", "").split(",") if sink.strip()
+]
+event_bus = None
+event_bus_lock = Lock()
+# Queues back to the main process when running in a ProcessHandler
+ipc_events = None
+ipc_replies = None
+ipc_lock = Lock()
+# Seconds a stopped process has to close its browsers before it's killed
+PROCESS_STOP_GRACE = 5
 
 
 class stockOrder:
@@ -44,6 +93,11 @@ class stockOrder:
         self.__dry: bool = True  # Dry run mode
         self.__holdings: bool = False  # Get holdings from enabled brokerages
         self.__logged_in: dict = {}  # Dict of logged in brokerage objects
+        self.__schedule: datetime = None  # Time to place orders at
+        self.__schedule_timing: dict = {}  # Seconds after schedule per broker
+        self.__cancelled: Event = Event()  # Set when the command is cancelled
+        self.__timeouts: dict = {}  # Brokers that ran out of time
+        self.__progress = None  # ProgressMessage for this command
 
     def set_action(self, action: str) -> None | ValueError:
         if action.lower() not in ["buy", "sell"]:
@@ -114,6 +168,37 @@ class stockOrder:
             raise ValueError("Holdings must be a boolean")
         self.__holdings = holdings
 
+    def set_schedule(self, schedule: str) -> None | ValueError:
+        # Only allow HH:MM or HH:MM:SS later today
+        for fmt in ["%H:%M", "%H:%M:%S"]:
+            try:
+                parsed = datetime.strptime(schedule, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"Schedule ({schedule}) must be HH:MM or HH:MM:SS")
+        schedule = datetime.now().replace(
+            hour=parsed.hour, minute=parsed.minute, second=parsed.second, microsecond=0
+        )
+        if schedule <= datetime.now():
+            raise ValueError(f"Schedule ({schedule:%H:%M:%S}) has already passed")
+        self.__schedule = schedule
+
+    def set_schedule_timing(self, broker: str, started=None, finished=None):
+        # Seconds after the scheduled time that orders started and finished
+        timing = self.__schedule_timing.setdefault(broker, [None, None])
+        if started is not None:
+            timing[0] = started
+        if finished is not None:
+            timing[1] = finished
+
+    def set_timeout(self, broker: str, stage: str, elapsed: float, limit: float):
+        self.__timeouts[broker] = (stage, elapsed, limit)
+
+    def set_progress(self, progress):
+        self.__progress = progress
+
     def set_logged_in(self, logged_in, broker: str):
         self.__logged_in[broker] = logged_in
 
@@ -144,6 +229,31 @@ class stockOrder:
     def get_holdings(self) -> bool:
         return self.__holdings
 
+    def cancel(self):
+        self.__cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self.__cancelled is not None and self.__cancelled.is_set()
+
+    def wait_cancelled(self, timeout: float) -> bool:
+        # Sleep for timeout seconds, returns early if the command is cancelled
+        if self.__cancelled is None:
+            sleep(timeout)
+            return False
+        return self.__cancelled.wait(timeout)
+
+    def get_schedule(self) -> datetime | None:
+        return self.__schedule
+
+    def get_schedule_timing(self) -> dict:
+        return self.__schedule_timing
+
+    def get_progress(self):
+        return self.__progress
+
+    def get_timeouts(self) -> dict:
+        return self.__timeouts
+
     def get_logged_in(self, broker=None):
         if broker is None:
             return self.__logged_in
@@ -171,6 +281,8 @@ class stockOrder:
                 raise ValueError("Stock must be set")
         if len(self.__brokers) == 0:
             raise ValueError("Brokers must be set")
+        if self.__holdings and self.__schedule is not None:
+            raise ValueError("Holdings can't be scheduled")
         if len(self.__logged_in) == 0 and not preLogin:
             raise ValueError("Logged In must be set")
         # Clean up lists
@@ -181,6 +293,14 @@ class stockOrder:
             if b in self.__brokers:
                 self.__brokers.remove(b)
 
+    def __getstate__(self):
+        # Logged in sessions can't be sent to other processes
+        state = self.__dict__.copy()
+        state["_stockOrder__logged_in"] = {}
+        state["_stockOrder__cancelled"] = None
+        state["_stockOrder__progress"] = None
+        return state
+
     def __str__(self) -> str:
         return f"Self: \n \
                 Action: {self.__action}\n \
@@ -192,6 +312,7 @@ class stockOrder:
                 Not Brokers: {self.__notbrokers}\n \
                 Dry: {self.__dry}\n \
                 Holdings: {self.__holdings}\n \
+                Schedule: {self.__schedule}\n \
                 Logged In: {self.__logged_in}"
 
 
@@ -207,6 +328,7 @@ class Brokerage:
         self.__holdings: dict = {}  # Dictionary of holdings under parent
         self.__account_totals: dict = {}  # Dictionary of account totals
         self.__account_types: dict = {}  # Dictionary of account types
+        self.__keep_alive: bool = False  # Keep sessions open after commands
 
     def set_name(self, name: str):
         if not isinstance(name, str):
@@ -257,7 +379,9 @@ class Brokerage:
             self.__account_totals[parent_name] = {}
         self.__account_totals[parent_name][account_name] = round(float(total), 2)
         self.__account_totals[parent_name]["total"] = sum(
-            self.__account_totals[parent_name].values()
+            value
+            for key, value in self.__account_totals[parent_name].items()
+            if key != "total"
         )
 
     def set_account_type(self, parent_name: str, account_name: str, account_type: str):
@@ -265,9 +389,35 @@ class Brokerage:
             self.__account_types[parent_name] = {}
         self.__account_types[parent_name][account_name] = account_type
 
+    def set_keep_alive(self, keep_alive: bool):
+        if not isinstance(keep_alive, bool):
+            raise ValueError("Keep alive must be a boolean")
+        self.__keep_alive = keep_alive
+
+    def clear_holdings(self):
+        self.__holdings = {}
+
+    def merge(self, other):
+        # Add the parents of another Brokerage object to this one
+        if other is None:
+            return
+        for parent_name, accounts in other.__account_numbers.items():
+            for account in accounts:
+                self.set_account_number(parent_name, account)
+        self.__logged_in_objects.update(other.__logged_in_objects)
+        for parent_name, holdings in other.__holdings.items():
+            self.__holdings.setdefault(parent_name, {}).update(holdings)
+        for parent_name, totals in other.__account_totals.items():
+            self.__account_totals.setdefault(parent_name, {}).update(totals)
+        for parent_name, types in other.__account_types.items():
+            self.__account_types.setdefault(parent_name, {}).update(types)
+
     def get_name(self) -> str:
         return self.__name
 
+    def get_keep_alive(self) -> bool:
+        return self.__keep_alive
+
     def get_account_numbers(self, parent_name: str = None) -> list | dict:
         if parent_name is None:
             return self.__account_numbers
@@ -303,17 +453,21 @@ class Brokerage:
             return self.__account_types.get(parent_name, {})
         return self.__account_types.get(parent_name, {}).get(account_name, "")
 
+    def __getstate__(self):
+        # Logged in sessions can't be sent to other processes
+        state = self.__dict__.copy()
+        state["_Brokerage__logged_in_objects"] = {}
+        return state
+
     def __str__(self) -> str:
-        return textwrap.dedent(
-            f"""
+        return textwrap.dedent(f"""
             Brokerage: {self.__name}
             Account Numbers: {self.__account_numbers}
             Logged In Objects: {self.__logged_in_objects}
             Holdings: {self.__holdings}
             Account Totals: {self.__account_totals}
             Account Types: {self.__account_types}
-        """
-        )
+        """)
 
 
 class ThreadHandler:
@@ -324,11 +478,17 @@ class ThreadHandler:
         self._active_threads = []
         self.queue = Queue()
         self.thread = Thread(target=self._run)
+        # The thread works for the same broker as the one that created it
+        self.deadline = get_deadline()
 
     def _run(self):
+        set_deadline(self.deadline)
         try:
             result = self.func(*self.args, **self.kwargs)
             self.queue.put((result, None))
+        except BrokerCancelled as e:
+            print(e)
+            self.queue.put((None, e))
         except Exception as e:
             print(traceback.print_exc())
             self.queue.put((None, e))
@@ -343,6 +503,307 @@ class ThreadHandler:
         return self.queue.get()
 
 
+class BrokerCancelled(BaseException):
+    # Raised by checkpoint() when a broker's command is cancelled
+    # Not an Exception, so the broker modules' error handling doesn't catch it
+    pass
+
+
+class BrokerTimeout(BrokerCancelled):
+    # Raised by checkpoint() when a broker runs out of time
+    pass
+
+
+class Deadline:
+    # Time budget for a broker or a whole command (0 seconds is no limit)
+    # Shared with every thread working for a broker with set_deadline()
+    def __init__(self, name: str, seconds=0, parent=None, orderObj=None):
+        self.name = name
+        self.seconds = seconds
+        self.parent = parent  # Command deadline of a broker deadline
+        self.orderObj = orderObj  # Cancelled commands stop at checkpoints too
+        self.started = monotonic()
+        self.expires = self.started + seconds if seconds > 0 else None
+        self.expired = Event()
+        self.cleanups = []
+        self.abandoned = None  # Broker thread still running after expiring
+        self.lock = Lock()
+
+    def restart(self, at=None):
+        # Start the budget over at monotonic time at, ex: when a scheduled order starts
+        self.started = monotonic() if at is None else at
+        if self.seconds > 0:
+            self.expires = self.started + self.seconds
+        if self.parent is not None:
+            self.parent.restart(self.started)
+
+    def remaining(self) -> float | None:
+        remaining = None if self.expires is None else self.expires - monotonic()
+        if self.parent is not None:
+            parent_remaining = self.parent.remaining()
+            if parent_remaining is not None and (
+                remaining is None or parent_remaining < remaining
+            ):
+                remaining = parent_remaining
+        return remaining
+
+    def elapsed(self) -> float:
+        return monotonic() - self.started
+
+    def is_expired(self) -> bool:
+        remaining = self.remaining()
+        return self.expired.is_set() or (remaining is not None and remaining <= 0)
+
+    def is_cancelled(self) -> bool:
+        return self.orderObj is not None and self.orderObj.is_cancelled()
+
+    def add_cleanup(self, func, same_thread=False):
+        # Cleanups close browsers when the broker runs out of time
+        # Playwright can only be closed from the thread that opened it
+        with self.lock:
+            self.cleanups.append((func, get_ident() if same_thread else None))
+
+    def run_cleanups(self, thread=None):
+        with self.lock:
+            cleanups = [c for c in self.cleanups if c[1] == thread]
+            self.cleanups = [c for c in self.cleanups if c[1] != thread]
+        for func, _ in cleanups:
+            try:
+                func()
+            except Exception as e:
+                print(f"Error cleaning up {self.name}: {e}")
+
+    def expire(self):
+        # Stop the broker, closing its browsers makes any blocked calls fail
+        self.expired.set()
+        self.run_cleanups()
+
+
+deadline_local = local()
+
+
+def get_deadline() -> Deadline | None:
+    return getattr(deadline_local, "deadline", None)
+
+
+def set_deadline(deadline: Deadline | None):
+    deadline_local.deadline = deadline
+
+
+def get_progress():
+    # Progress message of the command the current broker is running for
+    deadline = get_deadline()
+    if deadline is None or deadline.orderObj is None:
+        return None
+    return deadline.orderObj.get_progress()
+
+
+def register_cleanup(func, same_thread=False):
+    # Close func when the current broker runs out of time
+    deadline = get_deadline()
+    if deadline is not None:
+        deadline.add_cleanup(func, same_thread)
+
+
+def checkpoint(step=True):
+    # Stop the current broker here if it's out of time or its command was cancelled
+    # Brokers call this before every account, so it also counts their progress
+    # Logins and prompts pass step=False so they don't count as accounts done
+    deadline = get_deadline()
+    if deadline is None:
+        return
+    progress = get_progress()
+    if step and progress is not None:
+        progress.step(deadline.name)
+    if deadline.is_expired():
+        deadline.run_cleanups(get_ident())
+        raise BrokerTimeout(f"{deadline.name}: Ran out of time")
+    if deadline.is_cancelled():
+        deadline.run_cleanups(get_ident())
+        raise BrokerCancelled(f"{deadline.name}: Command cancelled")
+
+
+class ProcessHandler:
+    # Like ThreadHandler, but runs the function in its own process
+    # Messages and OTP prompts from the process are handled in this one
+    def __init__(self, func, *args, **kwargs):
+        ctx = multiprocessing.get_context("spawn")
+        self.events = ctx.Queue()
+        self.replies = ctx.Queue()
+        self.stopping = ctx.Event()
+        self.result = None
+        self.process = ctx.Process(
+            target=process_worker,
+            args=(self.events, self.replies, self.stopping, func, args, kwargs),
+        )
+
+    def start(self):
+        self.process.start()
+        # Stop the process if the broker runs out of time
+        register_cleanup(self.stop)
+
+    def stop(self):
+        # The process stops at its next checkpoint, closing its browsers,
+        # and stops waiting for an OTP code
+        if not self.stopping.is_set():
+            self.stopping.set()
+            self.replies.put(None)
+
+    def join(self, botObj=None, loop=None):
+        # Handle events until the process sends its result or dies
+        deadline = get_deadline()
+        try:
+            while self.result is None:
+                if deadline is not None and (
+                    deadline.is_expired() or deadline.is_cancelled()
+                ):
+                    self.stop()
+                try:
+                    kind, payload = self.events.get(timeout=1)
+                except Empty:
+                    if not self.process.is_alive():
+                        self.result = (
+                            None,
+                            Exception(
+                                f"Process exited with code {self.process.exitcode}"
+                            ),
+                        )
+                    continue
+                if kind == "print":
+                    message, embed, flush = payload
+                    printAndDiscord(message, loop, embed, flush)
+                elif kind == "event":
+                    emit_event(payload, loop)
+                elif kind == "otp":
+                    name, code_len, timeout, prompt = payload
+                    self.replies.put(
+                        getOTPCode(botObj, name, code_len, timeout, loop, prompt)
+                    )
+                elif kind == "result":
+                    self.result = payload
+        finally:
+            if self.result is None:
+                self.stop()
+            # Give the process time to close its browsers before killing it
+            self.process.join(PROCESS_STOP_GRACE)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+        if self.stopping.is_set():
+            # Report the cancel or timeout instead of the process's error
+            checkpoint(step=False)
+
+    def get_result(self):
+        return self.result
+
+
+def process_worker(events, replies, stopping, func, args, kwargs):
+    # Entry point of a ProcessHandler process
+    global ipc_events, ipc_replies
+    ipc_events = events
+    ipc_replies = replies
+    # Checkpoints in the process stop it once the main process asks it to
+    deadline = Deadline("Process")
+    set_deadline(deadline)
+
+    def watch_stopping():
+        stopping.wait()
+        deadline.expire()
+
+    Thread(target=watch_stopping, daemon=True).start()
+    try:
+        result = func(*args, **kwargs)
+        events.put(("result", (result, None)))
+    except (BrokerCancelled, BrokerTimeout) as e:
+        events.put(("result", (None, Exception(str(e)))))
+    except Exception as e:
+        traceback.print_exc()
+        # Exceptions might not be picklable
+        events.put(("result", (None, Exception(str(e)))))
+
+
+def run_broker_process(adapter, orderObj, command, docker=False):
+    # Run a broker's commands inside a ProcessHandler
+    # Returns the Brokerage object without its logged in sessions
+    # and the scheduled order timing
+    broker = adapter.name
+    if adapter.run_all:
+        # Broker runs all of its commands with one function
+        adapter.run(orderObj, command)
+    else:
+        orderObj.set_logged_in(adapter.login(docker=docker), broker)
+        logged_in_broker = orderObj.get_logged_in(broker)
+        if not logged_in_broker:
+            return logged_in_broker, {}
+        if command[1] == "_holdings":
+            adapter.holdings(logged_in_broker)
+        elif wait_for_schedule(orderObj, broker.capitalize()):
+            adapter.place_orders(logged_in_broker, orderObj)
+            finish_schedule(orderObj, broker.capitalize())
+            printAndDiscord(f"All {broker.capitalize()} transactions complete")
+    return orderObj.get_logged_in().get(broker), orderObj.get_schedule_timing()
+
+
+def wait_for_schedule(orderObj: stockOrder, name: str, loop=None) -> bool:
+    # Hold a logged in broker until the scheduled time, then record how close it got
+    # Returns False if the command was cancelled while waiting
+    schedule = orderObj.get_schedule()
+    if schedule is None:
+        return not orderObj.is_cancelled()
+    target = schedule.timestamp()
+    deadline = get_deadline()
+    if deadline is not None:
+        # Time spent waiting doesn't count against the broker
+        deadline.restart(monotonic() + max(target - time(), 0))
+    if target - time() > 0:
+        printAndDiscord(
+            f"{name}: Logged in, waiting until {schedule:%H:%M:%S} to place orders",
+            loop,
+        )
+    while (remaining := target - time()) > 0:
+        if orderObj.wait_cancelled(min(remaining, 30)):
+            printAndDiscord(f"{name}: Command cancelled, no orders placed", loop)
+            return False
+    started = time() - target
+    orderObj.set_schedule_timing(name, started=started)
+    print(f"{name}: Placing orders {started:.3f}s after {schedule:%H:%M:%S}")
+    return True
+
+
+def finish_schedule(orderObj: stockOrder, name: str):
+    # Record when a scheduled broker finished placing its orders
+    schedule = orderObj.get_schedule()
+    if schedule is not None:
+        orderObj.set_schedule_timing(name, finished=time() - schedule.timestamp())
+
+
+def login_workers(broker: str) -> int:
+    # Per broker override, ex: SCHWAB_LOGIN_WORKERS=2
+    workers = os.getenv(f"{broker.upper()}_LOGIN_WORKERS", LOGIN_WORKERS)
+    return max(int(workers), 1)
+
+
+def parallel_login(login_func, accounts: list, broker: str) -> list:
+    # Run login_func(index, account) for each set of credentials
+    # Results are always returned in the same order as the credentials
+    workers = min(login_workers(broker), len(accounts))
+    if OTP_BATCH:
+        # Every login has to get to its OTP prompt before the codes are asked for
+        workers = len(accounts)
+    deadline = get_deadline()
+
+    def run_login(index, account):
+        set_deadline(deadline)
+        checkpoint(step=False)
+        return login_func(index, account)
+
+    if workers <= 1:
+        return [run_login(index, account) for index, account in enumerate(accounts)]
+    print(f"Logging in to {len(accounts)} {broker} logins with {workers} workers")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_login, range(len(accounts)), accounts))
+
+
 def is_up_to_date(remote, branch):
     # Assume succeeded in updater()
     import git
@@ -439,6 +900,9 @@ def updater():
 
 
 def check_package_versions():
+    # Only needed here, and slow to import
+    import pkg_resources
+
     print("Checking Python pip package versions...")
     # Check if pip packages are up to date
     required_packages = []
@@ -528,6 +992,11 @@ def check_if_page_loaded(driver):
 
 
 def getDriver(DOCKER=False):
+    # Only Selenium brokers need these, so import them here
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service as ChromiumService
+    from selenium_stealth import stealth
+
     # Init webdriver options
     try:
         options = webdriver.ChromeOptions()
@@ -555,19 +1024,22 @@ def getDriver(DOCKER=False):
             platform="Win32",
             fix_hairline=True,
         )
+        register_cleanup(driver.quit)
     except Exception as e:
         print(f"Error getting Driver: {e}")
         return None
     return driver
 
 
-def killSeleniumDriver(brokerObj: Brokerage):
-    # Kill all selenium drivers
+def killSeleniumDriver(brokerObj: Brokerage, force=False):
+    # Kill all selenium drivers, unless they are kept in a SessionPool
     count = 0
+    if brokerObj and brokerObj.get_keep_alive() and not force:
+        return
     if brokerObj is not None:
         for key in brokerObj.get_account_numbers():
             print(f"Killing driver for {key}")
-            driver: webdriver = brokerObj.get_logged_in_objects(key)
+            driver = brokerObj.get_logged_in_objects(key)
             if driver is not None:
                 driver.close()
                 driver.quit()
@@ -576,13 +1048,154 @@ def killSeleniumDriver(brokerObj: Brokerage):
             print(f"Killed {count} {brokerObj.get_name()} drivers")
 
 
+async def get_discord_session() -> aiohttp.ClientSession:
+    # Reuse one connection for every message instead of opening a new one each time
+    global discord_session
+    if discord_session is None or discord_session.closed:
+        discord_session = aiohttp.ClientSession(
+            headers={"Authorization": f"Bot {DISCORD_TOKEN}"},
+            timeout=aiohttp.ClientTimeout(total=30),
+        )
+    return discord_session
+
+
+async def close_discord_session():
+    global discord_session
+    if discord_session is not None and not discord_session.closed:
+        await discord_session.close()
+    discord_session = None
+
+
+# Seconds to hold a reset bucket if the request sent to probe it gets no headers back
+DISCORD_RESET_PROBE = 5
+
+
+class DiscordRateLimiter:
+    # Follows Discord's rate limit headers so messages are sent as fast as allowed
+    # Routes (ex: POST messages) are mapped to the bucket Discord says they share
+    def __init__(self):
+        self.routes = {}  # route: bucket id
+        self.buckets = {}  # bucket id: [remaining, reset time]
+        self.global_reset = 0
+        self.refreshed = None  # Set when a response brings new headers
+
+    async def sleep(self, seconds: float):
+        # Sleep until the limit resets, waking early if new headers come in
+        if self.refreshed is None:
+            self.refreshed = asyncio.Event()
+        try:
+            await asyncio.wait_for(self.refreshed.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def wait(self, route: str):
+        # Only wait when the bucket is used up
+        while True:
+            now = monotonic()
+            bucket = self.buckets.get(self.routes.get(route))
+            if self.global_reset > now:
+                await self.sleep(self.global_reset - now)
+            elif bucket is not None and bucket[0] <= 0 and bucket[1] > now:
+                await self.sleep(bucket[1] - now)
+            else:
+                break
+        if bucket is not None:
+            if bucket[1] <= now:
+                # Bucket has reset but we don't know its new size, so send one
+                # request and hold the rest until its headers come back
+                bucket[1] = now + DISCORD_RESET_PROBE
+                bucket[0] = 1
+            # Count this request before its response comes back
+            bucket[0] -= 1
+
+    def update(self, route: str, headers):
+        bucket_id = headers.get("X-RateLimit-Bucket")
+        if bucket_id is None:
+            return
+        self.routes[route] = bucket_id
+        try:
+            remaining = int(headers.get("X-RateLimit-Remaining"))
+            reset_after = float(headers.get("X-RateLimit-Reset-After"))
+        except (TypeError, ValueError):
+            return
+        self.buckets[bucket_id] = [remaining, monotonic() + reset_after]
+        if self.refreshed is not None:
+            self.refreshed.set()
+            self.refreshed = None
+
+    def limited(self, route: str, retry_after: float, is_global=False):
+        # Got a 429 anyway, wait as long as Discord asks
+        reset = monotonic() + retry_after
+        if is_global:
+            self.global_reset = reset
+        elif route in self.routes:
+            self.buckets[self.routes[route]] = [0, reset]
+        else:
+            self.global_reset = max(self.global_reset, reset)
+
+
+# Shared by every request to Discord
+discord_rate_limiter = DiscordRateLimiter()
+
+
+async def discord_request(
+    method="POST",
+    payload=None,
+    message_id=None,
+    file=None,
+    filename=None,
+    content_type=None,
+) -> dict | None:
+    # Post or edit a message in the Discord channel, retrying when rate limited
+    # Returns the message Discord sends back, or None if it failed
+    session = await get_discord_session()
+    if file is not None:
+        file.seek(0)
+        file = file.read()
+    url = DISCORD_URL if message_id is None else f"{DISCORD_URL}/{message_id}"
+    route = f"{method} /channels/messages" + ("" if message_id is None else "/id")
+    while True:
+        await discord_rate_limiter.wait(route)
+        if file is not None:
+            # Form data can only be sent once, so build it for every try
+            data = aiohttp.FormData()
+            if payload is not None:
+                # Message content and embeds go in the same request as the file
+                data.add_field("payload_json", json.dumps(payload))
+            data.add_field("file", file, filename=filename, content_type=content_type)
+        else:
+            data = None
+        try:
+            async with session.request(
+                method, url, json=payload if data is None else None, data=data
+            ) as response:
+                discord_rate_limiter.update(route, response.headers)
+                if response.status == 200:
+                    return await response.json()
+                if response.status == 429:
+                    limit = await response.json()
+                    discord_rate_limiter.limited(
+                        route, limit["retry_after"], limit.get("global", False)
+                    )
+                    continue
+                print(f"Error: {response.status}: {await response.text()}")
+                return None
+        except Exception as e:
+            print(f"Error Sending Message: {e}")
+            return None
+
+
+async def post_to_discord(
+    payload=None, file=None, filename=None, content_type=None
+) -> bool:
+    response = await discord_request(
+        "POST", payload, file=file, filename=filename, content_type=content_type
+    )
+    return response is not None
+
+
 async def processTasks(message, embed=False):
-    # Send message to discord via request post
-    BASE_URL = f"https://discord.com/api/v10/channels/{DISCORD_CHANNEL}/messages"
-    HEADERS = {
-        "Authorization": f"Bot {DISCORD_TOKEN}",
-        "Content-Type": "application/json",
-    }
+    # Send message to discord
     embed_length = len(message["fields"]) if embed else 1
     for i in range(0, embed_length, 25):
         PAYLOAD = {
@@ -599,123 +1212,954 @@ async def processTasks(message, embed=False):
                 else []
             ),
         }
-        # Keep trying until success
-        success = False
-        while success is False:
-            try:
-                response = requests.post(BASE_URL, headers=HEADERS, json=PAYLOAD)
-                # Process response
-                if response.status_code == 200:
-                    success = True
-                elif response.status_code == 429:
-                    rate_limit = response.json()["retry_after"] * 2
-                    await asyncio.sleep(rate_limit)
-                else:
-                    print(f"Error: {response.status_code}: {response.text}")
-                    break
-            except Exception as e:
-                print(f"Error Sending Message: {e}")
-                break
-        await asyncio.sleep(0.5)
+        await post_to_discord(PAYLOAD)
 
 
-def printAndDiscord(message, loop=None, embed=False):
+def printAndDiscord(message, loop=None, embed=False, flush=False):
+    # Send message to the main process if running in a ProcessHandler
+    if ipc_events is not None:
+        ipc_events.put(("print", (message, embed, flush)))
+        return
+    send = loop is not None
+    progress = get_progress()
+    if send and progress is not None and not embed and not flush:
+        # Shown as the broker's latest line in the progress message instead
+        send = not progress.update(get_deadline().name, note=str(message))
+    if EVENT_SINKS:
+        deadline = get_deadline()
+        event = OutputEvent(
+            "message",
+            message,
+            None if deadline is None else deadline.name,
+            embed=embed,
+            flush=flush,
+        )
+        event.discord = send
+        get_event_bus().emit(event, loop)
+        return
     # Print message
     if not embed:
         print(message)
     # Add message to discord queue
-    if loop is not None:
-        task_queue.put((message, embed))
-        if task_queue.qsize() == 1:
-            asyncio.run_coroutine_threadsafe(processQueue(), loop)
+    # flush sends it right away instead of waiting for more lines, ex: OTP prompts
+    if send:
+        get_discord_queue(loop).put((message, embed, flush))
+
+
+def split_message(message: str, limit=DISCORD_MESSAGE_LIMIT) -> list:
+    # Split a message that's too long for Discord, on new lines when possible
+    chunks = []
+    while len(message) > limit:
+        cut = message.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(message[:cut])
+        message = message[cut:].lstrip("\n")
+    chunks.append(message)
+    return chunks
+
+
+class DiscordQueue:
+    # One long-lived task on the bot's event loop sends every queued message in order
+    # Broker threads hand messages over with put()
+    def __init__(self, loop, maxsize=0):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.flush_requested = False
+        self.consumer = asyncio.run_coroutine_threadsafe(self.run(), loop)
+
+    def put(self, item):
+        if self.loop.is_closed():
+            return
+        try:
+            in_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop or self.queue.maxsize == 0:
+            # The event loop can't wait on itself, so it never blocks here
+            self.loop.call_soon_threadsafe(self.put_nowait, item)
+        else:
+            # Wait for room in the queue
+            asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop).result()
+
+    def put_nowait(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.loop.create_task(self.queue.put(item))
+
+    async def run(self):
+        # Send lines (and packed embeds) that arrive together as one message
+        pending = None
+        while True:
+            if pending is None:
+                pending = await self.queue.get()
+            message, embed, flush = pending
+            pending = None
+            if embed and not PACK_HOLDINGS:
+                await self.send([message], embed, raw=True)
+                continue
+            # Packed embeds are combined like lines, up to 10 per message
+            items = [message if embed else str(message)]
+            size = embed_length(message) if embed else len(items[0])
+            limit = EMBED_MESSAGE_LIMIT if embed else DISCORD_MESSAGE_LIMIT
+            max_items = EMBEDS_PER_MESSAGE if embed else limit
+            window_end = monotonic() + DISCORD_FLUSH_WINDOW
+            while (
+                not flush
+                and not self.flush_requested
+                and size < limit
+                and len(items) < max_items
+            ):
+                try:
+                    pending = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    if monotonic() >= window_end:
+                        break
+                    await asyncio.sleep(0.05)
+                    continue
+                next_message, next_embed, flush = pending
+                next_size = (
+                    embed_length(next_message)
+                    if next_embed
+                    else len(str(next_message)) + 1
+                )
+                if next_embed != embed or size + next_size > limit:
+                    # Goes in the next message
+                    break
+                items.append(next_message if embed else str(next_message))
+                size += next_size
+                pending = None
+            self.flush_requested = False
+            await self.send(items, embed)
+
+    async def send(self, items: list, embed: bool, raw=False):
+        try:
+            if raw:
+                await processTasks(items[0], embed)
+            elif embed:
+                await post_to_discord({"content": "", "embeds": items})
+            else:
+                for chunk in split_message("\n".join(items)):
+                    await processTasks(chunk)
+        except Exception as e:
+            print(f"Error Sending Message: {e}")
+        for _ in items:
+            self.queue.task_done()
 
+    async def flush(self, timeout=5):
+        # Send everything that's queued now, ex: before posting a CAPTCHA image
+        self.flush_requested = True
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print("Timed out sending queued Discord messages")
+        finally:
+            # Cleared here too, since an empty queue never reaches run()'s reset
+            self.flush_requested = False
+
+    async def close(self, timeout=10):
+        await self.flush(timeout)
+        self.consumer.cancel()
+
+
+class ProgressMessage:
+    # One Discord message per command that is edited as brokers make progress
+    # Edits are sent at most every PROGRESS_INTERVAL seconds
+    def __init__(self, title: str, brokers: list, loop):
+        self.title = title
+        self.loop = loop
+        self.started = monotonic()
+        # name: {status, note, steps, total, started, finished}
+        self.brokers = {
+            broker.capitalize(): {
+                "status": "waiting",
+                "note": "",
+                "steps": 0,
+                "total": None,
+                "started": None,
+                "finished": None,
+            }
+            for broker in brokers
+        }
+        self.summary = None
+        self.message_id = None
+        self.last_edit = 0
+        self.edit_scheduled = False
+        self.edit_lock = None
+        self.lock = Lock()
+
+    def update(self, name: str, status=None, note=None, total=None) -> bool:
+        # Returns False for brokers that aren't part of this command
+        with self.lock:
+            broker = self.brokers.get(name)
+            if broker is None:
+                return False
+            if status is not None:
+                if broker["started"] is None and status != "waiting":
+                    broker["started"] = monotonic()
+                if status in ["done", "failed", "timed out", "cancelled", "skipped"]:
+                    broker["finished"] = monotonic()
+                elif status != broker["status"]:
+                    # New stage, count its steps from 0
+                    broker["steps"] = 0
+                    broker["total"] = None
+                broker["status"] = status
+            if note is not None:
+                broker["note"] = note.splitlines()[0] if note else ""
+            if total is not None:
+                broker["total"] = total
+        self.schedule_edit()
+        return True
 
-async def processQueue():
-    # Process discord queue
-    while not task_queue.empty():
-        message, embed = task_queue.get()
-        await processTasks(message, embed)
-        task_queue.task_done()
+    def step(self, name: str):
+        with self.lock:
+            if name in self.brokers:
+                self.brokers[name]["steps"] += 1
+        self.schedule_edit()
+
+    def finish(self, cancelled=False):
+        with self.lock:
+            counts = {}
+            for broker in self.brokers.values():
+                if broker["status"] == "waiting":
+                    broker["status"] = "cancelled" if cancelled else "skipped"
+                elif broker["finished"] is None:
+                    # Left running in the background or stopped by cancel
+                    broker["status"] = "cancelled" if cancelled else "unfinished"
+                    broker["finished"] = monotonic()
+                counts[broker["status"]] = counts.get(broker["status"], 0) + 1
+            self.summary = ", ".join(
+                f"{count} {status}" for status, count in sorted(counts.items())
+            )
+        asyncio.run_coroutine_threadsafe(self.edit(), self.loop).result()
+
+    def render(self) -> str:
+        with self.lock:
+            now = monotonic()
+            rows = []
+            for name, broker in self.brokers.items():
+                status = broker["status"]
+                if broker["steps"] > 0 and broker["finished"] is None:
+                    status += f" {broker['steps']}"
+                    # Some brokers loop over more than the orders they were given
+                    if broker["total"] and broker["steps"] <= broker["total"]:
+                        status += f" of {broker['total']}"
+                elapsed = ""
+                if broker["started"] is not None:
+                    elapsed = f"{(broker['finished'] or now) - broker['started']:.0f}s"
+                rows.append(f"{name:<12} {status:<26} {elapsed:>5}")
+                if broker["note"] and broker["status"] not in ["done", "skipped"]:
+                    rows.append(f"  {broker['note'][:60]}")
+            header = f"**{self.title}** ({now - self.started:.0f}s)"
+            if self.summary is not None:
+                header = f"**{self.title}** done in {now - self.started:.0f}s"
+            message = header + "\n```\n" + "\n".join(rows) + "\n```"
+            if self.summary:
+                message += f"\n{self.summary}"
+        return split_message(message)[0]
+
+    def schedule_edit(self):
+        with self.lock:
+            if self.edit_scheduled:
+                return
+            self.edit_scheduled = True
+        asyncio.run_coroutine_threadsafe(self.throttled_edit(), self.loop)
+
+    async def throttled_edit(self):
+        await asyncio.sleep(max(self.last_edit + PROGRESS_INTERVAL - monotonic(), 0))
+        with self.lock:
+            self.edit_scheduled = False
+        await self.edit()
+
+    async def edit(self):
+        # Only one edit at a time so the message is only posted once
+        if self.edit_lock is None:
+            self.edit_lock = asyncio.Lock()
+        async with self.edit_lock:
+            self.last_edit = monotonic()
+            payload = {"content": self.render()}
+            if self.message_id is None:
+                response = await discord_request("POST", payload)
+                if response is not None:
+                    self.message_id = response["id"]
+            else:
+                await discord_request("PATCH", payload, message_id=self.message_id)
 
 
-async def getOTPCodeDiscord(
-    botObj: commands.Bot, brokerName, code_len=6, timeout=60, loop=None
+def get_discord_queue(loop) -> DiscordQueue:
+    global discord_queue
+    with discord_queue_lock:
+        if discord_queue is None or discord_queue.loop is not loop:
+            discord_queue = DiscordQueue(loop, DISCORD_QUEUE_SIZE)
+        return discord_queue
+
+
+async def flush_discord_queue(timeout=5):
+    if discord_queue is not None:
+        await discord_queue.flush(timeout)
+
+
+async def close_discord_queue(timeout=10):
+    # Send what's left before shutting down
+    global discord_queue
+    if discord_queue is not None:
+        await discord_queue.close(timeout)
+        discord_queue = None
+
+
+class OutputEvent:
+    # Something for the output sinks, kind is one of:
+    # message: printAndDiscord() text or embed
+    # order: order result, data has name, account, action, amount, stock and status
+    # holding: one position, data has account, symbol, quantity, price and total
+    # error: broker failure, data has the stage it failed in
+    # (and the order's name, account and stock for the transaction stage)
+    # prompt: broker is waiting for OTP code or other input
+    def __init__(
+        self, kind: str, message=None, broker=None, embed=False, flush=False, **data
+    ):
+        self.kind = kind
+        self.message = message
+        self.broker = broker
+        self.embed = embed
+        self.flush = flush
+        self.discord = True  # False if the message shouldn't go to Discord
+        self.data = data
+        self.time = time()
+
+    def to_dict(self) -> dict:
+        return {
+            "time": datetime.fromtimestamp(self.time).isoformat(),
+            "kind": self.kind,
+            "broker": self.broker,
+            "message": self.message,
+            **self.data,
+        }
+
+
+class EventSink:
+    # Handles events on its own thread, so slow sinks don't hold up brokers
+    threaded = True
+
+    def __init__(self):
+        self.queue = Queue()
+        self.thread = None
+        self.lock = Lock()
+
+    def put(self, event: OutputEvent, loop=None):
+        if not self.threaded:
+            self.handle(event, loop)
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = Thread(target=self.run, daemon=True)
+                self.thread.start()
+        self.queue.put((event, loop))
+
+    def run(self):
+        while True:
+            event, loop = self.queue.get()
+            try:
+                self.handle(event, loop)
+            except Exception as e:
+                print(f"Error in {self.__class__.__name__}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        if self.thread is not None:
+            self.queue.join()
+
+    def handle(self, event: OutputEvent, loop=None):
+        raise NotImplementedError
+
+
+class ConsoleSink(EventSink):
+    # Prints messages from one thread so they don't interleave
+    def handle(self, event: OutputEvent, loop=None):
+        if event.kind == "message" and not event.embed:
+            print(event.message)
+
+
+class DiscordSink(EventSink):
+    # DiscordQueue already sends from its own task, so hand messages to it directly
+    threaded = False
+
+    def handle(self, event: OutputEvent, loop=None):
+        if event.kind == "message" and event.discord and loop is not None:
+            get_discord_queue(loop).put((event.message, event.embed, event.flush))
+
+
+class JsonlSink(EventSink):
+    # Appends every event to a file as one line of JSON
+    def __init__(self, path="events.jsonl"):
+        super().__init__()
+        self.path = path
+
+    def handle(self, event: OutputEvent, loop=None):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(event.to_dict(), default=str) + "\n")
+
+
+class WebhookSink(EventSink):
+    # Posts every event as JSON to a local webhook
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+        self.session = requests.Session()
+
+    def handle(self, event: OutputEvent, loop=None):
+        self.session.post(
+            self.url,
+            data=json.dumps(event.to_dict(), default=str),
+            headers={"Content-Type": "application/json"},
+            timeout=10,
+        )
+
+
+class EventBus:
+    # Sends each event to every sink without waiting for them
+    def __init__(self, sinks: list):
+        self.sinks = sinks
+
+    def emit(self, event: OutputEvent, loop=None):
+        for sink in self.sinks:
+            sink.put(event, loop)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+
+def make_sink(config: str) -> EventSink:
+    # Sink from its EVENT_SINKS entry, ex: jsonl:events.jsonl
+    name, _, arg = config.partition(":")
+    name = name.lower()
+    if name == "console":
+        return ConsoleSink()
+    if name == "discord":
+        return DiscordSink()
+    if name == "jsonl":
+        return JsonlSink(arg) if arg else JsonlSink()
+    if name == "webhook" and arg:
+        return WebhookSink(arg)
+    raise ValueError(f"Unknown event sink: {config}")
+
+
+def get_event_bus() -> EventBus:
+    global event_bus
+    with event_bus_lock:
+        if event_bus is None:
+            sinks = []
+            for config in EVENT_SINKS:
+                try:
+                    sinks.append(make_sink(config))
+                except ValueError as e:
+                    print(f"Error: {e}")
+            event_bus = EventBus(sinks)
+        return event_bus
+
+
+def emit_event(event: OutputEvent, loop=None):
+    # Send a typed event to the sinks, only used when EVENT_SINKS is set
+    if not EVENT_SINKS:
+        return
+    if ipc_events is not None:
+        ipc_events.put(("event", event))
+        return
+    get_event_bus().emit(event, loop)
+
+
+def emit_order(
+    brokerObj: Brokerage, key, account, orderObj, stock, status, loop=None, **data
 ):
-    printAndDiscord(f"{brokerName} requires OTP code", loop)
-    printAndDiscord(
-        f"Please enter OTP code or type cancel within {timeout} seconds", loop
+    # Order result for the sinks, sent next to the broker's text message
+    emit_event(
+        OutputEvent(
+            "order",
+            broker=brokerObj.get_name(),
+            name=key,
+            account=account,
+            action=orderObj.get_action(),
+            amount=orderObj.get_amount(),
+            stock=stock,
+            status=status,
+            dry=orderObj.get_dry(),
+            **data,
+        ),
+        loop,
     )
-    # Get OTP code from Discord
-    while True:
-        try:
-            code = await botObj.wait_for(
-                "message",
-                # Ignore bot messages and messages not in the correct channel
-                check=lambda m: m.author != botObj.user
-                and m.channel.id == int(os.getenv("DISCORD_CHANNEL")),
-                timeout=timeout,
-            )
-        except asyncio.TimeoutError:
+
+
+def emit_order_error(
+    brokerObj: Brokerage, key, account, orderObj, stock, error, loop=None
+):
+    # Order that failed in a broker's transaction
+    emit_event(
+        OutputEvent(
+            "error",
+            str(error),
+            brokerObj.get_name(),
+            stage="transaction",
+            name=key,
+            account=account,
+            action=orderObj.get_action(),
+            amount=orderObj.get_amount(),
+            stock=stock,
+        ),
+        loop,
+    )
+
+
+def flush_events():
+    # Wait for the sinks to handle every event, ex: before exiting
+    if event_bus is not None:
+        event_bus.flush()
+
+
+# Prompts waiting for a reply in Discord, tag: prompt message id
+# Only used on the bot's event loop
+pending_prompts = {}
+
+
+def prompt_tag(name: str, taken=None) -> str:
+    # Short tag the user can start a reply with, ex: Chase 1 -> chase1
+    taken = pending_prompts if taken is None else taken
+    tag = "".join(c for c in name.lower() if c.isalnum()) or "input"
+    n = 1
+    while (f"{tag}-{n}" if n > 1 else tag) in taken:
+        n += 1
+    return f"{tag}-{n}" if n > 1 else tag
+
+
+async def send_prompt(message: str, tag=None) -> str | None:
+    # Send a prompt as its own message so replies to it can be matched
+    # Returns the id of the message
+    if tag is not None:
+        message += f"\nReply to this message or start with `{tag}` if other prompts are waiting"
+    printAndDiscord(message)
+    # Keep the prompt after the messages that came before it
+    await flush_discord_queue()
+    response = await discord_request("POST", {"content": message})
+    return None if response is None else response["id"]
+
+
+def prompt_reply(message, tag: str, prompt_id) -> str | None:
+    # Reply to this prompt in the message, or None if it's not for this prompt
+    if message.reference is not None and message.reference.message_id is not None:
+        if str(message.reference.message_id) == str(prompt_id):
+            return message.content.strip()
+        return None
+    first, _, rest = message.content.strip().partition(" ")
+    if first.lower() == tag:
+        return rest.strip()
+    if len(pending_prompts) == 1 and first.lower() not in pending_prompts:
+        # Only one prompt waiting, so there's no need to tag the reply
+        return message.content.strip()
+    return None
+
+
+async def wait_for_prompt_reply(botObj: commands.Bot, tag, prompt_id, timeout):
+    # Wait for a reply to the prompt with this tag
+    # Raises asyncio.TimeoutError if there is none in time
+    def check(m):
+        if m.author == botObj.user or m.channel.id != int(DISCORD_CHANNEL):
+            return False
+        if prompt_reply(m, tag, prompt_id) is not None:
+            return True
+        if (
+            m.reference is None
+            and len(pending_prompts) > 1
+            and m.content.strip().partition(" ")[0].lower() not in pending_prompts
+            and tag == next(iter(pending_prompts))
+        ):
+            # Only the oldest prompt says which reply is missing a tag
             printAndDiscord(
-                f"Timed out waiting for OTP code input for {brokerName}", loop
+                "Multiple prompts are waiting, reply to one or start with one of: "
+                + ", ".join(f"`{tag}`" for tag in pending_prompts),
+                asyncio.get_running_loop(),
+                flush=True,
             )
-            return None
-        if code.content.lower() == "cancel":
-            printAndDiscord(f"Cancelling OTP code for {brokerName}", loop)
-            return None
+        return False
+
+    message = await botObj.wait_for("message", check=check, timeout=timeout)
+    return prompt_reply(message, tag, prompt_id)
+
+
+async def getOTPCodeDiscord(
+    botObj: commands.Bot, brokerName, code_len=6, timeout=60, loop=None
+):
+    if OTP_BATCH:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, otp_batch.request, botObj, brokerName, code_len, timeout, loop
+        )
+    tag = prompt_tag(brokerName)
+    pending_prompts[tag] = None
+    try:
+        what = "OTP code" if code_len is not None else "input"
+        pending_prompts[tag] = await send_prompt(
+            f"{brokerName} requires {what}\n"
+            f"Please enter {what} or type cancel within {timeout} seconds",
+            tag,
+        )
+        # Get OTP code from Discord
+        while True:
+            try:
+                code = await wait_for_prompt_reply(
+                    botObj, tag, pending_prompts[tag], timeout
+                )
+            except asyncio.TimeoutError:
+                printAndDiscord(
+                    f"Timed out waiting for OTP code input for {brokerName}", loop
+                )
+                return None
+            if code.lower() == "cancel":
+                printAndDiscord(f"Cancelling OTP code for {brokerName}", loop)
+                return None
+            if code_len is None:
+                # Any text is fine (ex: CAPTCHA)
+                return code
+            try:
+                # Check if code is numbers only
+                int(code)
+            except ValueError:
+                printAndDiscord(
+                    f"{brokerName}: OTP code must be numbers only", loop, flush=True
+                )
+                continue
+            # Check if code is correct length
+            if len(code) != code_len:
+                printAndDiscord(
+                    f"{brokerName}: OTP code must be {code_len} digits",
+                    loop,
+                    flush=True,
+                )
+                continue
+            return code
+    finally:
+        del pending_prompts[tag]
+
+
+def getOTPCode(
+    botObj: commands.Bot,
+    brokerName,
+    code_len=6,
+    timeout=60,
+    loop=None,
+    prompt="Enter code: ",
+):
+    # Get OTP code from the main process, Discord, or the command line
+    # code_len of None takes any text instead of a number (ex: CAPTCHA)
+    checkpoint(step=False)
+    emit_event(OutputEvent("prompt", prompt, brokerName, code_len=code_len))
+    deadline = get_deadline()
+    if deadline is not None and deadline.remaining() is not None:
+        # Don't wait for a code past the broker's deadline
+        timeout = max(min(timeout, deadline.remaining()), 1)
+    if ipc_events is not None:
+        with ipc_lock:
+            ipc_events.put(("otp", (brokerName, code_len, timeout, prompt)))
+            return ipc_replies.get()
+    if OTP_BATCH:
+        return otp_batch.request(botObj, brokerName, code_len, timeout, loop)
+    if botObj is None and loop is None:
+        return input(prompt)
+    return asyncio.run_coroutine_threadsafe(
+        getOTPCodeDiscord(botObj, brokerName, code_len, timeout, loop), loop
+    ).result()
+
+
+class OTPBatch:
+    # Holds OTP prompts until none have come in for OTP_BATCH_WINDOW seconds,
+    # then asks for all of their codes at once
+    def __init__(self):
+        self.waiting = []  # {name, code_len, timeout, code, event}
+        self.last_request = 0
+        self.collector = None
+        self.lock = Lock()
+        # Only one batch is asked for at a time
+        self.collect_lock = Lock()
+
+    def request(self, botObj, name, code_len=6, timeout=60, loop=None):
+        request = {
+            "name": name,
+            "code_len": code_len,
+            "timeout": timeout,
+            "code": None,
+            "event": Event(),
+        }
+        with self.lock:
+            self.waiting.append(request)
+            self.last_request = monotonic()
+            if self.collector is None:
+                self.collector = Thread(
+                    target=self.collect, args=(botObj, loop), daemon=True
+                )
+                self.collector.start()
+        print(f"{name} is waiting for the batch of OTP codes")
+        request["event"].wait()
+        return request["code"]
+
+    def collect(self, botObj, loop):
+        while True:
+            with self.lock:
+                wait = self.last_request + OTP_BATCH_WINDOW - monotonic()
+                if wait <= 0:
+                    # Prompts after this start the next batch
+                    batch = self.waiting
+                    self.waiting = []
+                    self.collector = None
+                    break
+            sleep(wait)
         try:
-            # Check if code is numbers only
-            int(code.content)
-        except ValueError:
-            printAndDiscord("OTP code must be numbers only", loop)
-            continue
-        # Check if code is correct length
-        if len(code.content) != code_len:
-            printAndDiscord(f"OTP code must be {code_len} digits", loop)
+            with self.collect_lock:
+                if botObj is None and loop is None:
+                    getOTPCodesCLI(batch)
+                else:
+                    timeout = max(request["timeout"] for request in batch)
+                    asyncio.run_coroutine_threadsafe(
+                        getOTPCodesDiscord(botObj, batch, timeout), loop
+                    ).result()
+        except Exception as e:
+            print(f"Error getting OTP codes: {e}")
+        finally:
+            for request in batch:
+                request["event"].set()
+
+
+otp_batch = OTPBatch()
+
+
+def parse_codes(text: str, requests: dict) -> list:
+    # Save codes from "<tag> <code>" lines to the requests they're for
+    # Returns the problems with the lines that didn't work
+    errors = []
+    for line in text.splitlines():
+        tag, _, code = line.strip().partition(" ")
+        request = requests.get(tag.lower())
+        if request is None:
+            # Just a code is fine when only one is missing
+            missing = [tag for tag in requests if requests[tag]["code"] is None]
+            if (
+                len(missing) != 1
+                or not (tag.isdigit() or requests[missing[0]]["code_len"] is None)
+                or code
+            ):
+                if line.strip():
+                    errors.append(f"Unknown tag: {tag}")
+                continue
+            request, code = requests[missing[0]], tag
+        code = code.strip()
+        if request["code_len"] is None:
+            if not code:
+                errors.append(f"{request['name']}: input can't be empty")
+                continue
+        elif not code.isdigit() or len(code) != request["code_len"]:
+            errors.append(
+                f"{request['name']}: code must be {request['code_len']} digits"
+            )
             continue
-        return code.content
+        request["code"] = code
+    return errors
 
 
-async def getUserInputDiscord(botObj: commands.Bot, prompt, timeout=60, loop=None):
-    printAndDiscord(prompt, loop)
-    printAndDiscord(
-        f"Please enter the input or type cancel within {timeout} seconds", loop
+def otp_batch_message(requests: dict) -> str:
+    return "\n".join(
+        f"`{tag}`: {request['name']} "
+        + (
+            "(text)"
+            if request["code_len"] is None
+            else f"({request['code_len']} digits)"
+        )
+        for tag, request in requests.items()
+        if request["code"] is None
     )
+
+
+def getOTPCodesCLI(batch: list):
+    # Ask for every code in the batch on the command line
+    requests = {}
+    for request in batch:
+        requests[prompt_tag(request["name"], requests)] = request
+    print("OTP codes needed:")
+    print(otp_batch_message(requests).replace("`", ""))
+    print("Enter one <tag> <code> per line, or a blank line to skip the rest")
+    while any(request["code"] is None for request in requests.values()):
+        line = input("Code: ")
+        if not line.strip():
+            return
+        for error in parse_codes(line, requests):
+            print(error)
+
+
+async def getOTPCodesDiscord(botObj: commands.Bot, batch: list, timeout=60):
+    # Ask for every code in the batch with one Discord message
+    requests = {}
+    for request in batch:
+        tag = prompt_tag(request["name"])
+        requests[tag] = request
+        pending_prompts[tag] = None
     try:
-        code = await botObj.wait_for(
-            "message",
-            check=lambda m: m.author != botObj.user
-            and m.channel.id == int(DISCORD_CHANNEL),
-            timeout=timeout,
+        prompt_id = await send_prompt(
+            "OTP codes needed:\n"
+            + otp_batch_message(requests)
+            + "\nReply with one `<tag> <code>` per line, all at once or separately, "
+            f"or type cancel within {timeout:.0f} seconds"
         )
-    except asyncio.TimeoutError:
-        printAndDiscord("Timed out waiting for input", loop)
-        return None
-    if code.content.lower() == "cancel":
+        for tag in requests:
+            pending_prompts[tag] = prompt_id
+        end = monotonic() + timeout
+
+        def check(m):
+            if m.author == botObj.user or m.channel.id != int(DISCORD_CHANNEL):
+                return False
+            if m.reference is not None and m.reference.message_id is not None:
+                return str(m.reference.message_id) == str(prompt_id)
+            content = m.content.strip().lower()
+            if (
+                len(pending_prompts) == 1
+                and content.partition(" ")[0] not in pending_prompts
+            ):
+                # Only code left, so it doesn't need a tag
+                return True
+            return any(
+                line.strip().partition(" ")[0].lower() in requests
+                and requests[line.strip().partition(" ")[0].lower()]["code"] is None
+                for line in content.splitlines()
+            )
+
+        while any(request["code"] is None for request in requests.values()):
+            try:
+                message = await botObj.wait_for(
+                    "message", check=check, timeout=max(end - monotonic(), 1)
+                )
+            except asyncio.TimeoutError:
+                printAndDiscord(
+                    "Timed out waiting for OTP codes:\n" + otp_batch_message(requests),
+                    asyncio.get_running_loop(),
+                )
+                return
+            if message.content.strip().lower() == "cancel":
+                printAndDiscord(
+                    "Cancelling OTP codes", asyncio.get_running_loop(), flush=True
+                )
+                return
+            errors = parse_codes(message.content, requests)
+            for tag, request in requests.items():
+                if request["code"] is not None:
+                    # Let the broker go as soon as its code is in
+                    request["event"].set()
+                    pending_prompts.pop(tag, None)
+            missing = otp_batch_message(requests)
+            if errors or missing:
+                printAndDiscord(
+                    "\n".join(
+                        errors + ([f"Still waiting for:\n{missing}"] if missing else [])
+                    ),
+                    asyncio.get_running_loop(),
+                    flush=True,
+                )
+    finally:
+        for tag in requests:
+            pending_prompts.pop(tag, None)
+
+
+async def getUserInputDiscord(
+    botObj: commands.Bot, prompt, timeout=60, loop=None, name=None
+):
+    emit_event(OutputEvent("prompt", prompt, name))
+    tag = prompt_tag(name or "input")
+    pending_prompts[tag] = None
+    try:
+        pending_prompts[tag] = await send_prompt(
+            f"{prompt}\nPlease enter the input or type cancel within {timeout} seconds",
+            tag,
+        )
+        try:
+            code = await wait_for_prompt_reply(
+                botObj, tag, pending_prompts[tag], timeout
+            )
+        except asyncio.TimeoutError:
+            printAndDiscord("Timed out waiting for input", loop)
+            return None
+    finally:
+        del pending_prompts[tag]
+    if code.lower() == "cancel":
         printAndDiscord("Input canceled by user", loop)
         return None
-    return code.content
+    return code
 
 
 async def send_captcha_to_discord(file):
-    BASE_URL = f"https://discord.com/api/v10/channels/{DISCORD_CHANNEL}/messages"
-    HEADERS = {
-        "Authorization": f"Bot {DISCORD_TOKEN}",
-    }
-    files = {"file": ("captcha.png", file, "image/png")}
-    success = False
-    while not success:
-        response = requests.post(BASE_URL, headers=HEADERS, files=files)
-        if response.status_code == 200:
-            success = True
-        elif response.status_code == 429:
-            rate_limit = response.json()["retry_after"] * 2
-            await asyncio.sleep(rate_limit)
-        else:
-            print(
-                f"Error sending CAPTCHA image: {response.status_code}: {response.text}"
-            )
-            break
+    # Keep the image after the messages that came before it
+    await flush_discord_queue()
+    if not await post_to_discord(
+        file=file, filename="captcha.png", content_type="image/png"
+    ):
+        print("Error sending CAPTCHA image")
+
+
+class QuoteCache:
+    # Recent quotes that every broker can fill and read,
+    # keyed by symbol and quote type, ex: ("AAPL", "ask")
+    def __init__(self, ttl=0):
+        self.ttl = ttl
+        self.quotes = {}  # (symbol, quote_type): (price, time)
+        self.fetch_locks = {}  # symbol: Lock
+        self.lock = Lock()
+
+    def get(self, symbol: str, quote_types: list, fetch) -> dict:
+        # Returns {quote_type: price} for the quote types,
+        # calling fetch() for all of them if any are missing or too old
+        if self.ttl <= 0:
+            return fetch()
+        symbol = symbol.upper()
+        with self.lock:
+            fetch_lock = self.fetch_locks.setdefault(symbol, Lock())
+        # Brokers asking for the same symbol at once wait for one lookup
+        with fetch_lock:
+            with self.lock:
+                cached = {
+                    quote_type: self.quotes.get((symbol, quote_type))
+                    for quote_type in quote_types
+                }
+                if all(
+                    quote is not None and monotonic() - quote[1] < self.ttl
+                    for quote in cached.values()
+                ):
+                    return {
+                        quote_type: quote[0] for quote_type, quote in cached.items()
+                    }
+            return self.set(symbol, fetch())
+
+    def set(self, symbol: str, prices: dict) -> dict:
+        # Prices are stored as floats, and missing ones aren't stored
+        # so they're looked up again next time
+        prices = {
+            quote_type: None if price is None else float(price)
+            for quote_type, price in prices.items()
+        }
+        with self.lock:
+            for quote_type, price in prices.items():
+                if price is not None:
+                    self.quotes[(symbol.upper(), quote_type)] = (price, monotonic())
+        return prices
+
+
+quote_cache = QuoteCache(QUOTE_TTL)
+
+
+def cached_quote(symbol: str, quote_type: str, fetch):
+    # Single price from the quote cache, fetch() returns the price
+    return quote_cache.get(symbol, [quote_type], lambda: {quote_type: fetch()})[
+        quote_type
+    ]
+
+
+def cached_quotes(symbol: str, quote_types: list, fetch) -> dict:
+    # Several prices from one lookup, fetch() returns {quote_type: price}
+    return quote_cache.get(symbol, quote_types, fetch)
 
 
 def maskString(string):
@@ -727,6 +2171,34 @@ def maskString(string):
     return masked
 
 
+def embed_length(embed: dict) -> int:
+    # Characters that count towards Discord's embed limit
+    return len(embed.get("title", "")) + sum(
+        len(field["name"]) + len(field["value"]) for field in embed["fields"]
+    )
+
+
+def pack_fields(title: str, color: int, fields: list) -> list:
+    # Put fields in as few embeds as Discord allows
+    embeds = []
+    for field in fields:
+        if (
+            len(embeds) == 0
+            or len(embeds[-1]["fields"]) >= FIELDS_PER_EMBED
+            or embed_length(embeds[-1]) + len(field["name"]) + len(field["value"])
+            > EMBED_MESSAGE_LIMIT
+        ):
+            embeds.append(
+                {
+                    "title": title if len(embeds) == 0 else f"{title} (cont.)",
+                    "color": color,
+                    "fields": [],
+                }
+            )
+        embeds[-1]["fields"].append(field)
+    return embeds
+
+
 def printHoldings(brokerObj: Brokerage, loop=None, mask=True):
     # Helper function for holdings formatting
     EMBED = {
@@ -737,6 +2209,7 @@ def printHoldings(brokerObj: Brokerage, loop=None, mask=True):
     print(
         f"==============================\n{brokerObj.get_name()} Holdings\n=============================="
     )
+    accounts = positions = broker_total = 0
     for key in brokerObj.get_account_numbers():
         for account in brokerObj.get_account_numbers(key):
             acc_name = f"{key} ({maskString(account) if mask else account})"
@@ -755,8 +2228,36 @@ def printHoldings(brokerObj: Brokerage, loop=None, mask=True):
                     price = holdings[stock]["price"]
                     total = holdings[stock]["total"]
                     print_string += f"{stock}: {quantity} @ ${format(price, '0.2f')} = ${format(total, '0.2f')}\n"
+                    emit_event(
+                        OutputEvent(
+                            "holding",
+                            broker=brokerObj.get_name(),
+                            name=key,
+                            account=maskString(account),
+                            symbol=stock,
+                            quantity=quantity,
+                            price=price,
+                            total=total,
+                        )
+                    )
             print_string += f"Total: ${format(brokerObj.get_account_totals(key, account), '0.2f')}\n"
             print(print_string)
+            if PACK_HOLDINGS:
+                # Long accounts continue in the next field instead of being cut off
+                for i, chunk in enumerate(
+                    split_message(print_string, FIELD_VALUE_LIMIT)
+                ):
+                    EMBED["fields"].append(
+                        {
+                            "name": acc_name if i == 0 else f"{acc_name} (cont.)",
+                            "value": chunk,
+                            "inline": False,
+                        }
+                    )
+                positions += len(holdings)
+                broker_total += brokerObj.get_account_totals(key, account)
+                accounts += 1
+                continue
             # If somehow longer than 1024, chop and add ...
             field["value"] = (
                 print_string[:1020] + "..."
@@ -764,10 +2265,121 @@ def printHoldings(brokerObj: Brokerage, loop=None, mask=True):
                 else print_string
             )
             EMBED["fields"].append(field)
-    printAndDiscord(EMBED, loop, True)
+    if HOLDINGS_EXPORT and (loop is not None or ipc_events is not None):
+        # Sent with every other broker's holdings by export_holdings()
+        print("==============================")
+        return
+    if PACK_HOLDINGS:
+        EMBED["fields"].append(
+            {
+                "name": f"{brokerObj.get_name()} Summary",
+                "value": f"{accounts} accounts, {positions} positions\n"
+                f"Total: ${format(broker_total, '0.2f')}",
+                "inline": False,
+            }
+        )
+        for embed in pack_fields(EMBED["title"], EMBED["color"], EMBED["fields"]):
+            printAndDiscord(embed, loop, True)
+    else:
+        printAndDiscord(EMBED, loop, True)
     print("==============================")
 
 
+def holdings_rows(brokerObjs: list) -> list:
+    # One row per position, or per account if it has no positions
+    rows = []
+    for brokerObj in brokerObjs:
+        for key in brokerObj.get_account_numbers():
+            for account in brokerObj.get_account_numbers(key):
+                row = {
+                    "broker": brokerObj.get_name(),
+                    "name": key,
+                    "account": maskString(account),
+                    "account_total": round(
+                        brokerObj.get_account_totals(key, account), 2
+                    ),
+                }
+                holdings = brokerObj.get_holdings(key, account)
+                if holdings == {}:
+                    rows.append(
+                        {**row, "symbol": "", "quantity": 0, "price": 0, "total": 0}
+                    )
+                for stock, holding in holdings.items():
+                    rows.append(
+                        {
+                            **row,
+                            "symbol": stock,
+                            "quantity": holding["quantity"],
+                            "price": holding["price"],
+                            "total": holding["total"],
+                        }
+                    )
+    return rows
+
+
+def export_holdings(brokerObjs: list, loop):
+    # Send the holdings of every broker as one file with a short totals embed
+    rows = holdings_rows(brokerObjs)
+    file = io.StringIO()
+    if HOLDINGS_EXPORT == "csv":
+        writer = csv.DictWriter(
+            file,
+            fieldnames=[
+                "broker",
+                "name",
+                "account",
+                "symbol",
+                "quantity",
+                "price",
+                "total",
+                "account_total",
+            ],
+        )
+        writer.writeheader()
+        writer.writerows(rows)
+        content_type = "text/csv"
+    else:
+        json.dump(rows, file, indent=2)
+        content_type = "application/json"
+    summary = ""
+    grand_total = 0
+    for brokerObj in brokerObjs:
+        accounts = positions = broker_total = 0
+        for key in brokerObj.get_account_numbers():
+            for account in brokerObj.get_account_numbers(key):
+                accounts += 1
+                positions += len(brokerObj.get_holdings(key, account))
+                broker_total += brokerObj.get_account_totals(key, account)
+        grand_total += broker_total
+        summary += (
+            f"{brokerObj.get_name()}: {accounts} accounts, {positions} positions, "
+            f"${format(broker_total, '0.2f')}\n"
+        )
+    summary += f"**Total: ${format(grand_total, '0.2f')}**"
+    embed = {
+        "title": "Holdings",
+        "color": 3447003,
+        "description": split_message(summary, 4096)[0],
+    }
+    filename = f"holdings_{datetime.now():%Y%m%d_%H%M%S}.{HOLDINGS_EXPORT}"
+    print(f"Sending holdings as {filename}")
+    asyncio.run_coroutine_threadsafe(
+        send_holdings_file(
+            embed, io.BytesIO(file.getvalue().encode()), filename, content_type
+        ),
+        loop,
+    ).result()
+
+
+async def send_holdings_file(embed: dict, file, filename: str, content_type: str):
+    # Keep the file after the messages that came before it
+    await flush_discord_queue()
+    if not await post_to_discord(
+        {"embeds": [embed]}, file=file, filename=filename, content_type=content_type
+    ):
+        print("Error sending holdings file")
+
+
 def save_cookies(driver, filename, path=None, important_cookies=None):
     if path is not None:
         filename = os.path.join(path, filename)
@@ -811,3 +2423,315 @@ def clear_cookies(driver, important_cookies=None):
     for cookie in cookies:
         if important_cookies is None or cookie["name"] not in important_cookies:
             driver.delete_cookie(cookie["name"])
+
+
+class BrokerAdapter:
+    # Uniform interface to a broker module, so brokers can be run generically
+    def __init__(
+        self,
+        name: str,
+        module: str,
+        needs_bot: bool = False,
+        needs_loop: bool = False,
+        needs_docker: bool = False,
+        browser: bool = False,
+        run_all: bool = False,
+        fast_login: bool = False,
+        close_func=None,
+    ):
+        self.name = name  # Name used in commands and function names
+        self.module = module  # Module with the broker's functions
+        self.needs_bot = needs_bot  # Login takes botObj and loop
+        self.needs_loop = needs_loop  # Login takes loop
+        self.needs_docker = needs_docker  # Login takes DOCKER
+        self.browser = browser  # Broker drives a browser
+        self.run_all = run_all  # Broker runs login and commands in <name>_run
+        self.fast_login = fast_login  # Broker logs in quickly through an API
+        self.close_func = close_func  # Closes the broker's sessions
+
+    def get_module(self):
+        # Brokers are only imported when they are first used
+        # (import_module waits if another thread is still importing it)
+        first_load = self.module not in sys.modules
+        start = perf_counter()
+        module = importlib.import_module(self.module)
+        if first_load:
+            print(f"Loaded {self.module} in {perf_counter() - start:.2f}s")
+        return module
+
+    def get_function(self, suffix: str):
+        return getattr(self.get_module(), self.name + suffix)
+
+    def poolable(self) -> bool:
+        # Sessions can be kept between commands if they can be checked
+        # and their account totals can be fetched again
+        module = self.get_module()
+        return (
+            not self.run_all
+            and hasattr(module, self.name + "_check")
+            and hasattr(module, self.name + "_refresh")
+        )
+
+    def check(self, brokerObj: Brokerage, parent_name: str) -> bool:
+        # Cheap call to see if a kept session still works
+        try:
+            return bool(self.get_function("_check")(brokerObj, parent_name))
+        except Exception as e:
+            print(f"Error checking {parent_name} session: {e}")
+            return False
+
+    def refresh(self, brokerObj: Brokerage, parent_name: str) -> bool:
+        # Update the account totals of a kept session
+        try:
+            self.get_function("_refresh")(brokerObj, parent_name)
+            return True
+        except Exception as e:
+            print(f"Error refreshing {parent_name} session: {e}")
+            return False
+
+    def login(self, botObj=None, loop=None, docker=False) -> Brokerage:
+        kwargs = {}
+        if self.needs_bot:
+            kwargs["botObj"] = botObj
+        if self.needs_bot or self.needs_loop:
+            kwargs["loop"] = loop
+        if self.needs_docker:
+            kwargs["DOCKER"] = docker
+        return self.get_function("_init")(**kwargs)
+
+    def holdings(self, brokerObj: Brokerage, loop=None):
+        self.get_function("_holdings")(brokerObj, loop)
+
+    def place_orders(self, brokerObj: Brokerage, orderObj: stockOrder, loop=None):
+        self.get_function("_transaction")(brokerObj, orderObj, loop)
+
+    def run(self, orderObj: stockOrder, command, botObj=None, loop=None):
+        self.get_function("_run")(
+            orderObj=orderObj, command=command, botObj=botObj, loop=loop
+        )
+
+    def close(self, brokerObj: Brokerage):
+        if self.close_func is not None and brokerObj:
+            self.close_func(brokerObj, force=True)
+
+
+BROKERS = {
+    "bbae": BrokerAdapter("bbae", "bbaeAPI", needs_bot=True),
+    "chase": BrokerAdapter(
+        "chase", "chaseAPI", needs_bot=True, browser=True, run_all=True
+    ),
+    "dspac": BrokerAdapter("dspac", "dspacAPI", needs_bot=True),
+    "fennel": BrokerAdapter("fennel", "fennelAPI", needs_bot=True),
+    "fidelity": BrokerAdapter(
+        "fidelity", "fidelityAPI", needs_bot=True, browser=True, run_all=True
+    ),
+    "firstrade": BrokerAdapter("firstrade", "firstradeAPI", needs_bot=True),
+    "public": BrokerAdapter("public", "publicAPI", needs_bot=True, fast_login=True),
+    "robinhood": BrokerAdapter("robinhood", "robinhoodAPI", fast_login=True),
+    "schwab": BrokerAdapter("schwab", "schwabAPI", fast_login=True),
+    "tastytrade": BrokerAdapter("tastytrade", "tastyAPI", fast_login=True),
+    "tornado": BrokerAdapter(
+        "tornado",
+        "tornadoAPI",
+        needs_loop=True,
+        needs_docker=True,
+        browser=True,
+        close_func=killSeleniumDriver,
+    ),
+    "tradier": BrokerAdapter("tradier", "tradierAPI", fast_login=True),
+    "vanguard": BrokerAdapter(
+        "vanguard", "vanguardAPI", needs_bot=True, browser=True, run_all=True
+    ),
+    "webull": BrokerAdapter("webull", "webullAPI", fast_login=True),
+    "wellsfargo": BrokerAdapter(
+        "wellsfargo",
+        "wellsfargoAPI",
+        needs_bot=True,
+        needs_docker=True,
+        browser=True,
+        close_func=killSeleniumDriver,
+    ),
+}
+
+
+class SessionPool:
+    # Keeps logged in Brokerage objects alive between Discord commands
+    # Sessions are keyed by broker and login name (ex: Schwab 1)
+    def __init__(self, ttl: float):
+        self.ttl = ttl  # Seconds a session can be idle before it's closed
+        self.sessions = {}  # (broker, parent_name): [brokerObj, last_used]
+        self.in_use = set()  # Brokers running a command, never closed while idle
+        self.lock = Lock()
+        self.sweeper = None
+
+    def get(self, broker: str) -> Brokerage | None:
+        # Get a broker's kept sessions if all of them still work
+        self.evict_expired()
+        with self.lock:
+            keys = [key for key in self.sessions if key[0] == broker]
+            if len(keys) == 0 or broker in self.in_use:
+                # Another command is using the sessions, so log in separately
+                return None
+            brokerObj = self.sessions[keys[0]][0]
+        adapter = get_broker(broker)
+        for _, parent_name in keys:
+            if not adapter.check(brokerObj, parent_name):
+                print(f"{parent_name} session is no longer valid, logging in again")
+                self.evict(broker)
+                return None
+        with self.lock:
+            self.in_use.add(broker)
+            for key in keys:
+                self.sessions[key][1] = monotonic()
+        # Kept browsers are closed if this command runs out of time
+        register_cleanup(lambda: adapter.close(brokerObj))
+        # Holdings are fetched again by every command
+        brokerObj.clear_holdings()
+        for _, parent_name in keys:
+            if not adapter.refresh(brokerObj, parent_name):
+                self.evict(broker)
+                return None
+        print(f"Reusing {len(keys)} {broker} sessions")
+        return brokerObj
+
+    def put(self, broker: str, brokerObj: Brokerage):
+        if not brokerObj:
+            return
+        deadline = get_deadline()
+        if deadline is not None and deadline.expired.is_set():
+            # The command already gave up on this login
+            return
+        with self.lock:
+            if broker in self.in_use:
+                # Only one set of sessions is kept per broker
+                return
+            brokerObj.set_keep_alive(True)
+            self.in_use.add(broker)
+            for parent_name in brokerObj.get_logged_in_objects():
+                self.sessions[(broker, parent_name)] = [brokerObj, monotonic()]
+            if self.sweeper is None:
+                self.sweeper = Thread(target=self._sweep, daemon=True)
+                self.sweeper.start()
+
+    def release(self, broker: str):
+        # Command is done with the broker, start its idle timer
+        with self.lock:
+            self.in_use.discard(broker)
+            for key, session in self.sessions.items():
+                if key[0] == broker:
+                    session[1] = monotonic()
+
+    def evict(self, broker: str):
+        with self.lock:
+            keys = [key for key in self.sessions if key[0] == broker]
+            brokerObjs = {
+                id(self.sessions[key][0]): self.sessions[key][0] for key in keys
+            }
+            for key in keys:
+                del self.sessions[key]
+            self.in_use.discard(broker)
+        for brokerObj in brokerObjs.values():
+            brokerObj.set_keep_alive(False)
+            try:
+                get_broker(broker).close(brokerObj)
+            except Exception as e:
+                print(f"Error closing {broker} sessions: {e}")
+
+    def evict_expired(self):
+        now = monotonic()
+        with self.lock:
+            expired = {
+                key[0]
+                for key, (_, last_used) in self.sessions.items()
+                if now - last_used > self.ttl and key[0] not in self.in_use
+            }
+        for broker in expired:
+            print(f"Closing idle {broker} sessions")
+            self.evict(broker)
+
+    def close_all(self):
+        with self.lock:
+            brokers = {key[0] for key in self.sessions}
+        for broker in brokers:
+            self.evict(broker)
+
+    def _sweep(self):
+        # Close idle sessions even when no commands are run
+        while True:
+            sleep(min(self.ttl, 60))
+            self.evict_expired()
+
+
+def get_broker(name: str) -> BrokerAdapter:
+    if name.lower() not in BROKERS:
+        raise ValueError(f"Unknown broker: {name}")
+    return BROKERS[name.lower()]
+
+
+class Job:
+    # A Discord command run by the JobManager
+    def __init__(self, job_id: int, description: str, orderObj: stockOrder):
+        self.id = job_id
+        self.description = description
+        self.orderObj = orderObj
+        self.status = "queued"
+        self.created = monotonic()
+        self.future = None
+
+    def __str__(self) -> str:
+        return (
+            f"{self.id}: {self.description} "
+            f"({self.status}, {monotonic() - self.created:.0f}s)"
+        )
+
+
+class JobManager:
+    # Runs bot commands on a dedicated executor so they can be listed and cancelled
+    # Commands that share a broker wait on its semaphore in fun_run
+    def __init__(self, workers: int):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="job"
+        )
+        self.jobs = {}
+        self.lock = Lock()
+        self.next_id = 1
+
+    def submit(self, description: str, orderObj: stockOrder, func, *args) -> Job:
+        with self.lock:
+            job = Job(self.next_id, description, orderObj)
+            self.jobs[job.id] = job
+            self.next_id += 1
+        job.future = self.executor.submit(self._run, job, func, *args)
+        return job
+
+    def _run(self, job: Job, func, *args):
+        job.status = "running"
+        try:
+            return func(*args)
+        finally:
+            with self.lock:
+                self.jobs.pop(job.id, None)
+
+    def get_jobs(self) -> list:
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id: int) -> Job | None:
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        job.orderObj.cancel()
+        if job.future.cancel():
+            # Job never started
+            with self.lock:
+                self.jobs.pop(job.id, None)
+            job.status = "cancelled"
+        else:
+            job.status = "cancelling"
+        return job
+
+    def shutdown(self):
+        for job in self.get_jobs():
+            self.cancel(job.id)
+        self.executor.shutdown(wait=False)
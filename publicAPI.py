@@ -1,14 +1,18 @@
-import asyncio
 import os
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 from public_invest_api import Public
 
 from helperAPI import (
     Brokerage,
-    getOTPCodeDiscord,
+    checkpoint,
+    emit_order,
+    emit_order_error,
+    getOTPCode,
     maskString,
+    parallel_login,
     printAndDiscord,
     printHoldings,
     stockOrder,
@@ -21,7 +25,7 @@ def public_init(PUBLIC_EXTERNAL=None, botObj=None, loop=None):
     # Import Public account
     public_obj = Brokerage("Public")
     if not os.getenv("PUBLIC_BROKER") and PUBLIC_EXTERNAL is None:
-        print("Public not found, skipping...")
+        printAndDiscord("Public not found, skipping...")
         return None
     PUBLIC = (
         os.environ["PUBLIC_BROKER"].strip().split(",")
@@ -29,35 +33,32 @@ def public_init(PUBLIC_EXTERNAL=None, botObj=None, loop=None):
         else PUBLIC_EXTERNAL.strip().split(",")
     )
     # Log in to Public account
-    print("Logging in to Public...")
-    for index, account in enumerate(PUBLIC):
+    printAndDiscord("Logging in to Public...")
+
+    def login_account(index, account):
         name = f"Public {index + 1}"
+        login_obj = Brokerage("Public")
         try:
             account = account.split(":")
             pb = Public(filename=f"public{index + 1}.pkl", path="./creds/")
             try:
-                if botObj is None and loop is None:
-                    # Login from CLI
-                    pb.login(
-                        username=account[0],
-                        password=account[1],
-                        wait_for_2fa=True,
-                    )
-                else:
-                    # Login from Discord and check for 2fa required message
-                    pb.login(
-                        username=account[0],
-                        password=account[1],
-                        wait_for_2fa=False,
-                    )
+                # Login and check for 2fa required message
+                pb.login(
+                    username=account[0],
+                    password=account[1],
+                    wait_for_2fa=False,
+                )
             except Exception as e:
-                if "2FA" in str(e) and botObj is not None and loop is not None:
+                if "2FA" in str(e):
                     # Sometimes codes take a long time to arrive
                     timeout = 300  # 5 minutes
-                    sms_code = asyncio.run_coroutine_threadsafe(
-                        getOTPCodeDiscord(botObj, name, timeout=timeout, loop=loop),
-                        loop,
-                    ).result()
+                    sms_code = getOTPCode(
+                        botObj,
+                        name,
+                        timeout=timeout,
+                        loop=loop,
+                        prompt="Enter 2FA code: ",
+                    )
                     if sms_code is None:
                         raise Exception("No SMS code found")
                     pb.login(
@@ -69,51 +70,98 @@ def public_init(PUBLIC_EXTERNAL=None, botObj=None, loop=None):
                 else:
                     raise e
             # Public only has one account
-            public_obj.set_logged_in_object(name, pb)
+            login_obj.set_logged_in_object(name, pb)
             an = pb.get_account_number()
-            public_obj.set_account_number(name, an)
-            print(f"{name}: Found account {maskString(an)}")
+            login_obj.set_account_number(name, an)
+            printAndDiscord(f"{name}: Found account {maskString(an)}")
             atype = pb.get_account_type()
-            public_obj.set_account_type(name, an, atype)
+            login_obj.set_account_type(name, an, atype)
             cash = pb.get_account_cash()
-            public_obj.set_account_totals(name, an, cash)
+            login_obj.set_account_totals(name, an, cash)
         except Exception as e:
-            print(f"Error logging in to Public: {e}")
-            print(traceback.format_exc())
-            continue
-    print("Logged in to Public!")
+            printAndDiscord(f"Error logging in to Public: {e}")
+            printAndDiscord(traceback.format_exc())
+            return None
+        return login_obj
+
+    for login_obj in parallel_login(login_account, PUBLIC, "Public"):
+        public_obj.merge(login_obj)
+    printAndDiscord("Logged in to Public!")
     return public_obj
 
 
+def public_check(pbo: Brokerage, key: str) -> bool:
+    # Check if a kept session still works
+    obj: Public = pbo.get_logged_in_objects(key)
+    return obj.get_positions() is not None
+
+
+def public_refresh(pbo: Brokerage, key: str):
+    # Update account totals of a kept session
+    obj: Public = pbo.get_logged_in_objects(key)
+    for account in pbo.get_account_numbers(key):
+        pbo.set_account_totals(key, account, obj.get_account_cash())
+
+
+def get_prices(symbols: dict, workers=8) -> dict:
+    # Price of each symbol, looked up at the same time with the login that holds it
+    # symbols is {symbol: Public}
+    def get_price(sym):
+        try:
+            return symbols[sym].get_symbol_price(sym)
+        except Exception as e:
+            printAndDiscord(f"Error getting price of {sym}: {e}")
+            return None
+
+    if not symbols:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(symbols))) as executor:
+        return dict(zip(symbols, executor.map(get_price, symbols)))
+
+
 def public_holdings(pbo: Brokerage, loop=None):
+    positions = {}
     for key in pbo.get_account_numbers():
         for account in pbo.get_account_numbers(key):
+            checkpoint()
             obj: Public = pbo.get_logged_in_objects(key)
             try:
                 # Get account holdings
-                positions = obj.get_positions()
-                if positions != []:
-                    for holding in positions:
-                        # Get symbol, quantity, and total value
-                        sym = holding["instrument"]["symbol"]
-                        qty = float(holding["quantity"])
-                        current_price = obj.get_symbol_price(sym)
-                        if current_price is None:
-                            current_price = "N/A"
-                        pbo.set_holdings(key, account, sym, qty, current_price)
+                holdings = obj.get_positions()
+                if holdings is None:
+                    raise Exception("No positions returned")
+                positions[(key, account)] = (obj, holdings)
             except Exception as e:
                 printAndDiscord(f"{key}: Error getting account holdings: {e}", loop)
                 traceback.format_exc()
                 continue
+    # Price each symbol once, even if it's in more than one account
+    symbols = {}
+    for obj, holdings in positions.values():
+        for holding in holdings:
+            symbols.setdefault(holding["instrument"]["symbol"], obj)
+    prices = get_prices(symbols)
+    for (key, account), (_, holdings) in positions.items():
+        for holding in holdings:
+            # Get symbol, quantity, and total value
+            sym = holding["instrument"]["symbol"]
+            qty = float(holding["quantity"])
+            current_price = prices.get(sym)
+            if current_price is None and holding.get("currentValue") and qty != 0:
+                # Fall back to the position's market value
+                current_price = float(holding["currentValue"]) / qty
+            if current_price is None:
+                current_price = "N/A"
+            pbo.set_holdings(key, account, sym, qty, current_price)
     printHoldings(pbo, loop)
 
 
 def public_transaction(pbo: Brokerage, orderObj: stockOrder, loop=None):
-    print()
-    print("==============================")
-    print("Public")
-    print("==============================")
-    print()
+    printAndDiscord("")
+    printAndDiscord("==============================")
+    printAndDiscord("Public")
+    printAndDiscord("==============================")
+    printAndDiscord("")
     for s in orderObj.get_stocks():
         for key in pbo.get_account_numbers():
             printAndDiscord(
@@ -121,6 +169,7 @@ def public_transaction(pbo: Brokerage, orderObj: stockOrder, loop=None):
                 loop,
             )
             for account in pbo.get_account_numbers(key):
+                checkpoint()
                 obj: Public = pbo.get_logged_in_objects(key)
                 print_account = maskString(account)
                 try:
@@ -134,11 +183,13 @@ def public_transaction(pbo: Brokerage, orderObj: stockOrder, loop=None):
                     )
                     if order["success"] is True:
                         order = "Success"
+                    emit_order(pbo, key, print_account, orderObj, s, order, loop)
                     printAndDiscord(
                         f"{key}: {orderObj.get_action()} {orderObj.get_amount()} of {s} in {print_account}: {order}",
                         loop,
                     )
                 except Exception as e:
+                    emit_order_error(pbo, key, print_account, orderObj, s, e, loop)
                     printAndDiscord(f"{print_account}: Error placing order: {e}", loop)
-                    traceback.print_exc()
+                    printAndDiscord(traceback.format_exc())
                     continue
@@ -1,14 +1,65 @@
 # Nelson Dane
 # Robinhood API
 
+import json
 import os
 import traceback
+from threading import Lock
 
 import pyotp
 import robin_stocks.robinhood as rh
 from dotenv import load_dotenv
 
-from helperAPI import Brokerage, maskString, printAndDiscord, printHoldings, stockOrder
+from helperAPI import (
+    Brokerage,
+    cached_quotes,
+    checkpoint,
+    emit_order,
+    emit_order_error,
+    maskString,
+    printAndDiscord,
+    printHoldings,
+    stockOrder,
+)
+
+# Instrument URLs never change, so their symbols are kept between runs
+INSTRUMENTS_FILE = "./creds/robinhood_instruments.json"
+instruments = None
+instruments_lock = Lock()
+
+
+def get_symbols(obj: rh, urls: list) -> dict:
+    # Symbol of each instrument URL, only looking up ones not seen before
+    global instruments
+    with instruments_lock:
+        if instruments is None:
+            try:
+                with open(INSTRUMENTS_FILE, "r") as f:
+                    instruments = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                instruments = {}
+        missing = [url for url in dict.fromkeys(urls) if url not in instruments]
+        for url in missing:
+            symbol = obj.get_symbol_by_url(url)
+            if symbol:
+                instruments[url] = symbol
+        if missing:
+            try:
+                os.makedirs(os.path.dirname(INSTRUMENTS_FILE), exist_ok=True)
+                with open(INSTRUMENTS_FILE, "w") as f:
+                    json.dump(instruments, f)
+            except OSError as e:
+                printAndDiscord(f"Error saving Robinhood instruments: {e}")
+        return {url: instruments.get(url) for url in urls}
+
+
+def robinhood_quote(obj: rh, symbol):
+    # Ask and bid from one quote lookup
+    quote = obj.get_quotes(symbol)[0] or {}
+    return {
+        quote_type: float(quote[key]) if quote.get(key) is not None else None
+        for quote_type, key in (("ask", "ask_price"), ("bid", "bid_price"))
+    }
 
 
 def login_with_cache(pickle_path, pickle_name):
@@ -25,7 +76,7 @@ def robinhood_init(ROBINHOOD_EXTERNAL=None):
     # Import Robinhood account
     rh_obj = Brokerage("Robinhood")
     if not os.getenv("ROBINHOOD") and ROBINHOOD_EXTERNAL is None:
-        print("Robinhood not found, skipping...")
+        printAndDiscord("Robinhood not found, skipping...")
         return None
     RH = (
         os.environ["ROBINHOOD"].strip().split(",")
@@ -37,7 +88,7 @@ def robinhood_init(ROBINHOOD_EXTERNAL=None):
     for account in RH:
         index = RH.index(account) + 1
         name = f"Robinhood {index}"
-        print(f"Logging in to {name}...")
+        printAndDiscord(f"Logging in to {name}...")
         try:
             account = account.split(":")
             rh.login(
@@ -67,51 +118,94 @@ def robinhood_init(ROBINHOOD_EXTERNAL=None):
                 rh_obj.set_account_type(
                     name, a["account_number"], a["brokerage_account_type"]
                 )
-                print(
+                printAndDiscord(
                     f"Found {a['brokerage_account_type']} account {maskString(a['account_number'])}"
                 )
         except Exception as e:
-            print(f"Error: Unable to log in to Robinhood: {e}")
+            printAndDiscord(f"Error: Unable to log in to Robinhood: {e}")
             traceback.format_exc()
             return None
-        print(f"Logged in to {name}")
+        printAndDiscord(f"Logged in to {name}")
     return rh_obj
 
 
+def robinhood_check(rho: Brokerage, key: str) -> bool:
+    # Check if a kept session still works
+    obj: rh = rho.get_logged_in_objects(key)
+    login_with_cache(pickle_path="./creds/", pickle_name=key)
+    return bool(obj.account.load_account_profile(dataType="results"))
+
+
+def robinhood_refresh(rho: Brokerage, key: str):
+    # Update account totals of a kept session
+    obj: rh = rho.get_logged_in_objects(key)
+    accounts = rho.get_account_numbers(key)
+    for a in obj.account.load_account_profile(dataType="results"):
+        if a["account_number"] in accounts:
+            rho.set_account_totals(key, a["account_number"], a["portfolio_cash"])
+
+
 def robinhood_holdings(rho: Brokerage, loop=None):
+    positions = {}
     for key in rho.get_account_numbers():
         for account in rho.get_account_numbers(key):
+            checkpoint()
             obj: rh = rho.get_logged_in_objects(key)
             login_with_cache(pickle_path="./creds/", pickle_name=key)
             try:
                 # Get account holdings
-                positions = obj.get_open_stock_positions(account_number=account)
-                if positions != []:
-                    for item in positions:
-                        # Get symbol, quantity, price, and total value
-                        sym = item["symbol"] = obj.get_symbol_by_url(item["instrument"])
-                        qty = float(item["quantity"])
-                        try:
-                            current_price = round(
-                                float(obj.stocks.get_latest_price(sym)[0]), 2
-                            )
-                        except TypeError as e:
-                            if "NoneType" in str(e):
-                                current_price = "N/A"
-                        rho.set_holdings(key, account, sym, qty, current_price)
+                positions[(key, account)] = obj.get_open_stock_positions(
+                    account_number=account
+                )
+                symbols = get_symbols(
+                    obj, [item["instrument"] for item in positions[(key, account)]]
+                )
+                for item in positions[(key, account)]:
+                    item["symbol"] = symbols[item["instrument"]]
             except Exception as e:
                 printAndDiscord(f"{key}: Error getting account holdings: {e}", loop)
                 traceback.format_exc()
+                positions.pop((key, account), None)
                 continue
+    # Get the price of every stock in all accounts at once
+    all_symbols = list(
+        dict.fromkeys(
+            item["symbol"]
+            for items in positions.values()
+            for item in items
+            if item["symbol"]
+        )
+    )
+    prices = {}
+    try:
+        for i in range(0, len(all_symbols), 100):
+            # Quotes for unknown symbols are left out, so match them by symbol
+            for quote in rh.stocks.get_quotes(all_symbols[i : i + 100]) or []:
+                if quote:
+                    # Same price as get_latest_price()
+                    prices[quote["symbol"]] = quote.get(
+                        "last_extended_hours_trade_price"
+                    ) or quote.get("last_trade_price")
+    except Exception as e:
+        printAndDiscord(f"Robinhood: Error getting prices: {e}", loop)
+        traceback.format_exc()
+    for (key, account), items in positions.items():
+        for item in items:
+            # Get symbol, quantity, price, and total value
+            price = prices.get(item["symbol"])
+            current_price = "N/A" if price is None else round(float(price), 2)
+            rho.set_holdings(
+                key, account, item["symbol"], float(item["quantity"]), current_price
+            )
     printHoldings(rho, loop)
 
 
 def robinhood_transaction(rho: Brokerage, orderObj: stockOrder, loop=None):
-    print()
-    print("==============================")
-    print("Robinhood")
-    print("==============================")
-    print()
+    printAndDiscord("")
+    printAndDiscord("==============================")
+    printAndDiscord("Robinhood")
+    printAndDiscord("==============================")
+    printAndDiscord("")
     for s in orderObj.get_stocks():
         for key in rho.get_account_numbers():
             printAndDiscord(
@@ -119,6 +213,7 @@ def robinhood_transaction(rho: Brokerage, orderObj: stockOrder, loop=None):
                 loop,
             )
             for account in rho.get_account_numbers(key):
+                checkpoint()
                 obj: rh = rho.get_logged_in_objects(key)
                 login_with_cache(pickle_path="./creds/", pickle_name=key)
                 print_account = maskString(account)
@@ -138,10 +233,13 @@ def robinhood_transaction(rho: Brokerage, orderObj: stockOrder, loop=None):
                                 f"{key}: Error {orderObj.get_action()}ing {orderObj.get_amount()} of {s} in {print_account}, trying Limit Order",
                                 loop,
                             )
-                            ask = obj.get_latest_price(s, priceType="ask_price")[0]
-                            bid = obj.get_latest_price(s, priceType="bid_price")[0]
+                            quote = cached_quotes(
+                                s, ["ask", "bid"], lambda: robinhood_quote(obj, s)
+                            )
+                            ask = quote["ask"]
+                            bid = quote["bid"]
                             if ask is not None and bid is not None:
-                                print(f"Ask: {ask}, Bid: {bid}")
+                                printAndDiscord(f"Ask: {ask}, Bid: {bid}")
                                 # Add or subtract 1 cent to ask or bid
                                 if orderObj.get_action() == "buy":
                                     price = (
@@ -158,6 +256,15 @@ def robinhood_transaction(rho: Brokerage, orderObj: stockOrder, loop=None):
                                     )
                                     price = round(price - 0.01, 2)
                             else:
+                                emit_order_error(
+                                    rho,
+                                    key,
+                                    print_account,
+                                    orderObj,
+                                    s,
+                                    "No quote",
+                                    loop,
+                                )
                                 printAndDiscord(
                                     f"{key}: Error getting price for {s}", loop
                                 )
@@ -171,6 +278,15 @@ def robinhood_transaction(rho: Brokerage, orderObj: stockOrder, loop=None):
                                 timeInForce="gfd",
                             )
                             if limit_order is None:
+                                emit_order_error(
+                                    rho,
+                                    key,
+                                    print_account,
+                                    orderObj,
+                                    s,
+                                    "Order failed",
+                                    loop,
+                                )
                                 printAndDiscord(
                                     f"{key}: Error {orderObj.get_action()}ing {orderObj.get_amount()} of {s} in {print_account}",
                                     loop,
@@ -179,6 +295,16 @@ def robinhood_transaction(rho: Brokerage, orderObj: stockOrder, loop=None):
                             message = "Success"
                             if limit_order.get("non_field_errors") is not None:
                                 message = limit_order["non_field_errors"]
+                            emit_order(
+                                rho,
+                                key,
+                                print_account,
+                                orderObj,
+                                s,
+                                message,
+                                loop,
+                                price=price,
+                            )
                             printAndDiscord(
                                 f"{key}: {orderObj.get_action()} {orderObj.get_amount()} of {s} in {print_account} @ {price}: {message}",
                                 loop,
@@ -187,14 +313,19 @@ def robinhood_transaction(rho: Brokerage, orderObj: stockOrder, loop=None):
                             message = "Success"
                             if market_order.get("non_field_errors") is not None:
                                 message = market_order["non_field_errors"]
+                            emit_order(
+                                rho, key, print_account, orderObj, s, message, loop
+                            )
                             printAndDiscord(
                                 f"{key}: {orderObj.get_action()} {orderObj.get_amount()} of {s} in {print_account}: {message}",
                                 loop,
                             )
                     except Exception as e:
                         traceback.format_exc()
+                        emit_order_error(rho, key, print_account, orderObj, s, e, loop)
                         printAndDiscord(f"{key} Error submitting order: {e}", loop)
                 else:
+                    emit_order(rho, key, print_account, orderObj, s, "Dry Run", loop)
                     printAndDiscord(
                         f"{key} {print_account} Running in DRY mode. Transaction would've been: {orderObj.get_action()} {orderObj.get_amount()} of {s}",
                         loop,
@@ -8,7 +8,17 @@ from time import sleep
 from dotenv import load_dotenv
 from schwab_api import Schwab
 
-from helperAPI import Brokerage, maskString, printAndDiscord, printHoldings, stockOrder
+from helperAPI import (
+    Brokerage,
+    checkpoint,
+    emit_order,
+    emit_order_error,
+    maskString,
+    parallel_login,
+    printAndDiscord,
+    printHoldings,
+    stockOrder,
+)
 
 
 def schwab_init(SCHWAB_EXTERNAL=None):
@@ -16,7 +26,7 @@ def schwab_init(SCHWAB_EXTERNAL=None):
     load_dotenv()
     # Import Schwab account
     if not os.getenv("SCHWAB") and SCHWAB_EXTERNAL is None:
-        print("Schwab not found, skipping...")
+        printAndDiscord("Schwab not found, skipping...")
         return None
     accounts = (
         os.environ["SCHWAB"].strip().split(",")
@@ -24,11 +34,13 @@ def schwab_init(SCHWAB_EXTERNAL=None):
         else SCHWAB_EXTERNAL.strip().split(",")
     )
     # Log in to Schwab account
-    print("Logging in to Schwab...")
+    printAndDiscord("Logging in to Schwab...")
     schwab_obj = Brokerage("Schwab")
-    for account in accounts:
-        index = accounts.index(account) + 1
+
+    def login_account(index, account):
+        index = index + 1
         name = f"Schwab {index}"
+        login_obj = Brokerage("Schwab")
         try:
             account = account.split(":")
             schwab = Schwab(session_cache=f"./creds/schwab{index}.json")
@@ -40,27 +52,52 @@ def schwab_init(SCHWAB_EXTERNAL=None):
             account_info = schwab.get_account_info_v2()
             account_list = list(account_info.keys())
             print_accounts = [maskString(a) for a in account_list]
-            print(f"The following Schwab accounts were found: {print_accounts}")
-            print("Logged in to Schwab!")
-            schwab_obj.set_logged_in_object(name, schwab)
+            printAndDiscord(
+                f"The following Schwab accounts were found: {print_accounts}"
+            )
+            printAndDiscord("Logged in to Schwab!")
+            login_obj.set_logged_in_object(name, schwab)
             for account in account_list:
-                schwab_obj.set_account_number(name, account)
-                schwab_obj.set_account_totals(
+                login_obj.set_account_number(name, account)
+                login_obj.set_account_totals(
                     name, account, account_info[account]["account_value"]
                 )
         except Exception as e:
-            print(f"Error logging in to Schwab: {e}")
-            print(traceback.format_exc())
+            printAndDiscord(f"Error logging in to Schwab: {e}")
+            printAndDiscord(traceback.format_exc())
             return None
+        return login_obj
+
+    for login_obj in parallel_login(login_account, accounts, "Schwab"):
+        if login_obj is None:
+            return None
+        schwab_obj.merge(login_obj)
     return schwab_obj
 
 
+def schwab_check(schwab_o: Brokerage, key: str) -> bool:
+    # Check if a kept session still works
+    obj: Schwab = schwab_o.get_logged_in_objects(key)
+    return obj.get_account_info_v2() is not None
+
+
+def schwab_refresh(schwab_o: Brokerage, key: str):
+    # Update account totals of a kept session
+    obj: Schwab = schwab_o.get_logged_in_objects(key)
+    account_info = obj.get_account_info_v2()
+    for account in schwab_o.get_account_numbers(key):
+        schwab_o.set_account_totals(
+            key, account, account_info[account]["account_value"]
+        )
+
+
 def schwab_holdings(schwab_o: Brokerage, loop=None):
     # Get holdings on each account
     for key in schwab_o.get_account_numbers():
         obj: Schwab = schwab_o.get_logged_in_objects(key)
         all_holdings = obj.get_account_info_v2()
         for account in schwab_o.get_account_numbers(key):
+            checkpoint()
             try:
                 holdings = all_holdings[account]["positions"]
                 for item in holdings:
@@ -77,16 +114,16 @@ def schwab_holdings(schwab_o: Brokerage, loop=None):
                     schwab_o.set_holdings(key, account, sym, qty, current_price)
             except Exception as e:
                 printAndDiscord(f"{key} {account}: Error getting holdings: {e}", loop)
-                print(traceback.format_exc())
+                printAndDiscord(traceback.format_exc())
     printHoldings(schwab_o, loop)
 
 
 def schwab_transaction(schwab_o: Brokerage, orderObj: stockOrder, loop=None):
-    print()
-    print("==============================")
-    print("Schwab")
-    print("==============================")
-    print()
+    printAndDiscord("")
+    printAndDiscord("==============================")
+    printAndDiscord("Schwab")
+    printAndDiscord("==============================")
+    printAndDiscord("")
     # Buy on each account
     for s in orderObj.get_stocks():
         for key in schwab_o.get_account_numbers():
@@ -96,6 +133,7 @@ def schwab_transaction(schwab_o: Brokerage, orderObj: stockOrder, loop=None):
             )
             obj: Schwab = schwab_o.get_logged_in_objects(key)
             for account in schwab_o.get_account_numbers(key):
+                checkpoint()
                 print_account = maskString(account)
                 # If DRY is True, don't actually make the transaction
                 if orderObj.get_dry():
@@ -140,9 +178,18 @@ def schwab_transaction(schwab_o: Brokerage, orderObj: stockOrder, loop=None):
                             f"{key} account {print_account}: The order verification produced the following messages: {messages}",
                             loop,
                         )
+                    if success:
+                        emit_order(
+                            schwab_o, key, print_account, orderObj, s, "Success", loop
+                        )
+                    else:
+                        emit_order_error(
+                            schwab_o, key, print_account, orderObj, s, messages, loop
+                        )
                 except Exception as e:
+                    emit_order_error(schwab_o, key, print_account, orderObj, s, e, loop)
                     printAndDiscord(
                         f"{key} {print_account}: Error submitting order: {e}", loop
                     )
-                    print(traceback.format_exc())
+                    printAndDiscord(traceback.format_exc())
                 sleep(1)
@@ -21,7 +21,57 @@ from tastytrade.order import (
 from tastytrade.streamer import DXLinkStreamer
 from tastytrade.utils import TastytradeError
 
-from helperAPI import Brokerage, maskString, printAndDiscord, printHoldings, stockOrder
+from helperAPI import (
+    Brokerage,
+    checkpoint,
+    emit_order,
+    emit_order_error,
+    maskString,
+    parallel_login,
+    printAndDiscord,
+    printHoldings,
+    stockOrder,
+)
+
+
+class TastyQuotes:
+    # One DXLink streamer per Tastytrade session, opened the first time it's needed
+    # and subscribed to every stock in the order, keeping each one's last events
+    def __init__(self, tt: Session, stocks: list):
+        self.tt = tt
+        self.stocks = stocks
+        self.streamer = None
+        self.events = {}  # (EventType, symbol): last event
+        self.listeners = []
+
+    async def start(self):
+        self.streamer = await DXLinkStreamer.create(self.tt)
+        for event_type in [EventType.PROFILE, EventType.QUOTE]:
+            await self.streamer.subscribe(event_type, self.stocks)
+            self.listeners.append(asyncio.create_task(self.listen(event_type)))
+
+    async def listen(self, event_type):
+        while True:
+            event = await self.streamer.get_event(event_type)
+            self.events[(event_type, event.eventSymbol)] = event
+
+    async def get(self, stock, timeout=10):
+        # Last profile and quote of the stock, waiting for them if they haven't come yet
+        if self.streamer is None:
+            await self.start()
+        for _ in range(int(timeout / 0.05)):
+            profile = self.events.get((EventType.PROFILE, stock))
+            quote = self.events.get((EventType.QUOTE, stock))
+            if profile is not None and quote is not None:
+                return profile, quote
+            await asyncio.sleep(0.05)
+        raise TastytradeError(f"No quote received for {stock}")
+
+    async def close(self):
+        for listener in self.listeners:
+            listener.cancel()
+        if self.streamer is not None:
+            await self.streamer.close()
 
 
 def order_setup(tt: Session, order_type, stock_price, stock, amount):
@@ -30,7 +80,9 @@ def order_setup(tt: Session, order_type, stock_price, stock, amount):
         leg = symbol.build_leg(D(amount), OrderAction.BUY_TO_OPEN)
         new_order = NewOrder(
             time_in_force=OrderTimeInForce.DAY,
-            order_type=OrderType.MARKET,
+            order_type=(
+                OrderType.LIMIT if order_type[0] == "Limit" else OrderType.MARKET
+            ),
             legs=[leg],
             price=stock_price if order_type[0] == "Limit" else None,
             price_effect=PriceEffect.DEBIT,
@@ -39,7 +91,9 @@ def order_setup(tt: Session, order_type, stock_price, stock, amount):
         leg = symbol.build_leg(D(amount), OrderAction.SELL_TO_CLOSE)
         new_order = NewOrder(
             time_in_force=OrderTimeInForce.DAY,
-            order_type=OrderType.MARKET,
+            order_type=(
+                OrderType.LIMIT if order_type[0] == "Limit" else OrderType.MARKET
+            ),
             legs=[leg],
             price=stock_price if order_type[0] == "Limit" else None,
             price_effect=PriceEffect.CREDIT,
@@ -52,7 +106,7 @@ def tastytrade_init(TASTYTRADE_EXTERNAL=None):
     load_dotenv()
     # Import Tastytrade account
     if not os.getenv("TASTYTRADE") and TASTYTRADE_EXTERNAL is None:
-        print("Tastytrade not found, skipping...")
+        printAndDiscord("Tastytrade not found, skipping...")
         return None
     accounts = (
         os.environ["TASTYTRADE"].strip().split(",")
@@ -61,33 +115,57 @@ def tastytrade_init(TASTYTRADE_EXTERNAL=None):
     )
     tasty_obj = Brokerage("Tastytrade")
     # Log in to Tastytrade account
-    print("Logging in to Tastytrade...")
-    for account in accounts:
-        index = accounts.index(account) + 1
+    printAndDiscord("Logging in to Tastytrade...")
+
+    def login_account(index, account):
+        index = index + 1
         account = account.strip().split(":")
         name = f"Tastytrade {index}"
+        login_obj = Brokerage("Tastytrade")
         try:
             tasty = Session(account[0], account[1])
-            tasty_obj.set_logged_in_object(name, tasty, "session")
+            login_obj.set_logged_in_object(name, tasty, "session")
             an = Account.get_accounts(tasty)
-            tasty_obj.set_logged_in_object(name, an, "accounts")
+            login_obj.set_logged_in_object(name, an, "accounts")
             for acct in an:
-                tasty_obj.set_account_number(name, acct.account_number)
-                tasty_obj.set_account_totals(
+                login_obj.set_account_number(name, acct.account_number)
+                login_obj.set_account_totals(
                     name, acct.account_number, acct.get_balances(tasty).cash_balance
                 )
-            print("Logged in to Tastytrade!")
+            printAndDiscord("Logged in to Tastytrade!")
         except Exception as e:
-            traceback.print_exc()
-            print(f"Error logging in to {name}: {e}")
+            printAndDiscord(traceback.format_exc())
+            printAndDiscord(f"Error logging in to {name}: {e}")
             return None
+        return login_obj
+
+    for login_obj in parallel_login(login_account, accounts, "Tastytrade"):
+        if login_obj is None:
+            return None
+        tasty_obj.merge(login_obj)
     return tasty_obj
 
 
+def tastytrade_check(tt_o: Brokerage, key: str) -> bool:
+    # Check if a kept session still works
+    obj: Session = tt_o.get_logged_in_objects(key, "session")
+    return obj.validate()
+
+
+def tastytrade_refresh(tt_o: Brokerage, key: str):
+    # Update account totals of a kept session
+    obj: Session = tt_o.get_logged_in_objects(key, "session")
+    for acct in tt_o.get_logged_in_objects(key, "accounts"):
+        tt_o.set_account_totals(
+            key, acct.account_number, acct.get_balances(obj).cash_balance
+        )
+
+
 def tastytrade_holdings(tt_o: Brokerage, loop=None):
     for key in tt_o.get_account_numbers():
         obj: Session = tt_o.get_logged_in_objects(key, "session")
         for index, account in enumerate(tt_o.get_logged_in_objects(key, "accounts")):
+            checkpoint()
             try:
                 an = tt_o.get_account_numbers(key)[index]
                 positions = account.get_positions(obj)
@@ -101,17 +179,32 @@ def tastytrade_holdings(tt_o: Brokerage, loop=None):
                     )
             except Exception as e:
                 printAndDiscord(f"{key}: Error getting account holdings: {e}", loop)
-                print(traceback.format_exc())
+                printAndDiscord(traceback.format_exc())
                 continue
     printHoldings(tt_o, loop=loop)
 
 
 async def tastytrade_execute(tt_o: Brokerage, orderObj: stockOrder, loop=None):
-    print()
-    print("==============================")
-    print("Tastytrade")
-    print("==============================")
-    print()
+    printAndDiscord("")
+    printAndDiscord("==============================")
+    printAndDiscord("Tastytrade")
+    printAndDiscord("==============================")
+    printAndDiscord("")
+    # Streamers are only opened if an order is rejected
+    quotes = {
+        key: TastyQuotes(
+            tt_o.get_logged_in_objects(key, "session"), orderObj.get_stocks()
+        )
+        for key in tt_o.get_account_numbers()
+    }
+    try:
+        await place_orders(tt_o, orderObj, quotes, loop)
+    finally:
+        for key_quotes in quotes.values():
+            await key_quotes.close()
+
+
+async def place_orders(tt_o: Brokerage, orderObj: stockOrder, quotes: dict, loop=None):
     for s in orderObj.get_stocks():
         for key in tt_o.get_account_numbers():
             obj: Session = tt_o.get_logged_in_objects(key, "session")
@@ -121,6 +214,7 @@ async def tastytrade_execute(tt_o: Brokerage, orderObj: stockOrder, loop=None):
                 loop=loop,
             )
             for i, acct in enumerate(tt_o.get_account_numbers(key)):
+                checkpoint()
                 print_account = maskString(acct)
                 try:
                     acct: Account = accounts[i]
@@ -142,11 +236,15 @@ async def tastytrade_execute(tt_o: Brokerage, orderObj: stockOrder, loop=None):
                         )
                         order_status = placed_order.order.status.value
                     except Exception as e:
+                        emit_order_error(tt_o, key, print_account, orderObj, s, e, loop)
                         printAndDiscord(
                             f"{key} {print_account}: Error placing order: {e}",
                             loop=loop,
                         )
                         continue
+                    emit_order(
+                        tt_o, key, print_account, orderObj, s, order_status, loop
+                    )
                     # Check order status
                     if order_status in ["Received", "Routed"]:
                         message = f"{key} {print_account}: {orderObj.get_action()} {orderObj.get_amount()} of {s} Order: {placed_order.order.id} Status: {order_status}"
@@ -155,11 +253,7 @@ async def tastytrade_execute(tt_o: Brokerage, orderObj: stockOrder, loop=None):
                         printAndDiscord(message, loop=loop)
                     elif order_status == "Rejected":
                         # Retry with limit order
-                        streamer = await DXLinkStreamer.create(obj)
-                        stock_limit = await streamer.subscribe(EventType.PROFILE, [s])
-                        stock_quote = await streamer.subscribe(EventType.QUOTE, [s])
-                        stock_limit = await streamer.get_event(EventType.PROFILE)
-                        stock_quote = await streamer.get_event(EventType.QUOTE)
+                        stock_limit, stock_quote = await quotes[key].get(s)
                         printAndDiscord(
                             f"{key} {print_account} Error: {order_status} Trying Limit order...",
                             loop=loop,
@@ -172,7 +266,7 @@ async def tastytrade_execute(tt_o: Brokerage, orderObj: stockOrder, loop=None):
                                 if stock_limit.is_nan()
                                 else stock_limit
                             )
-                            order_type = ["Market", "Debit", "Buy to Open"]
+                            order_type = ["Limit", "Debit", "Buy to Open"]
                         elif orderObj.get_action() == "sell":
                             stock_limit = D(stock_limit.lowLimitPrice)
                             stock_price = (
@@ -180,8 +274,8 @@ async def tastytrade_execute(tt_o: Brokerage, orderObj: stockOrder, loop=None):
                                 if stock_limit.is_nan()
                                 else stock_limit
                             )
-                            order_type = ["Market", "Credit", "Sell to Close"]
-                        print(f"{s} limit price is: ${round(stock_price, 2)}")
+                            order_type = ["Limit", "Credit", "Sell to Close"]
+                        printAndDiscord(f"{s} limit price is: ${round(stock_price, 2)}")
                         # Retry order
                         new_order = order_setup(
                             obj, order_type, stock_price, s, orderObj.get_amount()
@@ -189,6 +283,17 @@ async def tastytrade_execute(tt_o: Brokerage, orderObj: stockOrder, loop=None):
                         placed_order = acct.place_order(
                             obj, new_order, dry_run=orderObj.get_dry()
                         )
+                        order_status = placed_order.order.status.value
+                        emit_order(
+                            tt_o,
+                            key,
+                            print_account,
+                            orderObj,
+                            s,
+                            order_status,
+                            loop,
+                            price=float(stock_price),
+                        )
                         # Check order status
                         if order_status in ["Received", "Routed"]:
                             message = f"{key} {print_account}: {orderObj.get_action()} {orderObj.get_amount()} of {s} Order: {placed_order.order.id} Status: {order_status}"
@@ -202,6 +307,7 @@ async def tastytrade_execute(tt_o: Brokerage, orderObj: stockOrder, loop=None):
                                 loop=loop,
                             )
                 except (TastytradeError, KeyError) as te:
+                    emit_order_error(tt_o, key, print_account, orderObj, s, te, loop)
                     printAndDiscord(f"{key} {print_account}: Error: {te}", loop=loop)
                     continue
 
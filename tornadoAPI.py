@@ -13,6 +13,9 @@ from selenium.webdriver.support.wait import WebDriverWait
 from helperAPI import (
     Brokerage,
     check_if_page_loaded,
+    checkpoint,
+    emit_order,
+    emit_order_error,
     getDriver,
     killSeleniumDriver,
     printAndDiscord,
@@ -32,7 +35,7 @@ def tornado_init(TORNADO_EXTERNAL=None, DOCKER=False, loop=None):
     load_dotenv()
 
     if not os.getenv("TORNADO") and TORNADO_EXTERNAL is None:
-        print("Tornado not found, skipping...")
+        printAndDiscord("Tornado not found, skipping...")
         return None
 
     if TORNADO_EXTERNAL is None:
@@ -152,14 +155,36 @@ def tornado_extract_holdings(driver):
     return holdings_data
 
 
+def tornado_check(Tornado_o: Brokerage, key: str) -> bool:
+    # Check if a kept browser is still open
+    driver: webdriver = Tornado_o.get_logged_in_objects(key)
+    return driver.current_url is not None
+
+
+def tornado_refresh(Tornado_o: Brokerage, key: str):
+    # Reload the dashboard so a kept browser shows current totals and holdings
+    driver: webdriver = Tornado_o.get_logged_in_objects(key)
+    driver.get("https://tornado.com/app/")
+    WebDriverWait(driver, 30).until(check_if_page_loaded)
+    WebDriverWait(driver, 60).until(
+        EC.presence_of_element_located(
+            (
+                By.XPATH,
+                "//*[@id='main-router']/div/div/div/div[1]/div/div/div/div[1]/div[1]/div/span",
+            )
+        )
+    )
+
+
 def tornado_holdings(Tornado_o: Brokerage, loop=None):
     try:
         # Ensure we are using the correct account name
         account_names = Tornado_o.get_account_numbers()
         for account_name in account_names:
+            checkpoint()
             driver: webdriver = Tornado_o.get_logged_in_objects(account_name)
 
-            print(f"Processing holdings for {account_name}")
+            printAndDiscord(f"Processing holdings for {account_name}")
 
             # Fetch the total account value
             account_value_element = WebDriverWait(driver, 60).until(
@@ -177,7 +202,9 @@ def tornado_holdings(Tornado_o: Brokerage, loop=None):
             holdings_data = tornado_extract_holdings(driver)
 
             if not holdings_data:
-                print(f"No holdings found for {account_name}. Skipping account.")
+                printAndDiscord(
+                    f"No holdings found for {account_name}. Skipping account."
+                )
                 continue  # Skip to the next account
 
             for holding in holdings_data:
@@ -203,12 +230,13 @@ def tornado_holdings(Tornado_o: Brokerage, loop=None):
 
 
 def tornado_transaction(Tornado_o: Brokerage, orderObj: stockOrder, loop=None):
-    print("\n==============================")
-    print("Tornado")
-    print("==============================\n")
+    printAndDiscord("\n==============================")
+    printAndDiscord("Tornado")
+    printAndDiscord("==============================\n")
 
     for s in orderObj.get_stocks():
         for key in Tornado_o.get_account_numbers():
+            checkpoint()
             driver = Tornado_o.get_logged_in_objects(key)
 
             # Ensure we are on the Tornado dashboard or navigate to it
@@ -219,6 +247,7 @@ def tornado_transaction(Tornado_o: Brokerage, orderObj: stockOrder, loop=None):
                     WebDriverWait(driver, 30).until(check_if_page_loaded)
             except Exception as e:
                 tornado_error(driver, loop)
+                emit_order_error(Tornado_o, key, key, orderObj, s, e, loop)
                 printAndDiscord(f"Failed to navigate to dashboard for {key}: {e}", loop)
                 continue
 
@@ -234,6 +263,9 @@ def tornado_transaction(Tornado_o: Brokerage, orderObj: stockOrder, loop=None):
                 search_field.send_keys(s)
             except TimeoutException:
                 tornado_error(driver, loop)
+                emit_order_error(
+                    Tornado_o, key, key, orderObj, s, "Search field not found", loop
+                )
                 printAndDiscord(f"Tornado search field not found for {s}.", loop)
                 continue
 
@@ -254,6 +286,9 @@ def tornado_transaction(Tornado_o: Brokerage, orderObj: stockOrder, loop=None):
                 sleep(2)
 
                 if total_items == 0:
+                    emit_order_error(
+                        Tornado_o, key, key, orderObj, s, "Stock not found", loop
+                    )
                     printAndDiscord(f"Tornado doesn't have {s}.", loop)
                     continue
 
@@ -267,18 +302,29 @@ def tornado_transaction(Tornado_o: Brokerage, orderObj: stockOrder, loop=None):
                         break
 
                 if not found_stock:
+                    emit_order_error(
+                        Tornado_o, key, key, orderObj, s, "Stock not found", loop
+                    )
                     printAndDiscord(f"Tornado doesn't have {s}.", loop)
                     continue
             except TimeoutException:
                 tornado_error(driver, loop)
+                emit_order_error(
+                    Tornado_o, key, key, orderObj, s, "No search results", loop
+                )
                 printAndDiscord(f"Tornado search results did not appear for {s}.", loop)
                 continue
 
             # Proceed with the transaction based on the action (buy/sell)
             if orderObj.get_action() == "buy":
-                handle_buy(driver, s, orderObj, loop)
-            elif orderObj.get_action() == "sell":
-                handle_sell(driver, s, orderObj, loop)
+                placed = handle_buy(driver, s, orderObj, loop)
+            else:
+                placed = handle_sell(driver, s, orderObj, loop)
+            if placed:
+                status = "Dry Run" if orderObj.get_dry() else "Success"
+                emit_order(Tornado_o, key, key, orderObj, s, status, loop)
+            else:
+                emit_order_error(Tornado_o, key, key, orderObj, s, "Order failed", loop)
 
             # Ensure to return to the dashboard after every transaction
             try:
@@ -305,14 +351,14 @@ def tornado_transaction(Tornado_o: Brokerage, orderObj: stockOrder, loop=None):
                     f"Tornado failed to return to dashboard after processing {s}.", loop
                 )
 
-    print("Completed all transactions, Exiting...")
+    printAndDiscord("Completed all transactions, Exiting...")
     killSeleniumDriver(Tornado_o)
 
 
 def handle_buy(driver, stock, orderObj, loop):
     DRY = orderObj.get_dry()
     QUANTITY = orderObj.get_amount()
-    print("DRY MODE:", DRY)
+    printAndDiscord(f"DRY MODE: {DRY}")
 
     try:
         buy_button = WebDriverWait(driver, 20).until(
@@ -322,7 +368,7 @@ def handle_buy(driver, stock, orderObj, loop):
     except TimeoutException:
         tornado_error(driver, loop)
         printAndDiscord(f"Tornado buy button not found for {stock}.", loop)
-        return
+        return False
 
     try:
         quant = WebDriverWait(driver, 20).until(
@@ -335,7 +381,7 @@ def handle_buy(driver, stock, orderObj, loop):
     except TimeoutException:
         tornado_error(driver, loop)
         printAndDiscord(f"Tornado failed to enter quantity for {stock}.", loop)
-        return
+        return False
 
     try:
         current_shares_element = driver.find_element(
@@ -369,7 +415,7 @@ def handle_buy(driver, stock, orderObj, loop):
     except TimeoutException:
         tornado_error(driver, loop)
         printAndDiscord(f"Tornado failed to select market order for {stock}.", loop)
-        return
+        return False
 
     try:
         sleep(3)
@@ -387,13 +433,13 @@ def handle_buy(driver, stock, orderObj, loop):
                 printAndDiscord(
                     f"Tornado: Invalid price format for {stock}: {cost}", loop
                 )
-                return
+                return False
         else:
             printAndDiscord(
                 f"Tornado: Price not available or in an unexpected format for {stock}: {cost}",
                 loop,
             )
-            return
+            return False
 
         # Check if the available buying power is enough
         if buy_power_float < cost_float:
@@ -402,14 +448,14 @@ def handle_buy(driver, stock, orderObj, loop):
                 f"Tornado insufficient funds to buy {stock}. Required: ${cost_float}, Available: ${buy_power_float}",
                 loop,
             )
-            return
+            return False
 
     except TimeoutException:
         tornado_error(driver, loop)
         printAndDiscord(
             f"Tornado failed to fetch buying power or cost for {stock}.", loop
         )
-        return
+        return False
 
     if not DRY:
         try:
@@ -439,12 +485,14 @@ def handle_buy(driver, stock, orderObj, loop):
                 f"Tornado failed to submit buy order for {stock} or click Continue.",
                 loop,
             )
+            return False
     else:
         sleep(5)
         printAndDiscord(
             f"DRY MODE: Simulated order BUY for {QUANTITY} shares of {stock} at {cost}",
             loop,
         )
+    return True
 
 
 def handle_sell(driver, stock, orderObj, loop):
@@ -459,7 +507,7 @@ def handle_sell(driver, stock, orderObj, loop):
     except TimeoutException:
         tornado_error(driver, loop)
         printAndDiscord(f"Tornado sell button not found for {stock}.", loop)
-        return
+        return False
 
     try:
         current_shares_element = driver.find_element(
@@ -468,14 +516,14 @@ def handle_sell(driver, stock, orderObj, loop):
         current_shares = float(current_shares_element.text.strip().replace(" sh", ""))
     except NoSuchElementException:
         printAndDiscord(f"Tornado no current shares to sell for {stock}.", loop)
-        return
+        return False
 
     if QUANTITY > current_shares:
         printAndDiscord(
             f"Tornado not enough shares to sell {stock}. Available: {current_shares}",
             loop,
         )
-        return
+        return False
 
     try:
         quant = WebDriverWait(driver, 20).until(
@@ -488,7 +536,7 @@ def handle_sell(driver, stock, orderObj, loop):
     except TimeoutException:
         tornado_error(driver, loop)
         printAndDiscord(f"Tornado failed to enter quantity for {stock}.", loop)
-        return
+        return False
 
     try:
         market_order_option = WebDriverWait(driver, 20).until(
@@ -500,7 +548,7 @@ def handle_sell(driver, stock, orderObj, loop):
     except TimeoutException:
         tornado_error(driver, loop)
         printAndDiscord(f"Tornado failed to select market order for {stock}.", loop)
-        return
+        return False
 
     try:
         sell_price = driver.find_element(
@@ -509,7 +557,7 @@ def handle_sell(driver, stock, orderObj, loop):
     except TimeoutException:
         tornado_error(driver, loop)
         printAndDiscord(f"Tornado failed to fetch sell price for {stock}.", loop)
-        return
+        return False
 
     if not DRY:
         try:
@@ -537,8 +585,10 @@ def handle_sell(driver, stock, orderObj, loop):
                 f"Tornado failed to submit sell order for {stock} or click Continue.",
                 loop,
             )
+            return False
     else:
         printAndDiscord(
             f"DRY MODE: Simulated order SELL for {QUANTITY} shares of {stock} at {sell_price}",
             loop,
         )
+    return True
@@ -9,7 +9,17 @@ from time import sleep
 import requests
 from dotenv import load_dotenv
 
-from helperAPI import Brokerage, maskString, printAndDiscord, printHoldings, stockOrder
+from helperAPI import (
+    Brokerage,
+    checkpoint,
+    emit_order,
+    emit_order_error,
+    maskString,
+    parallel_login,
+    printAndDiscord,
+    printHoldings,
+    stockOrder,
+)
 
 
 def make_request(
@@ -46,9 +56,9 @@ def make_request(
         sleep(0.1)
         return json_response
     except Exception as e:
-        print(f"Error making request to Tradier API {endpoint}: {e}")
-        print(f"Response: {response}")
-        print(traceback.format_exc())
+        printAndDiscord(f"Error making request to Tradier API {endpoint}: {e}")
+        printAndDiscord(f"Response: {response}")
+        printAndDiscord(traceback.format_exc())
         sleep(1)
         return None
 
@@ -58,7 +68,7 @@ def tradier_init(TRADIER_EXTERNAL=None):
     load_dotenv()
     # Import Tradier account
     if not os.getenv("TRADIER") and TRADIER_EXTERNAL is None:
-        print("Tradier not found, skipping...")
+        printAndDiscord("Tradier not found, skipping...")
         return None
     # Get access token and split into list
     accounts = (
@@ -68,18 +78,20 @@ def tradier_init(TRADIER_EXTERNAL=None):
     )
     # Login to each account
     tradier_obj = Brokerage("Tradier")
-    print("Logging in to Tradier...")
-    for account in accounts:
-        name = f"Tradier {accounts.index(account) + 1}"
+    printAndDiscord("Logging in to Tradier...")
+
+    def login_account(index, account):
+        name = f"Tradier {index + 1}"
+        login_obj = Brokerage("Tradier")
         json_response = make_request("user/profile", account)
         if json_response is None:
-            continue
+            return None
         # Multiple accounts have different JSON structure
         if "'account': {'" in str(json_response):
             account_num = 1
         else:
             account_num = len(json_response["profile"]["account"])
-        print(f"Tradier accounts found: {account_num}")
+        printAndDiscord(f"Tradier accounts found: {account_num}")
         for x in range(account_num):
             if account_num == 1:
                 an = json_response["profile"]["account"]["account_number"]
@@ -87,28 +99,80 @@ def tradier_init(TRADIER_EXTERNAL=None):
             else:
                 an = json_response["profile"]["account"][x]["account_number"]
                 at = json_response["profile"]["account"][x]["type"]
-            print(maskString(an))
-            tradier_obj.set_account_number(name, an)
-            tradier_obj.set_account_type(name, an, at)
+            printAndDiscord(maskString(an))
+            login_obj.set_account_number(name, an)
+            login_obj.set_account_type(name, an, at)
             # Get balances
             json_balances = make_request(f"accounts/{an}/balances", account)
             if json_balances is None:
-                tradier_obj.set_account_totals(name, an, 0)
+                login_obj.set_account_totals(name, an, 0)
                 continue
-            tradier_obj.set_account_totals(
+            login_obj.set_account_totals(
                 name, an, json_balances["balances"]["total_equity"]
             )
         # Get balances
-        tradier_obj.set_logged_in_object(name, account)
-    print("Logged in to Tradier!")
+        login_obj.set_logged_in_object(name, account)
+        return login_obj
+
+    for login_obj in parallel_login(login_account, accounts, "Tradier"):
+        tradier_obj.merge(login_obj)
+    printAndDiscord("Logged in to Tradier!")
     return tradier_obj
 
 
+def tradier_check(tradier_o: Brokerage, key: str) -> bool:
+    # Check if a kept session still works
+    obj: str = tradier_o.get_logged_in_objects(key)
+    return make_request("user/profile", obj) is not None
+
+
+def tradier_refresh(tradier_o: Brokerage, key: str):
+    # Update account totals of a kept session
+    obj: str = tradier_o.get_logged_in_objects(key)
+    for account in tradier_o.get_account_numbers(key):
+        json_balances = make_request(f"accounts/{account}/balances", obj)
+        if json_balances is None:
+            raise Exception(f"Unable to get balances for {maskString(account)}")
+        tradier_o.set_account_totals(
+            key, account, json_balances["balances"]["total_equity"]
+        )
+
+
+def as_list(value) -> list:
+    # Tradier returns a single item on its own instead of in a list
+    if value is None or value == "null":
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def get_quotes(symbols: list, BEARER_TOKEN, chunk_size=100) -> dict:
+    # Last price of each symbol, with many symbols in one request
+    prices = {}
+    symbols = list(dict.fromkeys(symbols))
+    for i in range(0, len(symbols), chunk_size):
+        json_response = make_request(
+            "markets/quotes",
+            BEARER_TOKEN,
+            params={
+                "symbols": ",".join(symbols[i : i + chunk_size]),
+                "greeks": "false",
+            },
+        )
+        if json_response is None:
+            continue
+        for quote in as_list(json_response["quotes"].get("quote")):
+            if quote.get("last") is not None:
+                prices[quote["symbol"]] = quote["last"]
+    return prices
+
+
 def tradier_holdings(tradier_o: Brokerage, loop=None):
     # Loop through accounts
     for key in tradier_o.get_account_numbers():
+        obj: str = tradier_o.get_logged_in_objects(key)
+        positions = {}
         for account_number in tradier_o.get_account_numbers(key):
-            obj: str = tradier_o.get_logged_in_objects(key)
+            checkpoint()
             try:
                 # Get holdings from API
                 json_response = make_request(
@@ -116,56 +180,47 @@ def tradier_holdings(tradier_o: Brokerage, loop=None):
                 )
                 if json_response is None:
                     continue
-                stocks = []
-                amounts = []
-                # Check if there are no holdings
-                if json_response["positions"] == "null":
-                    continue
-                # Check if there's only one holding
-                if "symbol" in json_response["positions"]["position"]:
-                    stocks.append(json_response["positions"]["position"]["symbol"])
-                    amounts.append(json_response["positions"]["position"]["quantity"])
-                else:
-                    # Loop through holdings
-                    for stock in json_response["positions"]["position"]:
-                        stocks.append(stock["symbol"])
-                        amounts.append(stock["quantity"])
-                # Get current price of each stock
-                current_price = []
-                for sym in stocks:
-                    price_response = make_request(
-                        "markets/quotes",
-                        obj,
-                        params={"symbols": sym, "greeks": "false"},
-                    )
-                    if (
-                        price_response is None
-                        or price_response["quotes"].get("quote") is None
-                        or price_response["quotes"]["quote"].get("last") is None
-                    ):
-                        current_price.append(0)
-                    else:
-                        current_price.append(price_response["quotes"]["quote"]["last"])
-                # Print and send them
-                for position in stocks:
-                    # Set index for easy use
-                    i = stocks.index(position)
-                    tradier_o.set_holdings(
-                        key, account_number, position, amounts[i], current_price[i]
-                    )
+                positions[account_number] = as_list(
+                    json_response["positions"]["position"]
+                    if json_response["positions"] != "null"
+                    else None
+                )
             except Exception as e:
                 printAndDiscord(f"{key}: Error getting holdings: {e}", loop=loop)
-                print(traceback.format_exc())
+                printAndDiscord(traceback.format_exc())
                 continue
+        # Get current price of every stock in all accounts at once
+        try:
+            current_price = get_quotes(
+                [
+                    position["symbol"]
+                    for account_positions in positions.values()
+                    for position in account_positions
+                ],
+                obj,
+            )
+        except Exception as e:
+            printAndDiscord(f"{key}: Error getting prices: {e}", loop=loop)
+            printAndDiscord(traceback.format_exc())
+            current_price = {}
+        for account_number, account_positions in positions.items():
+            for position in account_positions:
+                tradier_o.set_holdings(
+                    key,
+                    account_number,
+                    position["symbol"],
+                    position["quantity"],
+                    current_price.get(position["symbol"], 0),
+                )
     printHoldings(tradier_o, loop=loop)
 
 
 def tradier_transaction(tradier_o: Brokerage, orderObj: stockOrder, loop=None):
-    print()
-    print("==============================")
-    print("Tradier")
-    print("==============================")
-    print()
+    printAndDiscord("")
+    printAndDiscord("==============================")
+    printAndDiscord("Tradier")
+    printAndDiscord("==============================")
+    printAndDiscord("")
     # Loop through accounts
     for s in orderObj.get_stocks():
         for key in tradier_o.get_account_numbers():
@@ -174,10 +229,20 @@ def tradier_transaction(tradier_o: Brokerage, orderObj: stockOrder, loop=None):
                 loop=loop,
             )
             for account in tradier_o.get_account_numbers(key):
+                checkpoint()
                 obj: str = tradier_o.get_logged_in_objects(key)
                 print_account = maskString(account)
                 # Tradier doesn't support fractional shares
                 if not orderObj.get_amount().is_integer():
+                    emit_order_error(
+                        tradier_o,
+                        key,
+                        print_account,
+                        orderObj,
+                        s,
+                        "Fractional shares not supported",
+                        loop,
+                    )
                     printAndDiscord(
                         f"Tradier account {print_account} Error: Fractional share {orderObj.get_amount()} not supported",
                         loop=loop,
@@ -197,29 +262,64 @@ def tradier_transaction(tradier_o: Brokerage, orderObj: stockOrder, loop=None):
                             f"accounts/{account}/orders", obj, data=data, method="POST"
                         )
                         if json_response is None:
+                            emit_order_error(
+                                tradier_o,
+                                key,
+                                print_account,
+                                orderObj,
+                                s,
+                                "No response",
+                                loop,
+                            )
                             printAndDiscord(
                                 f"Tradier account {print_account} Error: JSON response is None",
                                 loop=loop,
                             )
                             continue
                         if json_response.get("order", {}).get("status") is not None:
+                            emit_order(
+                                tradier_o,
+                                key,
+                                print_account,
+                                orderObj,
+                                s,
+                                json_response["order"]["status"],
+                                loop,
+                            )
                             printAndDiscord(
                                 f"Tradier account {print_account}: {orderObj.get_action()} {orderObj.get_amount()} of {s}: {json_response['order']['status']}",
                                 loop=loop,
                             )
                             continue
+                        emit_order_error(
+                            tradier_o,
+                            key,
+                            print_account,
+                            orderObj,
+                            s,
+                            "Order did not route",
+                            loop,
+                        )
                         printAndDiscord(
                             f"Tradier account {print_account} Error: This order did not route. JSON response: {json.dumps(json_response, indent=2)}",
                             loop=loop,
                         )
                     except Exception as e:
+                        emit_order_error(
+                            tradier_o, key, print_account, orderObj, s, e, loop
+                        )
                         printAndDiscord(
                             f"Tradier account {print_account} Error: {e}", loop=loop
                         )
-                        print(traceback.format_exc())
-                        print(f"JSON response: {json.dumps(json_response, indent=2)}")
+                        printAndDiscord(traceback.format_exc())
+                        printAndDiscord(
+                            f"JSON response: {json.dumps(json_response, indent=2)}"
+                        )
                         continue
                 else:
+                    emit_order(
+                        tradier_o, key, print_account, orderObj, s, "Dry Run", loop
+                    )
                     printAndDiscord(
                         f"Tradier account {print_account}: Running in DRY mode. Trasaction would've been: {orderObj.get_action()} {orderObj.get_amount()} of {s}",
                         loop=loop,
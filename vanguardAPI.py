@@ -1,7 +1,6 @@
 # Donald Ryan Gullett(MaxxRK)
 # Vanguard API
 
-import asyncio
 import os
 import pprint
 import traceback
@@ -12,11 +11,19 @@ from vanguard import order, session
 
 from helperAPI import (
     Brokerage,
-    getOTPCodeDiscord,
+    cached_quote,
+    checkpoint,
+    emit_order,
+    emit_order_error,
+    finish_schedule,
+    getOTPCode,
     maskString,
+    parallel_login,
     printAndDiscord,
     printHoldings,
+    register_cleanup,
     stockOrder,
+    wait_for_schedule,
 )
 
 
@@ -25,7 +32,7 @@ def vanguard_run(orderObj: stockOrder, command=None, botObj=None, loop=None):
     load_dotenv()
     # Import Vanguard account
     if not os.getenv("VANGUARD"):
-        print("Vanguard not found, skipping...")
+        printAndDiscord("Vanguard not found, skipping...")
         return None
     accounts = os.environ["VANGUARD"].strip().split(",")
     # Get headless flag
@@ -33,27 +40,32 @@ def vanguard_run(orderObj: stockOrder, command=None, botObj=None, loop=None):
     # Set the functions to be run
     _, second_command = command
 
-    for account in accounts:
-        index = accounts.index(account) + 1
+    def run_account(index, account):
         success = vanguard_init(
             account=account,
-            index=index,
+            index=index + 1,
             headless=headless,
             botObj=botObj,
             loop=loop,
         )
         if success is not None:
-            orderObj.set_logged_in(success, "vanguard")
             if second_command == "_holdings":
                 vanguard_holdings(success, loop=loop)
-            else:
+            elif wait_for_schedule(orderObj, f"Vanguard {index + 1}", loop):
                 vanguard_transaction(success, orderObj, loop=loop)
+                finish_schedule(orderObj, f"Vanguard {index + 1}")
+        return success
+
+    vanguard_obj = Brokerage("VANGUARD")
+    for login_obj in parallel_login(run_account, accounts, "Vanguard"):
+        vanguard_obj.merge(login_obj)
+    orderObj.set_logged_in(vanguard_obj, "vanguard")
     return None
 
 
 def vanguard_init(account, index, headless=True, botObj=None, loop=None):
     # Log in to Vanguard account
-    print("Logging in to Vanguard...")
+    printAndDiscord("Logging in to Vanguard...")
     vanguard_obj = Brokerage("VANGUARD")
     name = f"Vanguard {index}"
     try:
@@ -65,24 +77,18 @@ def vanguard_init(account, index, headless=True, botObj=None, loop=None):
             profile_path="./creds",
             debug=debug,
         )
+        register_cleanup(vg_session.close_browser, same_thread=True)
         need_second = vg_session.login(account[0], account[1], account[2])
         if need_second:
-            if botObj is None and loop is None:
-                vg_session.login_two(input("Enter code: "))
-            else:
-                sms_code = asyncio.run_coroutine_threadsafe(
-                    getOTPCodeDiscord(botObj, name, timeout=120, loop=loop), loop
-                ).result()
-                if sms_code is None:
-                    raise Exception(
-                        f"Vanguard {index} code not received in time...", loop
-                    )
-                vg_session.login_two(sms_code)
+            sms_code = getOTPCode(botObj, name, timeout=120, loop=loop)
+            if sms_code is None:
+                raise Exception(f"Vanguard {index} code not received in time...", loop)
+            vg_session.login_two(sms_code)
         all_accounts = vg_account.AllAccount(vg_session)
         success = all_accounts.get_account_ids()
         if not success:
             raise Exception("Error getting account details")
-        print("Logged in to Vanguard!")
+        printAndDiscord("Logged in to Vanguard!")
         vanguard_obj.set_logged_in_object(name, vg_session)
         print_accounts = []
         for acct in all_accounts.account_totals:
@@ -91,11 +97,11 @@ def vanguard_init(account, index, headless=True, botObj=None, loop=None):
                 name, acct, all_accounts.account_totals[acct]
             )
             print_accounts.append(acct)
-        print(f"The following Vanguard accounts were found: {print_accounts}")
+        printAndDiscord(f"The following Vanguard accounts were found: {print_accounts}")
     except Exception as e:
         vg_session.close_browser()
-        print(f"Error logging in to Vanguard: {e}")
-        print(traceback.format_exc())
+        printAndDiscord(f"Error logging in to Vanguard: {e}")
+        printAndDiscord(traceback.format_exc())
         return None
     return vanguard_obj
 
@@ -103,6 +109,7 @@ def vanguard_init(account, index, headless=True, botObj=None, loop=None):
 def vanguard_holdings(vanguard_o: Brokerage, loop=None):
     # Get holdings on each account
     for key in vanguard_o.get_account_numbers():
+        checkpoint()
         try:
             obj: session.VanguardSession = vanguard_o.get_logged_in_objects(key)
             all_accounts = vg_account.AllAccount(obj)
@@ -128,18 +135,18 @@ def vanguard_holdings(vanguard_o: Brokerage, loop=None):
         except Exception as e:
             obj.close_browser()
             printAndDiscord(f"{key} {account}: Error getting holdings: {e}", loop)
-            print(traceback.format_exc())
+            printAndDiscord(traceback.format_exc())
             continue
         printHoldings(vanguard_o, loop)
     obj.close_browser()
 
 
 def vanguard_transaction(vanguard_o: Brokerage, orderObj: stockOrder, loop=None):
-    print()
-    print("==============================")
-    print("Vanguard")
-    print("==============================")
-    print()
+    printAndDiscord("")
+    printAndDiscord("==============================")
+    printAndDiscord("Vanguard")
+    printAndDiscord("==============================")
+    printAndDiscord("")
     # Buy on each account
     for s in orderObj.get_stocks():
         for key in vanguard_o.get_account_numbers():
@@ -149,6 +156,7 @@ def vanguard_transaction(vanguard_o: Brokerage, orderObj: stockOrder, loop=None)
             )
             try:
                 for account in vanguard_o.get_account_numbers(key):
+                    checkpoint()
                     print_account = maskString(account)
                     obj: session.VanguardSession = vanguard_o.get_logged_in_objects(key)
                     # If DRY is True, don't actually make the transaction
@@ -172,7 +180,9 @@ def vanguard_transaction(vanguard_o: Brokerage, orderObj: stockOrder, loop=None)
                         dry_run=orderObj.get_dry(),
                         after_hours=True,
                     )
-                    print("The order verification produced the following messages: ")
+                    printAndDiscord(
+                        "The order verification produced the following messages: "
+                    )
                     if (
                         messages["ORDER CONFIRMATION"]
                         == "No order confirmation page found. Order Failed."
@@ -181,7 +191,10 @@ def vanguard_transaction(vanguard_o: Brokerage, orderObj: stockOrder, loop=None)
                             "Market order failed placing limit order.", loop
                         )
                         price_type = order.PriceType.LIMIT
-                        price = vg_order.get_quote(s) + 0.01
+                        price = (
+                            cached_quote(s, "last", lambda: vg_order.get_quote(s))
+                            + 0.01
+                        )
                         messages = vg_order.place_order(
                             account_id=account,
                             quantity=int(orderObj.get_amount()),
@@ -194,17 +207,15 @@ def vanguard_transaction(vanguard_o: Brokerage, orderObj: stockOrder, loop=None)
                         )
                     if orderObj.get_dry():
                         if messages["ORDER PREVIEW"] != "":
-                            pprint.pprint(messages["ORDER PREVIEW"])
+                            printAndDiscord(pprint.pformat(messages["ORDER PREVIEW"]))
+                        verified = messages["ORDER PREVIEW"] not in [
+                            "",
+                            "No order preview page found.",
+                        ]
+                        status = "Dry Run"
                         printAndDiscord(
-                            (
-                                f"{key} account {print_account}: The order verification was "
-                                + (
-                                    "successful"
-                                    if messages["ORDER PREVIEW"]
-                                    not in ["", "No order preview page found."]
-                                    else "unsuccessful"
-                                )
-                            ),
+                            f"{key} account {print_account}: The order verification was "
+                            + ("successful" if verified else "unsuccessful"),
                             loop,
                         )
                         if (
@@ -217,20 +228,17 @@ def vanguard_transaction(vanguard_o: Brokerage, orderObj: stockOrder, loop=None)
                             )
                     else:
                         if messages["ORDER CONFIRMATION"] != "":
-                            pprint.pprint(messages["ORDER CONFIRMATION"])
+                            printAndDiscord(
+                                pprint.pformat(messages["ORDER CONFIRMATION"])
+                            )
+                        verified = messages["ORDER CONFIRMATION"] not in [
+                            "",
+                            "No order confirmation page found. Order Failed.",
+                        ]
+                        status = "Success"
                         printAndDiscord(
-                            (
-                                f"{key} account {print_account}: The order verification was "
-                                + (
-                                    "successful"
-                                    if messages["ORDER CONFIRMATION"]
-                                    not in [
-                                        "",
-                                        "No order confirmation page found. Order Failed.",
-                                    ]
-                                    else "unsuccessful"
-                                )
-                            ),
+                            f"{key} account {print_account}: The order verification was "
+                            + ("successful" if verified else "unsuccessful"),
                             loop,
                         )
                         if (
@@ -241,11 +249,26 @@ def vanguard_transaction(vanguard_o: Brokerage, orderObj: stockOrder, loop=None)
                                 f"{key} account {print_account}: The order verification produced the following messages: {messages['ORDER INVALID']}",
                                 loop,
                             )
+                    if verified:
+                        emit_order(
+                            vanguard_o, key, print_account, orderObj, s, status, loop
+                        )
+                    else:
+                        emit_order_error(
+                            vanguard_o,
+                            key,
+                            print_account,
+                            orderObj,
+                            s,
+                            messages["ORDER INVALID"],
+                            loop,
+                        )
             except Exception as e:
+                emit_order_error(vanguard_o, key, print_account, orderObj, s, e, loop)
                 printAndDiscord(
                     f"{key} {print_account}: Error submitting order: {e}", loop
                 )
-                print(traceback.format_exc())
+                printAndDiscord(traceback.format_exc())
                 continue
     obj.close_browser()
     printAndDiscord(
@@ -8,27 +8,60 @@ from time import sleep
 from dotenv import load_dotenv
 from webull import webull
 
-from helperAPI import Brokerage, maskString, printAndDiscord, printHoldings, stockOrder
+from helperAPI import (
+    Brokerage,
+    cached_quotes,
+    checkpoint,
+    emit_order,
+    emit_order_error,
+    maskString,
+    parallel_login,
+    printAndDiscord,
+    printHoldings,
+    stockOrder,
+)
 
 MAX_WB_RETRIES = 3  # Number of times to retry logging in if not successful
 MAX_WB_ACCOUNTS = 11  # Different account types
 
 
-def place_order(obj: webull, account: str, orderObj: stockOrder, s: str):
+def place_order(
+    obj: webull,
+    account: str,
+    orderObj: stockOrder,
+    s: str,
+    action: str = None,
+    amount: float = None,
+):
+    # Action and amount can be overridden without touching the shared orderObj
     obj.set_account_id(account)
+    order_type = orderObj.get_price()
+    if order_type == "market":
+        order_type = "MKT"
     order = obj.place_order(
         stock=s,
-        action=orderObj.get_action().upper(),
-        orderType=orderObj.get_price().upper(),
-        quant=orderObj.get_amount(),
+        action=(action or orderObj.get_action()).upper(),
+        orderType=order_type.upper(),
+        quant=amount if amount is not None else orderObj.get_amount(),
         enforce=orderObj.get_time().upper(),
     )
     if order.get("success") is not None and not order["success"]:
-        print(f"{order['msg']} Code {order['code']}")
+        printAndDiscord(f"{order['msg']} Code {order['code']}")
         return False
     return True
 
 
+def webull_quote(obj: webull, symbol):
+    # Best ask and bid, None if there aren't any
+    quote = obj.get_quote(symbol)
+    askList = quote.get("askList", [])
+    bidList = quote.get("bidList", [])
+    return {
+        "ask": float(askList[0]["price"]) if askList != [] else None,
+        "bid": float(bidList[0]["price"]) if bidList != [] else None,
+    }
+
+
 # Initialize Webull
 def webull_init(WEBULL_EXTERNAL=None):
     # Initialize .env file
@@ -36,19 +69,21 @@ def webull_init(WEBULL_EXTERNAL=None):
     # Import Webull account
     wb_obj = Brokerage("Webull")
     if not os.getenv("WEBULL") and WEBULL_EXTERNAL is None:
-        print("Webull not found, skipping...")
+        printAndDiscord("Webull not found, skipping...")
         return None
     accounts = (
         os.environ["WEBULL"].strip().split(",")
         if WEBULL_EXTERNAL is None
         else WEBULL_EXTERNAL.strip().split(",")
     )
-    for index, account in enumerate(accounts):
-        print("Logging in to Webull...")
+
+    def login_account(index, account):
+        printAndDiscord("Logging in to Webull...")
         name = f"Webull {index + 1}"
+        login_obj = Brokerage("Webull")
         account = account.split(":")
         if len(account) != 4:
-            print(
+            printAndDiscord(
                 f"Invalid number of parameters for {name}, got {len(account)}, expected 4"
             )
             return None
@@ -65,8 +100,8 @@ def webull_init(WEBULL_EXTERNAL=None):
                     raise Exception(
                         f"Unable to log in to {name} after {i+1} tries. Check credentials."
                     )
-            wb_obj.set_logged_in_object(name, wb, "wb")
-            wb_obj.set_logged_in_object(name, account[3], "trading_pin")
+            login_obj.set_logged_in_object(name, wb, "wb")
+            login_obj.set_logged_in_object(name, account[3], "trading_pin")
             # Get all accounts
             for i in range(MAX_WB_ACCOUNTS):
                 id = wb.get_account_id(i)
@@ -74,26 +109,48 @@ def webull_init(WEBULL_EXTERNAL=None):
                     break
                 # Webull uses a different internal account ID than displayed in app
                 ac = wb.get_account(v2=True)["accountSummaryVO"]
-                wb_obj.set_account_number(name, ac["accountNumber"])
-                print(maskString(ac["accountNumber"]))
-                wb_obj.set_logged_in_object(name, id, ac["accountNumber"])
-                wb_obj.set_account_type(
+                login_obj.set_account_number(name, ac["accountNumber"])
+                printAndDiscord(maskString(ac["accountNumber"]))
+                login_obj.set_logged_in_object(name, id, ac["accountNumber"])
+                login_obj.set_account_type(
                     name, ac["accountNumber"], ac["accountTypeName"]
                 )
-                wb_obj.set_account_totals(
+                login_obj.set_account_totals(
                     name, ac["accountNumber"], ac["netLiquidationValue"]
                 )
         except Exception as e:
-            print(traceback.format_exc())
-            print(f"Error: Unable to log in to Webull: {e}")
+            printAndDiscord(traceback.format_exc())
+            printAndDiscord(f"Error: Unable to log in to Webull: {e}")
             return None
-        print("Logged in to Webull!")
+        printAndDiscord("Logged in to Webull!")
+        return login_obj
+
+    for login_obj in parallel_login(login_account, accounts, "Webull"):
+        if login_obj is None:
+            return None
+        wb_obj.merge(login_obj)
     return wb_obj
 
 
+def webull_check(wbo: Brokerage, key: str) -> bool:
+    # Check if a kept session still works
+    obj: webull = wbo.get_logged_in_objects(key, "wb")
+    return obj.get_account_id(0) is not None
+
+
+def webull_refresh(wbo: Brokerage, key: str):
+    # Update account totals of a kept session
+    obj: webull = wbo.get_logged_in_objects(key, "wb")
+    for account in wbo.get_account_numbers(key):
+        obj.set_account_id(wbo.get_logged_in_objects(key, account))
+        ac = obj.get_account(v2=True)["accountSummaryVO"]
+        wbo.set_account_totals(key, account, ac["netLiquidationValue"])
+
+
 def webull_holdings(wbo: Brokerage, loop=None):
     for key in wbo.get_account_numbers():
         for account in wbo.get_account_numbers(key):
+            checkpoint()
             obj: webull = wbo.get_logged_in_objects(key, "wb")
             internal_account = wbo.get_logged_in_objects(key, account)
             try:
@@ -120,17 +177,17 @@ def webull_holdings(wbo: Brokerage, loop=None):
                         wbo.set_holdings(key, account, sym, qty, mv)
             except Exception as e:
                 printAndDiscord(f"{key}: Error getting holdings: {e}", loop)
-                traceback.print_exc()
+                printAndDiscord(traceback.format_exc())
                 continue
     printHoldings(wbo, loop=loop)
 
 
 def webull_transaction(wbo: Brokerage, orderObj: stockOrder, loop=None):
-    print()
-    print("==============================")
-    print("Webull")
-    print("==============================")
-    print()
+    printAndDiscord("")
+    printAndDiscord("==============================")
+    printAndDiscord("Webull")
+    printAndDiscord("==============================")
+    printAndDiscord("")
     for s in orderObj.get_stocks():
         for key in wbo.get_account_numbers():
             printAndDiscord(
@@ -138,80 +195,90 @@ def webull_transaction(wbo: Brokerage, orderObj: stockOrder, loop=None):
                 loop,
             )
             for account in wbo.get_account_numbers(key):
+                checkpoint()
                 print_account = maskString(account)
                 obj: webull = wbo.get_logged_in_objects(key, "wb")
                 internal_account = wbo.get_logged_in_objects(key, account)
                 if not orderObj.get_dry():
-                    old_amount = orderObj.get_amount()
-                    original_action = orderObj.get_action()
+                    action = orderObj.get_action()
+                    amount = orderObj.get_amount()
                     try:
-                        if orderObj.get_price() == "market":
-                            orderObj.set_price("MKT")
                         # If buy stock price < $1 or $0.10,
                         # buy 100/1000 shares and sell 100/1000 - amount
-                        quote = obj.get_quote(s)
-                        askList = quote.get("askList", [])
-                        bidList = quote.get("bidList", [])
-                        if askList == [] and bidList == []:
+                        quote = cached_quotes(
+                            s, ["ask", "bid"], lambda: webull_quote(obj, s)
+                        )
+                        if quote["ask"] is None and quote["bid"] is None:
                             printAndDiscord(
                                 f"{key}: {s} is not available for trading", loop
                             )
                             raise Exception(f"{s} is not available for trading")
-                        askPrice = float(askList[0]["price"]) if askList != [] else 0
-                        bidPrice = float(bidList[0]["price"]) if bidList != [] else 0
+                        askPrice = quote["ask"] or 0
+                        bidPrice = quote["bid"] or 0
                         should_dance = False
                         # Dance if:
                         # amount < 100 and price < $1
                         # amount < 1000 and price < $0.10
-                        if (
-                            (askPrice < 1 or bidPrice < 1)
-                            and orderObj.get_amount() < 100
-                        ) or (
-                            (askPrice < 0.1 or bidPrice < 0.1)
-                            and orderObj.get_amount() < 1000
+                        if ((askPrice < 1 or bidPrice < 1) and amount < 100) or (
+                            (askPrice < 0.1 or bidPrice < 0.1) and amount < 1000
                         ):
                             should_dance = True
-                        if should_dance and orderObj.get_action() == "buy":
+                        if should_dance and action == "buy":
                             # 100 shares if < $1, 1000 shares if < $0.10
                             big_amount = (
                                 1000 if (askPrice < 0.1 or bidPrice < 0.1) else 100
                             )
-                            print(
-                                f"Buying {big_amount} then selling {big_amount - orderObj.get_amount()} of {s}"
+                            printAndDiscord(
+                                f"Buying {big_amount} then selling {big_amount - amount} of {s}"
                             )
-                            orderObj.set_amount(big_amount)
                             buy_success = place_order(
-                                obj, internal_account, orderObj, s
+                                obj, internal_account, orderObj, s, amount=big_amount
                             )
                             if not buy_success:
                                 raise Exception(f"Error buying {big_amount} of {s}")
-                            orderObj.set_amount(big_amount - old_amount)
-                            orderObj.set_action("sell")
+                            action = "sell"
+                            amount = big_amount - amount
                             sleep(1)
-                            order = place_order(obj, internal_account, orderObj, s)
+                            order = place_order(
+                                obj,
+                                internal_account,
+                                orderObj,
+                                s,
+                                action=action,
+                                amount=amount,
+                            )
                             if not order:
-                                raise Exception(
-                                    f"Error selling {big_amount - old_amount} of {s}"
-                                )
+                                raise Exception(f"Error selling {amount} of {s}")
                         else:
                             # Place normal order
                             order = place_order(obj, internal_account, orderObj, s)
                         if order:
+                            emit_order(
+                                wbo, key, print_account, orderObj, s, "Success", loop
+                            )
                             printAndDiscord(
-                                f"{key}: {orderObj.get_action()} {orderObj.get_amount()} of {s} in {print_account}: Success",
+                                f"{key}: {action} {amount} of {s} in {print_account}: Success",
+                                loop,
+                            )
+                        else:
+                            emit_order_error(
+                                wbo,
+                                key,
+                                print_account,
+                                orderObj,
+                                s,
+                                "Order failed",
                                 loop,
                             )
                     except Exception as e:
+                        emit_order_error(wbo, key, print_account, orderObj, s, e, loop)
                         printAndDiscord(
                             f"{key} {print_account}: Error placing order: {e}", loop
                         )
-                        print(traceback.format_exc())
+                        printAndDiscord(traceback.format_exc())
                         continue
-                    finally:
-                        # Restore orderObj
-                        orderObj.set_amount(old_amount)
-                        orderObj.set_action(original_action)
                 else:
+                    emit_order(wbo, key, print_account, orderObj, s, "Dry Run", loop)
                     printAndDiscord(
                         f"{key} {print_account}: Running in DRY mode. Transaction would've been: {orderObj.get_action()} {orderObj.get_amount()} of {s}",
                         loop,
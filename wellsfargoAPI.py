@@ -1,4 +1,3 @@
-import asyncio
 import datetime
 import os
 import re
@@ -20,8 +19,11 @@ from selenium.webdriver.support.wait import WebDriverWait
 from helperAPI import (
     Brokerage,
     check_if_page_loaded,
+    checkpoint,
+    emit_order,
+    emit_order_error,
     getDriver,
-    getOTPCodeDiscord,
+    getOTPCode,
     killSeleniumDriver,
     printAndDiscord,
     printHoldings,
@@ -31,16 +33,16 @@ from helperAPI import (
 
 
 def wellsfargo_error(driver: webdriver, error: str):
-    print(f"Wells Fargo Error: {error}")
+    printAndDiscord(f"Wells Fargo Error: {error}")
     driver.save_screenshot(f"wells-fargo-error-{datetime.datetime.now()}.png")
-    print(traceback.format_exc())
+    printAndDiscord(traceback.format_exc())
 
 
 def wellsfargo_init(botObj, WELLSFARGO_EXTERNAL=None, DOCKER=False, loop=None):
     load_dotenv()
 
     if not os.getenv("WELLSFARGO"):
-        print("WELLSFARGO environment variable not found.")
+        printAndDiscord("WELLSFARGO environment variable not found.")
         return None
     accounts = (
         os.environ["WELLSFARGO"].strip().split(",")
@@ -74,9 +76,11 @@ def wellsfargo_init(botObj, WELLSFARGO_EXTERNAL=None, DOCKER=False, loop=None):
                 )
                 login_button.click()
                 WebDriverWait(driver, 20).until(check_if_page_loaded)
-                print("=====================================================\n")
+                printAndDiscord(
+                    "=====================================================\n"
+                )
             except TimeoutException:
-                print("TimeoutException: Login failed.")
+                printAndDiscord("TimeoutException: Login failed.")
                 return False
             WELLSFARGO_obj.set_logged_in_object(name, driver)
             try:
@@ -96,15 +100,15 @@ def wellsfargo_init(botObj, WELLSFARGO_EXTERNAL=None, DOCKER=False, loop=None):
                     if account[2] in li.text:
                         li.click()
                         break
-                print("Clicked on phone number")
+                printAndDiscord("Clicked on phone number")
                 # Get the OTP code from the user
-                if botObj is not None and loop is not None:
-                    code = asyncio.run_coroutine_threadsafe(
-                        getOTPCodeDiscord(botObj, name, timeout=300, loop=loop),
-                        loop,
-                    ).result()
-                else:
-                    code = input("Enter security code: ")
+                code = getOTPCode(
+                    botObj,
+                    name,
+                    timeout=300,
+                    loop=loop,
+                    prompt="Enter security code: ",
+                )
                 code_input = WebDriverWait(driver, 20).until(
                     EC.presence_of_element_located((By.ID, "otp"))
                 )
@@ -174,12 +178,13 @@ def wellsfargo_holdings(WELLSFARGO_o: Brokerage, loop=None):
             )
             accounts = int(accounts - 3)  # Adjust based on actual implementation
         except TimeoutException:
-            print("Could not get to holdings")
+            printAndDiscord("Could not get to holdings")
             killSeleniumDriver(WELLSFARGO_o)
             return
 
         account_masks = WELLSFARGO_o.get_account_numbers(key)
         for account in range(accounts):
+            checkpoint()
             if account >= len(account_masks):
                 continue
             try:
@@ -203,10 +208,12 @@ def wellsfargo_holdings(WELLSFARGO_o: Brokerage, loop=None):
                     find_account, account_masks[account].replace("*", "")
                 )
                 if select_account == -1:
-                    print("Could not find the account with the specified text")
+                    printAndDiscord(
+                        "Could not find the account with the specified text"
+                    )
                     continue
             except Exception:
-                print("Could not change account")
+                printAndDiscord("Could not change account")
                 killSeleniumDriver(WELLSFARGO_o)
                 continue
 
@@ -242,11 +249,11 @@ def wellsfargo_holdings(WELLSFARGO_o: Brokerage, loop=None):
 
 
 def wellsfargo_transaction(WELLSFARGO_o: Brokerage, orderObj: stockOrder, loop=None):
-    print()
-    print("==============================")
-    print("WELLS FARGO")
-    print("==============================")
-    print()
+    printAndDiscord("")
+    printAndDiscord("==============================")
+    printAndDiscord("WELLS FARGO")
+    printAndDiscord("==============================")
+    printAndDiscord("")
 
     for key in WELLSFARGO_o.get_account_numbers():
         driver: webdriver = WELLSFARGO_o.get_logged_in_objects(key)
@@ -279,13 +286,14 @@ def wellsfargo_transaction(WELLSFARGO_o: Brokerage, orderObj: stockOrder, loop=N
             )
             accounts = int(accounts)
         except TimeoutException:
-            print("could not get to trade")
+            printAndDiscord("could not get to trade")
             killSeleniumDriver(WELLSFARGO_o)
 
         account_masks = WELLSFARGO_o.get_account_numbers(key)
         # Use to keep track of an order to know whether to reset the trading screen
         order_failed = False
         for account in range(accounts):
+            checkpoint()
             WebDriverWait(driver, 20).until(check_if_page_loaded)
             if account >= len(account_masks):
                 continue
@@ -332,11 +340,13 @@ def wellsfargo_transaction(WELLSFARGO_o: Brokerage, orderObj: stockOrder, loop=N
                 except (NoSuchElementException, ElementNotInteractableException):
                     pass
                 if select_account == -1:
-                    print("Could not find the account with the specified text")
+                    printAndDiscord(
+                        "Could not find the account with the specified text"
+                    )
                     continue
             except Exception:
-                traceback.print_exc()
-                print("Could not change account")
+                printAndDiscord(traceback.format_exc())
+                printAndDiscord("Could not change account")
                 killSeleniumDriver(WELLSFARGO_o)
             for s in orderObj.get_stocks():
                 WebDriverWait(driver, 20).until(check_if_page_loaded)
@@ -371,7 +381,7 @@ def wellsfargo_transaction(WELLSFARGO_o: Brokerage, orderObj: stockOrder, loop=N
                         EC.element_to_be_clickable((By.LINK_TEXT, "Sell"))
                     )
                 else:
-                    print("no buy or sell set")
+                    printAndDiscord("no buy or sell set")
                 action.click()
 
                 review = WebDriverWait(driver, 20).until(
@@ -443,6 +453,15 @@ def wellsfargo_transaction(WELLSFARGO_o: Brokerage, orderObj: stockOrder, loop=N
                         sleep(2)
                         submit.click()
                         # Send confirmation
+                        emit_order(
+                            WELLSFARGO_o,
+                            key,
+                            WELLSFARGO_o.get_account_numbers(key)[account],
+                            orderObj,
+                            s,
+                            "Success",
+                            loop,
+                        )
                         printAndDiscord(
                             f"{key} {WELLSFARGO_o.get_account_numbers(key)[account]}: {orderObj.get_action()} {orderObj.get_amount()} shares of {s}",
                             loop,
@@ -458,6 +477,15 @@ def wellsfargo_transaction(WELLSFARGO_o: Brokerage, orderObj: stockOrder, loop=N
                         buy_next.click()
                         order_failed = False
                     elif orderObj.get_dry():
+                        emit_order(
+                            WELLSFARGO_o,
+                            key,
+                            WELLSFARGO_o.get_account_numbers(key)[account],
+                            orderObj,
+                            s,
+                            "Dry Run",
+                            loop,
+                        )
                         printAndDiscord(
                             f"DRY: {key} account {WELLSFARGO_o.get_account_numbers(key)[account]}: {orderObj.get_action()} {orderObj.get_amount()} shares of {s}",
                             loop,
@@ -468,6 +496,15 @@ def wellsfargo_transaction(WELLSFARGO_o: Brokerage, orderObj: stockOrder, loop=N
                         By.XPATH, "//div[@class='alert-msg-summary']//p[1]"
                     ).text
                     order_failed = True
+                    emit_order_error(
+                        WELLSFARGO_o,
+                        key,
+                        WELLSFARGO_o.get_account_numbers(key)[account],
+                        orderObj,
+                        s,
+                        error_text,
+                        loop,
+                    )
                     printAndDiscord(
                         f"{key} {WELLSFARGO_o.get_account_numbers(key)[account]}: {orderObj.get_action()} {orderObj.get_amount()} shares of {s}. FAILED! \n{error_text}",
                         loop,